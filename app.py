@@ -1,10 +1,28 @@
 from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
+from werkzeug.http import http_date, parse_date
+from werkzeug.wsgi import wrap_file
 import sqlite3
 import os
+import json
+import base64
+import uuid
+import queue
+import threading
 import mimetypes
-from functools import wraps, lru_cache
-from datetime import datetime, timedelta, timezone  # 新增timezone导入
+import hashlib
+import gzip
+import zlib
+import time
+from collections import OrderedDict
+import catalog_schema
+import catalog_shards
+import media_phash
+
+try:
+    import brotli  # 可选依赖，安装后支持br压缩
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 CORS(app)
@@ -16,47 +34,569 @@ app.config.update({
     'TARGET_FOLDER': "/Volumes/STORE/",  # 基础文件目录
     'DEFAULT_PAGE_SIZE': 800,  # 默认每页记录数
     'MAX_PAGE_SIZE': 800,     # 最大每页记录数
-    'CACHE_TIMEOUT': 300      # 缓存超时时间(秒)
+    'RESPONSE_CACHE_MAX_BYTES': 64 * 1024 * 1024,  # 响应缓存的最大总大小(字节)
+    'JSON_STREAM_FLUSH_BYTES': 64 * 1024,  # 流式JSON每次输出的最小字节数
+    'GZIP_LEVEL': 6,          # gzip压缩级别
+    'STREAM_CHUNK_SIZE': 1024 * 1024,  # 无法零拷贝时每次读取的块大小(字节)
+    'MAX_RANGES': 16,         # 单个请求允许的最大Range段数，超出按整文件返回
+    'DB_POOL_SIZE': 8,        # 连接池保留的最大空闲连接数
+    'DB_CACHED_STATEMENTS': 256,  # 每个连接缓存的预编译语句数
+    'DB_MMAP_SIZE': 256 * 1024 * 1024,  # 内存映射读取的大小(字节)
+    'DB_CACHE_SIZE_KB': 64 * 1024,  # 每个连接的页缓存大小(KB)
+    # 多硬盘分片配置文件(JSON，格式见catalog_shards.py)，配置后不再使用DATABASE_PATH，
+    # 每个硬盘一个数据库，查询时ATTACH所有在线的分片联合查询
+    'CATALOG_SHARDS_FILE': None,
+    'SHARD_CHECK_INTERVAL': 10,  # 检查分片上下线的间隔(秒)
+    # 以下为异步服务(asgi_app.py)的配置
+    'ASYNC_MAX_STREAMS': 256,          # 同时进行的文件流上限
+    'ASYNC_MAX_STREAMS_PER_CLIENT': 8,  # 单个客户端(IP)同时进行的文件流上限
+    'ASYNC_STREAM_WAIT_TIMEOUT': 5,    # 文件流排队等待的最长时间(秒)，超时返回503
+    'ASYNC_CLIENT_BANDWIDTH': 0,       # 单个客户端的带宽上限(字节/秒)，0为不限
+    'ASYNC_IO_WORKERS': 32,            # 文件读取线程数
+    'ASYNC_WSGI_WORKERS': 8            # 执行JSON接口的线程数
 })
 
+# 数据库连接池
+class PooledConnection(sqlite3.Connection):
+    """记录连接打开时的分片组合代数，分片上下线后旧连接归还时直接关闭"""
+    generation = 0
+
+class SQLiteConnectionPool:
+    """
+    SQLite只读连接池
+    连接只在首次使用时打开（WAL、query_only、mmap、cache_size等PRAGMA只设置一次），
+    归还后保留在池中复用；sqlite3会在每个连接内缓存已编译的语句，
+    因此复用连接也就复用了预编译语句。
+    配置了CATALOG_SHARDS_FILE时，每个连接以内存库为main，ATTACH所有在线的分片，
+    并定期检查分片上下线（硬盘拔出/接入），变化后淘汰旧连接。
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._idle = queue.LifoQueue()  # 后进先出，优先复用缓存最热的连接
+        self._lock = threading.Lock()
+        self._schema_checked = False
+        self._shards = None        # 分片配置，首次检查时读取
+        self._online_shards = []   # 当前在线并已挂载的分片
+        self._shards_checked = None
+        self._generation = 0
+        self._stats = {
+            'created': 0,    # 新建连接数
+            'reused': 0,     # 复用连接次数
+            'closed': 0,     # 因池满或出错关闭的连接数
+            'in_use': 0,     # 当前借出的连接数
+        }
+
+    @property
+    def sharded(self):
+        return bool(self.config['CATALOG_SHARDS_FILE'])
+
+    def shards(self):
+        """全部分片配置（未使用分片时为空列表）"""
+        if not self.sharded:
+            return []
+        self._check_shards()
+        return list(self._shards or [])
+
+    def _check_shards(self):
+        """每SHARD_CHECK_INTERVAL秒检查一次分片在线状态，在线分片变化时淘汰空闲连接"""
+        now = time.monotonic()
+        with self._lock:
+            if (self._shards_checked is not None and
+                    now - self._shards_checked < self.config['SHARD_CHECK_INTERVAL']):
+                return
+            # 先更新检查时间，其他线程在本次检查期间继续使用现有连接
+            self._shards_checked = now
+            if self._shards is None:
+                self._shards = catalog_shards.load_shards(self.config['CATALOG_SHARDS_FILE'])
+            shards = self._shards
+            known = {shard['index'] for shard in self._online_shards}
+
+        # 新接入的分片先检查表结构，离线的硬盘直接跳过
+        online = [
+            shard for shard in shards
+            if catalog_shards.is_shard_online(shard) and
+            (shard['index'] in known or catalog_shards.prepare_shard(shard))
+        ]
+        with self._lock:
+            changed = [s['index'] for s in online] != [s['index'] for s in self._online_shards]
+            if changed:
+                self._online_shards = online
+                self._generation += 1
+        if changed:
+            app.logger.info(f"在线分片: {', '.join(s['name'] for s in online) or '无'}")
+            self.clear()
+
+    def _open(self):
+        """新建一个配置好的连接"""
+        with self._lock:
+            generation, online = self._generation, list(self._online_shards)
+        conn = sqlite3.connect(
+            ':memory:' if self.sharded else self.config['DATABASE_PATH'],
+            check_same_thread=False,  # 连接会在不同请求线程间流转
+            cached_statements=self.config['DB_CACHED_STATEMENTS'],
+            factory=PooledConnection
+        )
+        conn.generation = generation
+        try:
+            if self.sharded:
+                # main中的空表确定联合视图的列顺序，没有分片在线时查询的就是这些空表
+                catalog_schema.ensure_schema(conn)
+                catalog_shards.attach_shards(conn, online,
+                                             cache_size_kb=self.config['DB_CACHE_SIZE_KB'],
+                                             mmap_size=self.config['DB_MMAP_SIZE'])
+            else:
+                with self._lock:
+                    if not self._schema_checked:
+                        catalog_schema.ensure_schema(conn)
+                        # WAL模式写入数据库文件，设置一次即持久生效，读写互不阻塞
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        self._schema_checked = True
+            conn.execute("PRAGMA query_only=ON")
+            conn.execute(f"PRAGMA mmap_size={int(self.config['DB_MMAP_SIZE'])}")
+            conn.execute(f"PRAGMA cache_size=-{int(self.config['DB_CACHE_SIZE_KB'])}")
+        except sqlite3.Error:
+            conn.close()
+            raise
+        conn.row_factory = sqlite3.Row  # 使查询结果可通过列名访问
+        return conn
+
+    def acquire(self):
+        """借出一个连接"""
+        if self.sharded:
+            self._check_shards()
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            conn = self._open()
+            reused = False
+        with self._lock:
+            self._stats['reused' if reused else 'created'] += 1
+            self._stats['in_use'] += 1
+        return conn
+
+    def release(self, conn):
+        """归还连接，池已满或连接异常时直接关闭"""
+        with self._lock:
+            self._stats['in_use'] -= 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if (conn.generation == self._generation and
+                    self._idle.qsize() < self.config['DB_POOL_SIZE']):
+                self._idle.put_nowait(conn)
+                return
+        except sqlite3.Error as e:
+            app.logger.warning(f"连接归还失败，将关闭: {str(e)}")
+        conn.close()
+        with self._lock:
+            self._stats['closed'] += 1
+
+    def clear(self):
+        """关闭所有空闲连接（如数据库文件被替换后）"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._stats['closed'] += 1
+
+    def stats(self):
+        """返回连接池统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['idle'] = self._idle.qsize()
+        stats['pool_size'] = self.config['DB_POOL_SIZE']
+        if self.sharded:
+            shards = self.shards()
+            online = {shard['index'] for shard in self._online_shards}
+            stats['shards'] = [
+                {'name': shard['name'], 'root': shard['root'], 'online': shard['index'] in online}
+                for shard in shards
+            ]
+        return stats
+
+db_pool = SQLiteConnectionPool(app.config)
+
 # 数据库连接工具函数
 def get_db_connection():
-    """创建数据库连接并返回连接和游标"""
-    conn = sqlite3.connect(app.config['DATABASE_PATH'])
-    conn.row_factory = sqlite3.Row  # 使查询结果可通过列名访问
+    """从连接池获取数据库连接并返回连接和游标"""
+    conn = db_pool.acquire()
     return conn, conn.cursor()
 
 def close_db_connection(conn):
-    """关闭数据库连接"""
+    """将数据库连接归还连接池"""
     if conn:
         try:
-            conn.close()
+            db_pool.release(conn)
         except Exception as e:
-            app.logger.error(f"关闭数据库连接失败: {str(e)}")
-
-# 缓存装饰器 - 带超时功能
-def timed_lru_cache(seconds: int, maxsize: int = 128):
-    """带超时的LRU缓存装饰器"""
-    def wrapper_cache(func):
-        func = lru_cache(maxsize=maxsize)(func)
-        func.lifetime = timedelta(seconds=seconds)
-        func.expiration = datetime.now(timezone.utc) + func.lifetime
-
-        @wraps(func)
-        def wrapped_func(*args, **kwargs):
-            if datetime.now(timezone.utc) >= func.expiration:
-                func.cache_clear()
-                func.expiration = datetime.now(timezone.utc) + func.lifetime
-            return func(*args, **kwargs)
-        return wrapped_func
-    return wrapper_cache
+            app.logger.error(f"归还数据库连接失败: {str(e)}")
+
+# 响应缓存 - 以目录版本号为键
+class CatalogResponseCache:
+    """
+    按目录版本号失效的JSON响应缓存
+    缓存的是序列化后的响应体，命中时无需重新查询和序列化；
+    目录版本号变化（导入、生成海报等写入）后旧条目自动失效，
+    总大小超过max_bytes时按LRU淘汰。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (version, body)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key, version):
+        """返回指定版本的缓存响应体，不存在或已过期时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def put(self, key, version, body):
+        """写入缓存，并按LRU淘汰超出容量的条目"""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._entries[key] = (version, body)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries),
+                        size_bytes=self._size, max_bytes=self.max_bytes)
+
+response_cache = CatalogResponseCache(app.config['RESPONSE_CACHE_MAX_BYTES'])
+
+class CatalogUnavailableError(Exception):
+    """数据库暂时无法查询（如被导入锁定），接口返回503，结果不缓存"""
+
+def get_catalog_version():
+    """读取当前目录版本号"""
+    conn = None
+    try:
+        conn, _ = get_db_connection()
+        return catalog_schema.get_catalog_version(conn)
+    except sqlite3.Error as e:
+        app.logger.error(f"读取目录版本号错误: {str(e)}")
+        raise CatalogUnavailableError("数据库暂时不可用，请稍后重试") from e
+    finally:
+        close_db_connection(conn)
+
+def versioned_json_response(cache_key, builder, stream_builder=None, ndjson=False):
+    """
+    返回带强ETag的JSON响应
+    ETag由目录版本号、请求参数和压缩方式决定，客户端携带匹配的If-None-Match时直接返回304；
+    否则优先使用缓存的（已压缩的）响应体，未命中才调用builder查询并序列化
+    :param cache_key: 可哈希的缓存键（接口名和查询参数）
+    :param builder: 无参函数，返回要序列化的数据；查询失败时应抛出CatalogUnavailableError（不会被缓存）
+    :param stream_builder: 可选，无参函数，返回JSON文本片段迭代器；提供时不走缓存，
+                           直接从数据库游标流式输出
+    :param ndjson: 流式输出是否为NDJSON格式
+    """
+    version = get_catalog_version()
+    encoding = negotiate_encoding()
+    key_digest = hashlib.sha1(repr(cache_key).encode('utf-8')).hexdigest()[:16]
+    etag = f'"{version:x}-{key_digest}{"-" + encoding if encoding else ""}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+
+    if_none_match = request.headers.get('If-None-Match', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')]:
+        headers.pop('Content-Encoding', None)
+        return Response(status=304, headers=headers)
+
+    if stream_builder is not None:
+        mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+        return Response(iter_encoded(stream_builder(), encoding),
+                        mimetype=mimetype, headers=headers)
+
+    body = response_cache.get((cache_key, encoding), version)
+    if body is None:
+        body = compress_body(app.json.dumps(builder()).encode('utf-8'), encoding)
+        response_cache.put((cache_key, encoding), version, body)
+    return Response(body, mimetype='application/json', headers=headers)
+
+# 游标分页工具函数
+def encode_page_cursor(row):
+    """将一页最后一行的(parent_folder, created_time, media_id)编码为不透明游标"""
+    raw = json.dumps(
+        [row['parent_folder'], row['created_time'], row['media_id']],
+        ensure_ascii=False
+    )
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_page_cursor(cursor_token):
+    """
+    解析游标
+    :return: (parent_folder, created_time, media_id)
+    :raises ValueError: 游标格式无效
+    """
+    try:
+        padded = cursor_token + '=' * (-len(cursor_token) % 4)
+        parent_folder, created_time, media_id = json.loads(
+            base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        )
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"无效的游标: {cursor_token}") from e
+    if not isinstance(media_id, int):
+        raise ValueError(f"无效的游标: {cursor_token}")
+    return parent_folder, created_time, media_id
+
+# 查询构造工具函数
+FILE_COLUMNS = """
+        SELECT media_id, file_name, file_path, file_type, group_code, parent_folder, 
+               file_size, created_time, modified_time, poster_path,
+               duration, width, height, codec, bitrate, orientation 
+        FROM media_data 
+        """
+
+# 按媒体信息筛选的参数：参数名 -> (列名, 比较运算符, 类型转换)
+# 时长和分辨率筛选可走idx_kind_height_duration/idx_kind_duration
+MEDIA_FILTERS = {
+    'min_duration': ('duration', '>=', float),
+    'max_duration': ('duration', '<=', float),
+    'min_height': ('height', '>=', int),
+    'max_height': ('height', '<=', int),
+    'min_width': ('width', '>=', int),
+    'codec': ('codec', '=', str),
+}
+
+def parse_media_filters(args):
+    """
+    从请求参数中解析媒体信息筛选条件
+    :return: {参数名: 值}，没有筛选条件时为空字典
+    :raises ValueError: 参数值无法转换
+    """
+    media_filters = {}
+    for name, (_, _, convert) in MEDIA_FILTERS.items():
+        value = args.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            media_filters[name] = convert(value)
+        except ValueError:
+            raise ValueError(f"参数{name}的值无效: {value}")
+    return media_filters
+
+def build_filters(file_type=None, group_code=None, media_filters=None):
+    """
+    根据类型、分组和媒体信息构造WHERE筛选条件
+    :param media_filters: 可选，parse_media_filters的返回值
+    :return: (以" AND"开头的条件字符串, 参数列表)
+    """
+    filters = ""
+    params = []
+    
+    # 添加类型筛选条件（media_kind由导入时写入，可直接走复合索引）
+    if file_type in ('video', 'image'):
+        filters += " AND media_kind = ?"
+        params.append(file_type)
+    
+    # 添加分组筛选条件
+    if group_code:
+        filters += " AND group_code = ?"
+        params.append(group_code)
+    
+    # 添加时长、分辨率、编码筛选条件
+    for name, value in sorted((media_filters or {}).items()):
+        column, operator, _ = MEDIA_FILTERS[name]
+        filters += f" AND {column} {operator} ?"
+        params.append(value)
+    return filters, params
+
+def count_files(conn, file_type=None, group_code=None, media_filters=None):
+    """
+    统计符合条件的文件数：只按类型/分组筛选时读取media_counts汇总表，
+    带媒体信息筛选时在索引上计数
+    """
+    if not media_filters:
+        return catalog_schema.count_media(conn, file_type, group_code)
+    filters, params = build_filters(file_type, group_code, media_filters)
+    return conn.execute(*build_count_query(filters, params, catalog_shards.attached_shards(conn))
+                        ).fetchone()[0]
+
+def build_count_query(filters, params, shards=None):
+    """
+    构造按条件计数的查询
+    使用分片时各分片分别计数再求和（联合视图上的聚合查询不会把WHERE条件下推到各分片，只能全表扫描）
+    :return: (SQL, 参数列表)
+    """
+    if not shards:
+        return "SELECT COUNT(*) FROM media_data WHERE 1=1" + filters, params
+    arms = [f"SELECT COUNT(*) AS n FROM {schema}.media_data WHERE 1=1" + filters
+            for _, schema in shards]
+    return "SELECT IFNULL(SUM(n), 0) FROM (" + " UNION ALL ".join(arms) + ")", params * len(shards)
+
+def normalize_pagination(page, page_size):
+    """校正页码和每页记录数"""
+    if page < 1:
+        page = 1
+    if page_size < 1 or page_size > app.config['MAX_PAGE_SIZE']:
+        page_size = app.config['DEFAULT_PAGE_SIZE']
+    return page, page_size
+
+def build_files_page_query(filters, params, page, page_size, after=None, shards=None):
+    """
+    构造一页文件数据的查询（多取一行用于判断has_more）
+    :param after: 可选，解码后的游标(parent_folder, created_time, media_id)
+    :param shards: 可选，连接上挂载的分片[(分片序号, 库名)]，提供时按分片合并查询
+    :return: (SQL, 参数列表)
+    """
+    if shards:
+        return build_sharded_files_page_query(filters, params, page, page_size, after, shards)
+    if after is None:
+        # 页码分页：排序和LIMIT/OFFSET
+        offset = (page - 1) * page_size
+        query = (
+            FILE_COLUMNS + "WHERE 1=1" + filters +
+            " ORDER BY parent_folder, created_time DESC, media_id DESC LIMIT ? OFFSET ?"
+        )
+        return query, params + [page_size + 1, offset]
+
+    # 游标分页：按游标之后的几段依次取行，每段都能直接在idx_folder_created_id上定位起点，
+    # UNION ALL按顺序惰性求值，凑满page_size即停止，代价与翻页深度无关
+    arms, query_params = [], []
+    for where, arm_params, order in build_cursor_arms(after):
+        arms.append("SELECT * FROM (" + FILE_COLUMNS + "WHERE " + where + filters + order + " LIMIT ?)")
+        query_params += arm_params + params + [page_size + 1]
+    return " UNION ALL ".join(arms) + " LIMIT ?", query_params + [page_size + 1]
+
+def build_cursor_arms(after, alias=''):
+    """
+    把排序在游标之后的行按排序顺序分为几段：同一文件夹内游标之后的行、
+    同一文件夹内created_time为NULL的行（降序时NULL排在最后）、后续文件夹的行
+    parent_folder和created_time都可能为NULL（升序时NULL在前），与NULL比较的条件恒不成立，
+    因此按游标值是否为NULL选择不同的条件，含NULL的行同样能翻到
+    :param after: 游标(parent_folder, created_time, media_id)，media_id为该库内的id
+    :param alias: 列名前缀，如 'd.'
+    :return: [(WHERE条件, 参数列表, 段内ORDER BY)]
+    """
+    after_folder, after_created, after_id = after
+    p = alias
+    arms = []
+    if after_created is not None:
+        arms.append((f"{p}parent_folder IS ? AND ({p}created_time, {p}media_id) < (?, ?)",
+                     [after_folder, after_created, after_id],
+                     f" ORDER BY {p}created_time DESC, {p}media_id DESC"))
+        arms.append((f"{p}parent_folder IS ? AND {p}created_time IS NULL",
+                     [after_folder], f" ORDER BY {p}media_id DESC"))
+    else:
+        arms.append((f"{p}parent_folder IS ? AND {p}created_time IS NULL AND {p}media_id < ?",
+                     [after_folder, after_id], f" ORDER BY {p}media_id DESC"))
+    later_folders = f" ORDER BY {p}parent_folder, {p}created_time DESC, {p}media_id DESC"
+    if after_folder is not None:
+        arms.append((f"{p}parent_folder > ?", [after_folder], later_folders))
+    else:
+        arms.append((f"{p}parent_folder IS NOT NULL", [], later_folders))
+    return arms
+
+# 跨分片查询
+FILES_ORDER = " ORDER BY parent_folder, created_time DESC, media_id DESC"
+SHARD_FILES_ORDER = " ORDER BY d.parent_folder, d.created_time DESC, d.media_id DESC"
+
+def shard_columns(index):
+    """分片内查询的列，media_id换算为全局id（FROM子句中media_data的别名须为d）"""
+    return SEARCH_COLUMNS.replace(
+        "d.media_id,", f"d.media_id * {catalog_shards.SHARD_ID_STRIDE} + {index} AS media_id,", 1
+    )
+
+def build_sharded_files_page_query(filters, params, page, page_size, after, shards):
+    """
+    跨分片的一页文件数据：每个分片各自走索引取排序后的前N行，再合并排序取一页
+    （联合视图无法把ORDER BY/LIMIT下推到各分片，整表排序的代价与数据量成正比）
+    :return: (SQL, 参数列表)
+    """
+    arms, query_params = [], []
+    if after is None:
+        offset = (page - 1) * page_size
+        for index, schema in shards:
+            arms.append(
+                "SELECT * FROM (" + shard_columns(index) + f"FROM {schema}.media_data d "
+                "WHERE 1=1" + filters + SHARD_FILES_ORDER + " LIMIT ?)"
+            )
+            query_params += params + [offset + page_size + 1]
+        query = " UNION ALL ".join(arms) + FILES_ORDER + " LIMIT ? OFFSET ?"
+        return query, query_params + [page_size + 1, offset]
+
+    # 游标中的media_id是全局id，换算为各分片内的上界后与单库时一样分段定位
+    after_folder, after_created, after_id = after
+    for index, schema in shards:
+        local_after = (after_folder, after_created, catalog_shards.to_local_id(after_id, index))
+        for where, arm_params, order in build_cursor_arms(local_after, 'd.'):
+            arms.append(
+                "SELECT * FROM (" + shard_columns(index) + f"FROM {schema}.media_data d "
+                "WHERE " + where + filters + order + " LIMIT ?)"
+            )
+            query_params += arm_params + params + [page_size + 1]
+    query = " UNION ALL ".join(arms) + FILES_ORDER + " LIMIT ?"
+    return query, query_params + [page_size + 1]
+
+def file_row_to_dict(row):
+    """将media_data查询行转换为接口返回的文件信息"""
+    return {
+        'name': row['file_name'],
+        'path': row['file_path'],
+        'type': 'video' if row['file_type'].startswith('video/') else 'image',
+        'ext': os.path.splitext(row['file_name'])[1].lower(),
+        'size': row['file_size'],
+        'created_time': row['created_time'],
+        'modified_time': row['modified_time'],
+        'group_code': row['group_code'],
+        'parent_folder': row['parent_folder'],
+        'poster_path': row['poster_path'],
+        'duration': row['duration'],
+        'width': row['width'],
+        'height': row['height'],
+        'codec': row['codec'],
+        'bitrate': row['bitrate'],
+        'orientation': row['orientation']
+    }
+
+def make_pagination(page, page_size, total, has_more, last_row):
+    """构造分页信息"""
+    return {
+        'page': page,
+        'page_size': page_size,
+        'total': total,
+        'total_pages': (total + page_size - 1) // page_size if total is not None else None,
+        'has_more': has_more,
+        'next_cursor': encode_page_cursor(last_row) if has_more else None
+    }
 
 # 数据库查询函数 - 带分页支持
 def get_files_from_db(
     file_type=None, 
     group_code=None, 
     page=1, 
-    page_size=app.config['DEFAULT_PAGE_SIZE']
+    page_size=app.config['DEFAULT_PAGE_SIZE'],
+    cursor_token=None,
+    with_total=True,
+    media_filters=None
 ):
     """
     从数据库查询文件信息（支持分页）
@@ -64,167 +604,439 @@ def get_files_from_db(
     :param group_code: 可选，按group_code筛选
     :param page: 页码，从1开始
     :param page_size: 每页记录数
+    :param cursor_token: 可选，上一页返回的next_cursor；提供时按游标分页，
+                         不再使用OFFSET，任意深度的翻页代价相同
+    :param with_total: 是否返回精确总数；为False时total/total_pages为None，
+                       只通过has_more判断是否还有下一页
+    :param media_filters: 可选，按时长、分辨率、编码筛选（见MEDIA_FILTERS）
     :return: 分页文件数据和总记录数
+    :raises ValueError: 游标格式无效
     """
-    # 验证分页参数
-    if page < 1:
-        page = 1
-    if page_size < 1 or page_size > app.config['MAX_PAGE_SIZE']:
-        page_size = app.config['DEFAULT_PAGE_SIZE']
-    
-    # 计算偏移量
-    offset = (page - 1) * page_size
+    page, page_size = normalize_pagination(page, page_size)
+    after = decode_page_cursor(cursor_token) if cursor_token else None
+    filters, params = build_filters(file_type, group_code, media_filters)
     
     conn, cursor = None, None
     try:
         conn, cursor = get_db_connection()
         
-        # 基础查询SQL和计数SQL
-        base_query = """
-        SELECT file_name, file_path, file_type, group_code, parent_folder, 
-               file_size, created_time, modified_time, poster_path 
-        FROM media_data 
-        WHERE 1=1
-        """
-        count_query = "SELECT COUNT(*) as total FROM media_data WHERE 1=1"
-        params = []
-        
-        # 添加类型筛选条件
-        if file_type == 'video':
-            base_query += " AND file_type LIKE 'video/%'"
-            count_query += " AND file_type LIKE 'video/%'"
-        elif file_type == 'image':
-            base_query += " AND file_type LIKE 'image/%'"
-            count_query += " AND file_type LIKE 'image/%'"
-        
-        # 添加分组筛选条件
-        if group_code:
-            base_query += " AND group_code = ?"
-            count_query += " AND group_code = ?"
-            params.append(group_code)
-        
-        # 执行计数查询
-        cursor.execute(count_query, params.copy())
-        total = cursor.fetchone()['total']
-        
-        # 添加排序和分页
-        base_query += " ORDER BY parent_folder, created_time DESC LIMIT ? OFFSET ?"
-        params.extend([page_size, offset])
+        # 总数优先读取由触发器维护的media_counts汇总表
+        total = count_files(conn, file_type, group_code, media_filters) if with_total else None
         
         # 执行数据查询
-        cursor.execute(base_query, params)
+        cursor.execute(*build_files_page_query(filters, params, page, page_size, after,
+                                               catalog_shards.attached_shards(conn)))
         rows = cursor.fetchall()
-        print(f"数据库数据：{rows[0]['poster_path']}")
-        # 整理数据
-        files_data = []
-        for row in rows:
-            file_ext = os.path.splitext(row['file_name'])[1].lower()
-            files_data.append({
-                'name': row['file_name'],
-                'path': row['file_path'],
-                'type': 'video' if row['file_type'].startswith('video/') else 'image',
-                'ext': file_ext,
-                'size': row['file_size'],
-                'created_time': row['created_time'],
-                'modified_time': row['modified_time'],
-                'group_code': row['group_code'],
-                'parent_folder': row['parent_folder'],
-                'poster_path': row['poster_path']
-            })
-        
-        # 计算总页数
-        total_pages = (total + page_size - 1) // page_size
+        # 多取的一行只用于判断是否还有下一页
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
         
         return {
-            'data': files_data,
-            'pagination': {
-                'page': page,
-                'page_size': page_size,
-                'total': total,
-                'total_pages': total_pages
-            }
+            'data': [file_row_to_dict(row) for row in rows],
+            'pagination': make_pagination(page, page_size, total, has_more,
+                                          rows[-1] if rows else None)
         }
         
     except sqlite3.Error as e:
         app.logger.error(f"数据库查询错误: {str(e)}")
-        return {
-            'data': [],
-            'pagination': {
-                'page': page,
-                'page_size': page_size,
-                'total': 0,
-                'total_pages': 0
-            }
-        }
+        raise CatalogUnavailableError("数据库暂时不可用，请稍后重试") from e
     finally:
         close_db_connection(conn)
 
 # 按文件夹分组的查询（用于需要按文件夹浏览的场景）
-@timed_lru_cache(seconds=app.config['CACHE_TIMEOUT'])
+FOLDER_FILES_ORDER = " ORDER BY parent_folder, created_time DESC"
+
+def iter_folder_groups(rows):
+    """
+    将按parent_folder排序的行逐个文件夹组装为文件夹信息
+    每次只在内存中保留一个文件夹的文件列表
+    """
+    current = None
+    for row in rows:
+        folder = row['parent_folder']
+        if current is None or current['folder'] != folder:
+            if current is not None:
+                yield current
+            current = {
+                'folder': folder,
+                'file_count': 0,
+                'files': []
+            }
+        
+        file_ext = os.path.splitext(row['file_name'])[1].lower()
+        current['files'].append({
+            'name': row['file_name'],
+            'path': row['file_path'],
+            'type': 'video' if row['file_type'].startswith('video/') else 'image',
+            'ext': file_ext,
+            'size': row['file_size'],
+        })
+
+        if row['file_type'].startswith('video/'):
+            current['poster_path'] = row['poster_path']
+        else:
+            current['poster_path'] = row['file_path']
+            
+        current['poster_path'] = row['file_path']
+        current['file_count'] += 1
+    if current is not None:
+        yield current
+
 def get_files_by_folder_from_db(file_type=None, group_code=None):
     """按文件夹分组查询文件（不带分页，用于文件夹列表展示）"""
+    filters, params = build_filters(file_type, group_code)
     conn, cursor = None, None
     try:
         conn, cursor = get_db_connection()
+        cursor.execute(FILE_COLUMNS + "WHERE 1=1" + filters + FOLDER_FILES_ORDER, params)
+        return list(iter_folder_groups(cursor))
         
-        query = """
-        SELECT file_name, file_path, file_type, group_code, parent_folder, 
-               file_size, created_time, modified_time, poster_path
+    except sqlite3.Error as e:
+        app.logger.error(f"按文件夹查询错误: {str(e)}")
+        raise CatalogUnavailableError("数据库暂时不可用，请稍后重试") from e
+    finally:
+        close_db_connection(conn)
+
+# 按文件夹汇总的查询（只返回统计信息，由SQLite完成聚合）
+# 代表海报：优先使用视频封面，没有视频封面时取创建时间最新的图片
+# （图片按 "created_time\x01file_path" 取最大值，再去掉时间前缀；created_time为 YYYY-MM-DD HH:MM:SS 文本）
+NEWEST_IMAGE_KEY = "MAX(CASE WHEN media_kind = 'image' THEN IFNULL(created_time, '') || char(1) || file_path END)"
+
+def strip_image_key(expr):
+    """从 "created_time\x01file_path" 中取出file_path"""
+    return f"substr({expr}, instr({expr}, char(1)) + 1)"
+
+FOLDER_SUMMARY_COLUMNS = """
+        SELECT parent_folder,
+               MAX(group_code) AS group_code,
+               COUNT(*) AS file_count,
+               IFNULL(SUM(file_size), 0) AS total_size,
+               MAX(created_time) AS latest_time,
+               COALESCE(
+                   MAX(CASE WHEN media_kind = 'video' THEN NULLIF(poster_path, '') END),
+                   """ + strip_image_key(NEWEST_IMAGE_KEY) + """
+               ) AS poster_path
         FROM media_data 
-        WHERE 1=1
         """
-        params = []
-        
-        if file_type == 'video':
-            query += " AND file_type LIKE 'video/%'"
-        elif file_type == 'image':
-            query += " AND file_type LIKE 'image/%'"
-        
-        if group_code:
-            query += " AND group_code = ?"
-            params.append(group_code)
-            
-        query += " ORDER BY parent_folder, created_time DESC"
+FOLDER_SUMMARY_GROUP_BY = " GROUP BY parent_folder ORDER BY parent_folder"
+
+# 使用分片时先在各分片内按文件夹汇总，再合并同名文件夹
+SHARD_FOLDER_SUMMARY_COLUMNS = """
+        SELECT parent_folder,
+               MAX(group_code) AS group_code,
+               COUNT(*) AS file_count,
+               IFNULL(SUM(file_size), 0) AS total_size,
+               MAX(created_time) AS latest_time,
+               MAX(CASE WHEN media_kind = 'video' THEN NULLIF(poster_path, '') END) AS video_poster,
+               """ + NEWEST_IMAGE_KEY + """ AS image_poster
+        FROM {schema}.media_data 
+        """
+MERGED_FOLDER_SUMMARY_COLUMNS = """
+        SELECT parent_folder,
+               MAX(group_code) AS group_code,
+               SUM(file_count) AS file_count,
+               SUM(total_size) AS total_size,
+               MAX(latest_time) AS latest_time,
+               COALESCE(MAX(video_poster), """ + strip_image_key("MAX(image_poster)") + """) AS poster_path
+        FROM 
+        """
+
+def build_folder_summary_query(filters, params, shards=None):
+    """
+    构造按文件夹汇总的查询
+    :param shards: 可选，连接上挂载的分片，提供时先在各分片内汇总再合并
+    :return: (SQL, 参数列表)
+    """
+    if not shards:
+        return FOLDER_SUMMARY_COLUMNS + "WHERE 1=1" + filters + FOLDER_SUMMARY_GROUP_BY, params
+    arms = [
+        SHARD_FOLDER_SUMMARY_COLUMNS.format(schema=schema) + "WHERE 1=1" + filters +
+        " GROUP BY parent_folder"
+        for _, schema in shards
+    ]
+    query = (MERGED_FOLDER_SUMMARY_COLUMNS + "(" + " UNION ALL ".join(arms) + ")" +
+             FOLDER_SUMMARY_GROUP_BY)
+    return query, params * len(shards)
+
+def folder_summary_to_dict(row):
+    """将文件夹汇总查询行转换为接口返回的文件夹信息"""
+    return {
+        'folder': row['parent_folder'],
+        'group_code': row['group_code'],
+        'file_count': row['file_count'],
+        'total_size': row['total_size'],
+        'latest_time': row['latest_time'],
+        'poster_path': row['poster_path'],
+    }
+
+def get_folder_summaries_from_db(file_type=None, group_code=None):
+    """
+    按文件夹汇总文件数、总大小、最新时间和代表海报（不返回文件列表）
+    文件列表通过 /api/folders/<group_code>/files 按需分页加载
+    """
+    filters, params = build_filters(file_type, group_code)
+    conn, cursor = None, None
+    try:
+        conn, cursor = get_db_connection()
+        cursor.execute(*build_folder_summary_query(filters, params,
+                                                   catalog_shards.attached_shards(conn)))
+        return [folder_summary_to_dict(row) for row in cursor]
         
-        cursor.execute(query, params)
+    except sqlite3.Error as e:
+        app.logger.error(f"按文件夹汇总查询错误: {str(e)}")
+        raise CatalogUnavailableError("数据库暂时不可用，请稍后重试") from e
+    finally:
+        close_db_connection(conn)
+
+# 文件名/文件夹检索
+SEARCH_COLUMNS = """
+        SELECT d.media_id, d.file_name, d.file_path, d.file_type, d.group_code, d.parent_folder, 
+               d.file_size, d.created_time, d.modified_time, d.poster_path,
+               d.duration, d.width, d.height, d.codec, d.bitrate, d.orientation 
+        """
+
+def escape_like(term):
+    """转义LIKE通配符"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_files_from_db(keywords, file_type=None, group_code=None, page=1,
+                         page_size=app.config['DEFAULT_PAGE_SIZE'], media_filters=None):
+    """
+    按文件名和父文件夹检索文件，结果按相关度排序（文件名命中权重高于文件夹）
+    关键词按空白拆分、全部命中才返回；不少于3个字符的关键词走FTS5 trigram索引，
+    更短的关键词（如两个汉字）只能做子串扫描，仅用于在索引命中结果中进一步过滤
+    :raises RuntimeError: 数据库不支持全文检索
+    """
+    page, page_size = normalize_pagination(page, page_size)
+    offset = (page - 1) * page_size
+    terms = keywords.split()
+    indexed_terms = [term for term in terms if len(term) >= 3]
+    short_terms = [term for term in terms if len(term) < 3]
+    filters, params = build_filters(file_type, group_code, media_filters)
+
+    conn, cursor = None, None
+    try:
+        conn, cursor = get_db_connection()
+        if not catalog_schema.table_exists(conn, 'media_search'):
+            raise RuntimeError("当前SQLite不支持FTS5 trigram全文检索")
+
+        short_filters = ""
+        short_params = []
+        for term in short_terms:
+            short_filters += " AND (d.file_name LIKE ? ESCAPE '\\' OR d.parent_folder LIKE ? ESCAPE '\\')"
+            pattern = f"%{escape_like(term)}%"
+            short_params.extend([pattern, pattern])
+
+        shards = catalog_shards.attached_shards(conn)
+        if indexed_terms:
+            # 每个关键词作为一个短语，多个短语之间为AND
+            match = ' '.join('"' + term.replace('"', '""') + '"' for term in indexed_terms)
+        if indexed_terms and shards:
+            # 全文索引在各分片内，分别检索后按相关度合并
+            # （bm25的词频统计各分片独立，不同分片之间的得分只是近似可比）
+            arms, query_params = [], []
+            for index, schema in shards:
+                arms.append(
+                    "SELECT * FROM (" + shard_columns(index) +
+                    ", bm25(media_search, 10.0, 1.0) AS score "
+                    f"FROM {schema}.media_search s JOIN {schema}.media_data d ON d.media_id = s.rowid "
+                    "WHERE media_search MATCH ?" + filters + short_filters +
+                    " ORDER BY score LIMIT ?)"
+                )
+                query_params += [match] + params + short_params + [offset + page_size + 1]
+            query = " UNION ALL ".join(arms) + " ORDER BY score, media_id DESC LIMIT ? OFFSET ?"
+            query_params += [page_size + 1, offset]
+        elif indexed_terms:
+            query = (
+                SEARCH_COLUMNS +
+                "FROM media_search JOIN media_data d ON d.media_id = media_search.rowid "
+                "WHERE media_search MATCH ?" + filters + short_filters +
+                " ORDER BY bm25(media_search, 10.0, 1.0), d.media_id DESC LIMIT ? OFFSET ?"
+            )
+            query_params = [match] + params + short_params + [page_size + 1, offset]
+        else:
+            query = (
+                SEARCH_COLUMNS + "FROM media_data d WHERE 1=1" + filters + short_filters +
+                " ORDER BY d.created_time DESC, d.media_id DESC LIMIT ? OFFSET ?"
+            )
+            query_params = params + short_params + [page_size + 1, offset]
+
+        cursor.execute(query, query_params)
         rows = cursor.fetchall()
-        
-        # 按文件夹分组
-        folders_data = {}
-        for row in rows:
-            folder = row['parent_folder']
-            if folder not in folders_data:
-                folders_data[folder] = {
-                    'folder': folder,
-                    'file_count': 0,
-                    'files': []
-                }
-            
-            file_ext = os.path.splitext(row['file_name'])[1].lower()
-            folders_data[folder]['files'].append({
-                'name': row['file_name'],
-                'path': row['file_path'],
-                'type': 'video' if row['file_type'].startswith('video/') else 'image',
-                'ext': file_ext,
-                'size': row['file_size'],
-            })
-
-            if row['file_type'].startswith('video/'):
-                folders_data[folder]['poster_path'] = row['poster_path']
-            else:
-                folders_data[folder]['poster_path'] = row['file_path']
-                
-            folders_data[folder]['poster_path'] = row['file_path']
-            folders_data[folder]['file_count'] += 1
-        
-        return list(folders_data.values())
-        
+        return {
+            'data': [file_row_to_dict(row) for row in rows[:page_size]],
+            'pagination': {
+                'page': page,
+                'page_size': page_size,
+                'has_more': len(rows) > page_size
+            }
+        }
+
     except sqlite3.Error as e:
-        app.logger.error(f"按文件夹查询错误: {str(e)}")
-        return []
+        app.logger.error(f"检索错误: {str(e)}")
+        raise CatalogUnavailableError("数据库暂时不可用，请稍后重试") from e
+    finally:
+        close_db_connection(conn)
+
+# 流式JSON输出
+def iter_json_document(records, tail, ndjson=False):
+    """
+    逐条序列化记录，生成JSON文本片段
+    JSON模式输出 {"data": [...], <tail中的字段>}，与jsonify的键排序一致；
+    NDJSON模式每行一条记录，最后一行为tail对象
+    :param records: 记录迭代器
+    :param tail: 无参函数，在记录输出完毕后调用，返回附加字段字典
+    """
+    dumps = app.json.dumps
+    if ndjson:
+        for record in records:
+            yield dumps(record) + "\n"
+        yield dumps(tail()) + "\n"
+        return
+
+    yield '{"data": ['
+    first = True
+    for record in records:
+        yield dumps(record) if first else ", " + dumps(record)
+        first = False
+    yield "]"
+    extra = tail()
+    for key in sorted(extra):
+        yield f", {dumps(key)}: {dumps(extra[key])}"
+    yield "}"
+
+def iter_files_document(file_type, group_code, page, page_size, after, with_total, ndjson,
+                        media_filters=None):
+    """直接从sqlite游标流式输出一页文件数据"""
+    filters, params = build_filters(file_type, group_code, media_filters)
+    conn, cursor = None, None
+    state = {'total': None, 'has_more': False, 'last_row': None}
+
+    def records():
+        count = 0
+        for row in cursor:
+            if count == page_size:
+                state['has_more'] = True
+                break
+            state['last_row'] = row
+            count += 1
+            yield file_row_to_dict(row)
+
+    def tail():
+        return {'pagination': make_pagination(page, page_size, state['total'],
+                                              state['has_more'], state['last_row'])}
+
+    try:
+        conn, cursor = get_db_connection()
+        if with_total:
+            state['total'] = count_files(conn, file_type, group_code, media_filters)
+        cursor.execute(*build_files_page_query(filters, params, page, page_size, after,
+                                               catalog_shards.attached_shards(conn)))
+        yield from iter_json_document(records(), tail, ndjson)
     finally:
         close_db_connection(conn)
 
+def iter_folders_document(file_type, group_code, summary, ndjson):
+    """直接从sqlite游标流式输出文件夹列表"""
+    filters, params = build_filters(file_type, group_code)
+    conn, cursor = None, None
+    totals = {'total_folders': 0, 'total_files': 0}
+
+    def records():
+        if summary:
+            folders = (folder_summary_to_dict(row) for row in cursor)
+        else:
+            folders = iter_folder_groups(cursor)
+        for folder in folders:
+            totals['total_folders'] += 1
+            totals['total_files'] += folder['file_count']
+            yield folder
+
+    try:
+        conn, cursor = get_db_connection()
+        if summary:
+            cursor.execute(*build_folder_summary_query(filters, params,
+                                                       catalog_shards.attached_shards(conn)))
+        else:
+            cursor.execute(FILE_COLUMNS + "WHERE 1=1" + filters + FOLDER_FILES_ORDER, params)
+        yield from iter_json_document(records(), lambda: dict(totals), ndjson)
+    finally:
+        close_db_connection(conn)
+
+def negotiate_encoding():
+    """根据Accept-Encoding选择压缩方式：br(需安装brotli) > gzip > identity"""
+    accepted = {}
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = item.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    def allowed(name):
+        return accepted.get(name, accepted.get('*', 0.0)) > 0
+
+    if brotli is not None and allowed('br'):
+        return 'br'
+    if allowed('gzip'):
+        return 'gzip'
+    return None
+
+def compress_body(body, encoding):
+    """一次性压缩完整响应体"""
+    if encoding == 'br':
+        return brotli.compress(body)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=app.config['GZIP_LEVEL'])
+    return body
+
+def iter_encoded(chunks, encoding):
+    """
+    将文本片段编码并增量压缩
+    片段先攒到JSON_STREAM_FLUSH_BYTES再输出，避免每条记录一次系统调用
+    """
+    flush_bytes = app.config['JSON_STREAM_FLUSH_BYTES']
+    if encoding == 'br':
+        compressor = brotli.Compressor()
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    elif encoding == 'gzip':
+        compressor = zlib.compressobj(app.config['GZIP_LEVEL'], zlib.DEFLATED, 31)
+        process = compressor.compress
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    else:
+        process, flush, finish = (lambda data: data), (lambda: b''), (lambda: b'')
+
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        buffer.append(data)
+        buffered += len(data)
+        if buffered >= flush_bytes:
+            out = process(b''.join(buffer)) + flush()
+            buffer, buffered = [], 0
+            if out:
+                yield out
+    out = process(b''.join(buffer)) + finish()
+    if out:
+        yield out
+
+def parse_stream_args():
+    """
+    解析流式输出参数
+    :return: (是否流式输出, 是否NDJSON)
+    """
+    ndjson = request.args.get('format') == 'ndjson'
+    stream = ndjson or request.args.get('stream', '0').lower() in ('1', 'true', 'yes')
+    return stream, ndjson
+
 # API接口
 @app.route("/api/files", methods=["GET"])
 def get_files():
@@ -235,10 +1047,19 @@ def get_files():
     - group_code: 可选，按group_code筛选
     - page: 可选，页码(默认1)
     - page_size: 可选，每页记录数(默认50，最大200)
+    - cursor: 可选，上一页返回的pagination.next_cursor，按游标分页
+    - with_total: 可选，传0时不返回精确总数，只返回has_more
+    - stream: 可选，传1时直接从数据库游标流式输出JSON
+    - format: 可选，传ndjson时按行输出，每行一个文件，最后一行为pagination
+    - min_duration/max_duration: 可选，按时长（秒）筛选
+    - min_height/max_height/min_width: 可选，按分辨率筛选（如min_height=1080）
+    - codec: 可选，按视频编码或图片格式筛选（如h264、hevc、jpeg）
     """
     # 解析请求参数
     file_type = request.args.get('type')
     group_code = request.args.get('group_code')
+    cursor_token = request.args.get('cursor')
+    with_total = request.args.get('with_total', '1').lower() not in ('0', 'false', 'no')
     
     # 解析分页参数
     try:
@@ -247,19 +1068,42 @@ def get_files():
     except ValueError:
         return jsonify({"error": "页码和每页记录数必须是整数"}), 400
     
+    try:
+        media_filters = parse_media_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     # 验证类型参数
     if file_type and file_type not in ['video', 'image']:
         return jsonify({"error": "无效的类型参数，可选值为'video'或'image'"}), 400
     
     # 查询数据
-    result = get_files_from_db(
-        file_type=file_type,
-        group_code=group_code,
-        page=page,
-        page_size=page_size
-    )
+    stream, ndjson = parse_stream_args()
+    cache_key = ('files', file_type, group_code, page, page_size, cursor_token, with_total,
+                 stream, ndjson, tuple(sorted(media_filters.items())))
+    try:
+        # 游标需在开始输出前校验，流式输出开始后无法再返回400
+        after = decode_page_cursor(cursor_token) if cursor_token else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    return jsonify(result)
+    return versioned_json_response(
+        cache_key,
+        lambda: get_files_from_db(
+            file_type=file_type,
+            group_code=group_code,
+            page=page,
+            page_size=page_size,
+            cursor_token=cursor_token,
+            with_total=with_total,
+            media_filters=media_filters
+        ),
+        stream_builder=(lambda: iter_files_document(
+            file_type, group_code, *normalize_pagination(page, page_size),
+            after, with_total, ndjson, media_filters
+        )) if stream else None,
+        ndjson=ndjson
+    )
 
 @app.route("/api/folders", methods=["GET"])
 def get_folders():
@@ -268,66 +1112,538 @@ def get_folders():
     支持参数:
     - type: 可选，筛选类型('video'或'image')
     - group_code: 可选，按group_code筛选
+    - summary: 可选，传1时只返回每个文件夹的统计信息(file_count、total_size、
+      latest_time、poster_path)，不包含文件列表
+    - stream: 可选，传1时直接从数据库游标流式输出JSON
+    - format: 可选，传ndjson时按行输出，每行一个文件夹，最后一行为汇总数
     """
     file_type = request.args.get('type')
     group_code = request.args.get('group_code')
+    summary = request.args.get('summary', '0').lower() in ('1', 'true', 'yes')
     
     if file_type and file_type not in ['video', 'image']:
         return jsonify({"error": "无效的类型参数，可选值为'video'或'image'"}), 400
     
-    folders_data = get_files_by_folder_from_db(file_type, group_code)
-    return jsonify({
-        'total_folders': len(folders_data),
-        'total_files': sum(folder['file_count'] for folder in folders_data),
-        'data': folders_data
-    })
+    def build():
+        if summary:
+            folders_data = get_folder_summaries_from_db(file_type, group_code)
+        else:
+            folders_data = get_files_by_folder_from_db(file_type, group_code)
+        return {
+            'total_folders': len(folders_data),
+            'total_files': sum(folder['file_count'] for folder in folders_data),
+            'data': folders_data
+        }
+    
+    stream, ndjson = parse_stream_args()
+    return versioned_json_response(
+        ('folders', file_type, group_code, summary, stream, ndjson),
+        build,
+        stream_builder=(lambda: iter_folders_document(
+            file_type, group_code, summary, ndjson
+        )) if stream else None,
+        ndjson=ndjson
+    )
 
-@app.route("/api/stream", methods=["GET"])
-def stream_file():
-    """流式传输文件"""
-    file_path = request.args.get('path')
+@app.route("/api/folders/<group_code>/files", methods=["GET"])
+def get_folder_files(group_code):
+    """
+    分页获取某个文件夹(group_code)下的文件，配合 /api/folders?summary=1 按需加载
+    支持参数与 /api/files 相同: type、page、page_size、cursor、with_total、stream、format，
+    以及min_duration等媒体信息筛选参数
+    """
+    file_type = request.args.get('type')
+    cursor_token = request.args.get('cursor')
+    with_total = request.args.get('with_total', '1').lower() not in ('0', 'false', 'no')
     
-    # 验证参数
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('page_size', app.config['DEFAULT_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({"error": "页码和每页记录数必须是整数"}), 400
+    
+    try:
+        media_filters = parse_media_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if file_type and file_type not in ['video', 'image']:
+        return jsonify({"error": "无效的类型参数，可选值为'video'或'image'"}), 400
+    
+    stream, ndjson = parse_stream_args()
+    cache_key = ('files', file_type, group_code, page, page_size, cursor_token, with_total,
+                 stream, ndjson, tuple(sorted(media_filters.items())))
+    try:
+        # 游标需在开始输出前校验，流式输出开始后无法再返回400
+        after = decode_page_cursor(cursor_token) if cursor_token else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return versioned_json_response(
+        cache_key,
+        lambda: get_files_from_db(
+            file_type=file_type,
+            group_code=group_code,
+            page=page,
+            page_size=page_size,
+            cursor_token=cursor_token,
+            with_total=with_total,
+            media_filters=media_filters
+        ),
+        stream_builder=(lambda: iter_files_document(
+            file_type, group_code, *normalize_pagination(page, page_size),
+            after, with_total, ndjson, media_filters
+        )) if stream else None,
+        ndjson=ndjson
+    )
+
+@app.route("/api/search", methods=["GET"])
+def search_files():
+    """
+    按文件名/文件夹名检索文件（支持中文子串）
+    支持参数:
+    - q: 必填，关键词，多个关键词用空格分隔
+    - type: 可选，筛选类型('video'或'image')
+    - group_code: 可选，按group_code筛选
+    - page: 可选，页码(默认1)
+    - page_size: 可选，每页记录数
+    - min_duration/max_duration/min_height/max_height/min_width/codec: 可选，媒体信息筛选
+    """
+    keywords = request.args.get('q', '').strip()
+    file_type = request.args.get('type')
+    group_code = request.args.get('group_code')
+    
+    if not keywords:
+        return jsonify({"error": "缺少检索关键词参数"}), 400
+    
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('page_size', app.config['DEFAULT_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({"error": "页码和每页记录数必须是整数"}), 400
+    
+    try:
+        media_filters = parse_media_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if file_type and file_type not in ['video', 'image']:
+        return jsonify({"error": "无效的类型参数，可选值为'video'或'image'"}), 400
+    
+    try:
+        return versioned_json_response(
+            ('search', keywords, file_type, group_code, page, page_size,
+             tuple(sorted(media_filters.items()))),
+            lambda: search_files_from_db(keywords, file_type, group_code, page, page_size,
+                                         media_filters)
+        )
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+
+# 近似文件查询（感知哈希）
+def get_similar_files_from_db(file_path, max_distance, limit):
+    """
+    查找与指定文件近似的文件，结果按距离从小到大
+    候选通过media_phash的分段索引查找，不会与全部文件逐一比较
+    :raises LookupError: 文件不在目录中或尚未计算感知哈希
+    """
+    conn = None
+    try:
+        conn, cursor = get_db_connection()
+        source = cursor.execute(FILE_COLUMNS + "WHERE file_path = ?", (file_path,)).fetchone()
+        if source is None:
+            raise LookupError("文件不在目录中")
+        results = media_phash.query_similar(conn, source['media_id'], max_distance, limit)
+        if results is None:
+            raise LookupError("该文件尚未计算感知哈希（运行 media_phash.py）")
+        rows = {
+            row['media_id']: row for row in catalog_shards.select_by_media_ids(
+                conn, 'media_data',
+                "file_name, file_path, file_type, group_code, parent_folder, file_size, "
+                "created_time, modified_time, poster_path, duration, width, height, codec, "
+                "bitrate, orientation",
+                [media_id for media_id, _ in results]
+            )
+        }
+        return {
+            'source': file_row_to_dict(source),
+            'max_distance': max_distance,
+            'data': [
+                dict(file_row_to_dict(rows[media_id]), distance=distance)
+                for media_id, distance in results if media_id in rows
+            ]
+        }
+    except sqlite3.Error as e:
+        app.logger.error(f"近似文件查询错误: {str(e)}")
+        raise CatalogUnavailableError("数据库暂时不可用，请稍后重试") from e
+    finally:
+        close_db_connection(conn)
+
+@app.route("/api/similar", methods=["GET"])
+def similar_files():
+    """
+    查找与指定文件近似（重新编码、缩放过）的图片或视频，按感知哈希距离从小到大排序
+    支持参数:
+    - path: 必填，文件路径
+    - max_distance: 可选，最大汉明距离（默认5，0~15）
+    - limit: 可选，最多返回的文件数
+    """
+    file_path = request.args.get('path')
     if not file_path:
         return jsonify({"error": "缺少文件路径参数"}), 400
+
+    try:
+        max_distance = int(request.args.get('max_distance', media_phash.DEFAULT_MAX_DISTANCE))
+        limit = int(request.args.get('limit', app.config['MAX_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({"error": "距离和数量必须是整数"}), 400
+
+    if not 0 <= max_distance <= media_phash.MAX_DISTANCE:
+        return jsonify({"error": f"距离应在0~{media_phash.MAX_DISTANCE}之间"}), 400
+    limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+
+    try:
+        return versioned_json_response(
+            ('similar', file_path, max_distance, limit),
+            lambda: get_similar_files_from_db(file_path, max_distance, limit)
+        )
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+
+# 流媒体Range支持工具函数
+def parse_byte_ranges(range_header, file_size):
+    """
+    解析HTTP Range请求头（RFC 7233）
+    :param range_header: Range请求头的值，如"bytes=0-1023,-500"
+    :param file_size: 文件总大小（字节）
+    :return: None表示忽略Range（返回整文件）；空列表表示范围不可满足（416）；
+             否则返回按起点排序并合并后的[(start, end)]闭区间列表
+    """
+    if not range_header:
+        return None
+    units, _, range_set = range_header.partition('=')
+    if units.strip().lower() != 'bytes' or not range_set.strip():
+        return None
+
+    specs = [spec.strip() for spec in range_set.split(',') if spec.strip()]
+    if not specs or len(specs) > app.config['MAX_RANGES']:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, sep, last = spec.partition('-')
+        first, last = first.strip(), last.strip()
+        if not sep or not (first or last):
+            return None
+        if (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+
+        if not first:
+            # 后缀范围："-500"表示最后500字节
+            suffix_length = int(last)
+            if suffix_length == 0:
+                continue
+            start, end = max(file_size - suffix_length, 0), file_size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else file_size - 1
+            if last and end < start:
+                return None
+            if start >= file_size:
+                continue
+            end = min(end, file_size - 1)
+
+        if file_size > 0:
+            ranges.append((start, end))
+
+    # 合并重叠或相邻的范围，避免重复发送同一段数据
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def make_file_etag(stat_info):
+    """根据inode、大小和修改时间生成强ETag"""
+    return f'"{stat_info.st_ino:x}-{stat_info.st_size:x}-{stat_info.st_mtime_ns:x}"'
+
+def is_if_range_satisfied(if_range, etag, last_modified):
+    """判断If-Range条件是否成立（成立时才按Range返回部分内容）"""
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        # If-Range只接受强比较
+        return if_range == etag
+    since = parse_date(if_range)
+    return since is not None and int(last_modified) == int(since.timestamp())
+
+def is_not_modified(request_headers, etag, last_modified):
+    """根据If-None-Match / If-Modified-Since判断是否可以返回304"""
+    if_none_match = request_headers.get('If-None-Match')
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+    if_modified_since = request_headers.get('If-Modified-Since')
+    if if_modified_since:
+        since = parse_date(if_modified_since)
+        return since is not None and int(last_modified) <= int(since.timestamp())
+    return False
+
+def iter_file_range(file_abspath, start, length):
+    """按块读取文件中[start, start+length)的数据（无wsgi.file_wrapper时的兜底方案）"""
+    chunk_size = app.config['STREAM_CHUNK_SIZE']
+    with open(file_abspath, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def open_file_body(file_abspath, start, length):
+    """
+    返回文件指定范围的响应体
+    服务器提供wsgi.file_wrapper时（如gunicorn），定位到起点后交给file_wrapper，
+    由服务器根据Content-Length调用os.sendfile零拷贝发送；否则退回按块读取
+    """
+    if 'wsgi.file_wrapper' not in request.environ:
+        return iter_file_range(file_abspath, start, length)
+    f = open(file_abspath, 'rb')
+    f.seek(start)
+    return wrap_file(request.environ, f, app.config['STREAM_CHUNK_SIZE'])
+
+def multipart_part_header(start, end, file_size, mime_type, boundary):
+    """multipart/byteranges中每一段的分隔符和段头"""
+    return (
+        f"\r\n--{boundary}\r\n"
+        f"Content-Type: {mime_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+    ).encode('latin-1')
+
+def multipart_trailer(boundary):
+    """multipart/byteranges的结束分隔符"""
+    return f"\r\n--{boundary}--\r\n".encode('latin-1')
+
+def iter_multipart_ranges(file_abspath, ranges, file_size, mime_type, boundary):
+    """生成multipart/byteranges响应体"""
+    for start, end in ranges:
+        yield multipart_part_header(start, end, file_size, mime_type, boundary)
+        yield from iter_file_range(file_abspath, start, end - start + 1)
+    yield multipart_trailer(boundary)
+
+def multipart_ranges_length(ranges, file_size, mime_type, boundary):
+    """预先计算multipart/byteranges响应体的总长度，用于Content-Length"""
+    total = len(multipart_trailer(boundary))
+    for start, end in ranges:
+        total += len(multipart_part_header(start, end, file_size, mime_type, boundary))
+        total += end - start + 1
+    return total
+
+def plan_file_stream(file_path, request_headers):
+    """
+    解析文件流请求，得到响应方案（WSGI和ASGI两种服务方式共用）
+    :param file_path: 请求的文件路径
+    :param request_headers: 请求头（支持.get(name)的对象）
+    :return: 字典，包含:
+             - status: HTTP状态码
+             - error: 出错时的错误信息，否则为None
+             - headers: 响应头
+             - file_abspath / file_size / mime_type: 文件信息
+             - body_range: 单段响应体的(起点, 长度)，无响应体或多段时为None
+             - ranges / boundary: 多段响应的范围列表和分隔符，否则为None
+    """
+    plan = {'status': 200, 'error': None, 'headers': {}, 'file_abspath': None,
+            'file_size': 0, 'mime_type': None, 'body_range': None,
+            'ranges': None, 'boundary': None}
+
+    # 验证参数
+    if not file_path:
+        return dict(plan, status=400, error="缺少文件路径参数")
     
-    # 安全检查：确保文件在允许的目录内
-    allowed_root = os.path.abspath(app.config['TARGET_FOLDER'])
+    # 安全检查：确保文件在允许的目录内（基础目录或任一分片的根目录）
+    allowed_roots = [os.path.abspath(app.config['TARGET_FOLDER'])]
+    allowed_roots.extend(shard['root'] for shard in db_pool.shards())
     file_abspath = os.path.abspath(file_path)
     
     # 严格验证路径，防止路径遍历攻击
-    if os.path.commonprefix([file_abspath, allowed_root]) != allowed_root:
+    if not any(os.path.commonprefix([file_abspath, root]) == root for root in allowed_roots):
         app.logger.warning(f"尝试访问未授权路径: {file_path}")
-        return jsonify({"error": "访问被拒绝"}), 403
+        return dict(plan, status=403, error="访问被拒绝")
     
     # 验证文件是否存在
     if not os.path.isfile(file_abspath):
-        return jsonify({"error": "文件不存在"}), 404
+        return dict(plan, status=404, error="文件不存在")
     
     # 获取MIME类型
     mime_type, _ = mimetypes.guess_type(file_abspath)
     if not mime_type:
         mime_type = 'application/octet-stream'
+
+    stat_info = os.stat(file_abspath)
+    file_size = stat_info.st_size
+    etag = make_file_etag(stat_info)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': etag,
+        'Last-Modified': http_date(stat_info.st_mtime),
+    }
+    plan.update(headers=headers, file_abspath=file_abspath,
+                file_size=file_size, mime_type=mime_type)
+
+    # 条件请求：客户端缓存仍然有效
+    if is_not_modified(request_headers, etag, stat_info.st_mtime):
+        return dict(plan, status=304)
+
+    ranges = None
+    if is_if_range_satisfied(request_headers.get('If-Range'), etag, stat_info.st_mtime):
+        ranges = parse_byte_ranges(request_headers.get('Range'), file_size)
+
+    # 范围不可满足
+    if ranges == []:
+        headers['Content-Range'] = f"bytes */{file_size}"
+        return dict(plan, status=416)
+
+    # 整文件
+    if ranges is None:
+        headers['Content-Type'] = mime_type
+        headers['Content-Length'] = str(file_size)
+        return dict(plan, status=200, body_range=(0, file_size))
+
+    # 单段范围
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        length = end - start + 1
+        headers['Content-Type'] = mime_type
+        headers['Content-Range'] = f"bytes {start}-{end}/{file_size}"
+        headers['Content-Length'] = str(length)
+        return dict(plan, status=206, body_range=(start, length))
+
+    # 多段范围
+    boundary = uuid.uuid4().hex
+    headers['Content-Type'] = f"multipart/byteranges; boundary={boundary}"
+    headers['Content-Length'] = str(
+        multipart_ranges_length(ranges, file_size, mime_type, boundary)
+    )
+    return dict(plan, status=206, ranges=ranges, boundary=boundary)
+
+@app.route("/api/stream", methods=["GET"])
+def stream_file():
+    """
+    流式传输文件
+    支持Range/If-Range断点请求（单段返回206，多段返回multipart/byteranges），
+    以及ETag/Last-Modified条件请求
+    """
+    plan = plan_file_stream(request.args.get('path'), request.headers)
+    if plan['error']:
+        return jsonify({"error": plan['error']}), plan['status']
     
-    # 大文件流式传输
-    def generate():
-        with open(file_abspath, 'rb') as f:
-            while chunk := f.read(1024 * 1024):  # 1MB块
-                yield chunk
-    
-    return Response(generate(), mimetype=mime_type)
+    if plan['body_range'] is not None:
+        body = open_file_body(plan['file_abspath'], *plan['body_range'])
+    elif plan['ranges'] is not None:
+        body = iter_multipart_ranges(plan['file_abspath'], plan['ranges'], plan['file_size'],
+                                     plan['mime_type'], plan['boundary'])
+    else:
+        body = None
+    return Response(body, status=plan['status'], headers=plan['headers'],
+                    direct_passthrough=True)
 
 @app.route("/api/refresh-cache", methods=["POST"])
 def refresh_cache():
     """刷新缓存接口"""
-    get_files_by_folder_from_db.cache_clear()
+    response_cache.clear()
     return jsonify({"message": "缓存已刷新"})
 
+@app.route("/api/db-stats", methods=["GET"])
+def db_stats():
+    """数据库连接池和响应缓存统计信息"""
+    stats = db_pool.stats()
+    stats['response_cache'] = response_cache.stats()
+    return jsonify(stats)
+
+# 查询计划检查
+def iter_hot_queries(shards=None):
+    """
+    列出需要检查执行计划的热点查询：(名称, SQL, 参数)
+    :param shards: 可选，连接上挂载的分片，分页查询按分片合并的形式检查
+    """
+    sample_cursor = ('/', '9999-12-31', 2 ** 62)
+    for file_type in (None, 'video', 'image'):
+        for group_code in (None, 'sample_group'):
+            filters, params = build_filters(file_type, group_code)
+            label = f"type={file_type}, group_code={group_code}"
+            yield (f"files page ({label})",
+                   *build_files_page_query(filters, params, 2, 50, shards=shards))
+            yield (f"files cursor ({label})",
+                   *build_files_page_query(filters, params, 1, 50, sample_cursor, shards))
+            if file_type or group_code:
+                yield (f"folders ({label})",
+                       FILE_COLUMNS + "WHERE 1=1" + filters + FOLDER_FILES_ORDER, params)
+                yield (f"folder summaries ({label})",
+                       *build_folder_summary_query(filters, params, shards))
+    long_hd = {'min_duration': 600.0, 'min_height': 1080}
+    filters, params = build_filters('video', None, long_hd)
+    yield ("long 1080p videos", FILE_COLUMNS + "WHERE 1=1" + filters, params)
+    yield ("long 1080p videos count", *build_count_query(filters, params, shards))
+    yield ("similar candidates",
+           *media_phash.similar_candidates_query(1, 0x0123456789ABCDEF, media_phash.DEFAULT_MAX_DISTANCE))
+    yield ("poster job",
+           "SELECT file_path, parent_folder, group_code FROM media_data "
+           "WHERE media_kind = 'video' AND (poster_path IS NULL OR poster_path = '')", [])
+
+def check_hot_query_plans():
+    """
+    用EXPLAIN QUERY PLAN检查热点查询，找出对media_data/media_phash的全表扫描
+    （不带筛选条件的整表列表/汇总本身就要遍历全部数据，不在检查范围内）
+    使用分片时检查的是各分片上的media_data（联合视图本身的SCAN不算）
+    :return: [(名称, 执行计划明细)] 存在全表扫描的查询
+    """
+    conn = None
+    problems = []
+    try:
+        conn, cursor = get_db_connection()
+        shards = catalog_shards.attached_shards(conn)
+        full_scans = {
+            f"SCAN {schema}.{table}" for _, schema in shards for table in ('media_data', 'media_phash')
+        } or {'SCAN media_data', 'SCAN media_phash'}
+        # 分片分页查询中media_data的别名为d，执行计划中显示为 SCAN d
+        full_scans.add('SCAN d')
+        for name, query, params in iter_hot_queries(shards):
+            details = [row['detail'] for row in cursor.execute(
+                "EXPLAIN QUERY PLAN " + query, params
+            )]
+            if any(detail.strip() in full_scans for detail in details):
+                problems.append((name, details))
+    finally:
+        close_db_connection(conn)
+    return problems
+
+@app.cli.command('check-plans')
+def check_plans_command():
+    """检查热点查询是否会退化为全表扫描：flask --app app check-plans"""
+    problems = check_hot_query_plans()
+    for name, details in problems:
+        print(f"全表扫描: {name}")
+        for detail in details:
+            print(f"    {detail}")
+    if problems:
+        raise SystemExit(1)
+    print("所有热点查询均使用索引")
+
 # 错误处理
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({"error": "资源不存在"}), 404
 
+@app.errorhandler(CatalogUnavailableError)
+def catalog_unavailable(error):
+    return jsonify({"error": str(error)}), 503, {'Retry-After': '5'}
+
 @app.errorhandler(500)
 def server_error(error):
     app.logger.error(f"服务器内部错误: {str(error)}")
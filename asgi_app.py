@@ -0,0 +1,331 @@
+"""
+异步(ASGI)服务入口
+
+/api/stream 在事件循环中直接处理：文件读取交给专用I/O线程池(os.pread)，
+不再为每个观看者占用一个线程；其余JSON接口转交 app.py 中的Flask应用，
+在有限大小的线程池中执行，接口返回内容与WSGI方式完全一致。
+
+运行方式（需安装uvicorn）：
+    uvicorn asgi_app:application --host 0.0.0.0 --port 8888
+或直接：
+    python asgi_app.py
+"""
+import asyncio
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as flask_module
+
+flask_app = flask_module.app
+
+class TokenBucket:
+    """令牌桶限速：按字节发放令牌，同一客户端的所有连接共享"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = rate  # 最多积攒1秒的突发流量
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    async def consume(self, amount):
+        """取走amount个令牌，不足时等待"""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount or self.tokens >= self.capacity:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((min(amount, self.capacity) - self.tokens) / self.rate)
+
+class StreamLimiter:
+    """文件流并发控制：全局上限 + 每客户端上限 + 每客户端带宽"""
+
+    def __init__(self, config):
+        self.config = config
+        self._global = None
+        self._per_client = {}
+        self._buckets = {}
+
+    def _semaphore(self):
+        # 信号量需在事件循环启动后创建
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.config['ASYNC_MAX_STREAMS'])
+        return self._global
+
+    async def acquire(self, client):
+        """
+        获取一个文件流名额
+        :return: None表示成功，否则为(状态码, 错误信息)
+        """
+        if self._per_client.get(client, 0) >= self.config['ASYNC_MAX_STREAMS_PER_CLIENT']:
+            return 429, "该客户端同时打开的文件流过多"
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        try:
+            await asyncio.wait_for(self._semaphore().acquire(),
+                                   self.config['ASYNC_STREAM_WAIT_TIMEOUT'])
+        except asyncio.TimeoutError:
+            self._release_client(client)
+            return 503, "服务器繁忙，请稍后重试"
+        return None
+
+    def release(self, client):
+        """归还文件流名额"""
+        self._semaphore().release()
+        self._release_client(client)
+
+    def _release_client(self, client):
+        count = self._per_client.get(client, 0) - 1
+        if count > 0:
+            self._per_client[client] = count
+        else:
+            self._per_client.pop(client, None)
+            self._buckets.pop(client, None)
+
+    def bucket(self, client):
+        """客户端的令牌桶，不限速时返回None"""
+        rate = self.config['ASYNC_CLIENT_BANDWIDTH']
+        if not rate:
+            return None
+        if client not in self._buckets:
+            self._buckets[client] = TokenBucket(rate)
+        return self._buckets[client]
+
+    def stats(self):
+        """返回当前文件流统计"""
+        return {
+            'active_streams': sum(self._per_client.values()),
+            'active_clients': len(self._per_client),
+            'max_streams': self.config['ASYNC_MAX_STREAMS'],
+        }
+
+stream_limiter = StreamLimiter(flask_app.config)
+io_pool = ThreadPoolExecutor(max_workers=flask_app.config['ASYNC_IO_WORKERS'],
+                             thread_name_prefix='stream-io')
+wsgi_pool = ThreadPoolExecutor(max_workers=flask_app.config['ASYNC_WSGI_WORKERS'],
+                               thread_name_prefix='wsgi')
+
+class ScopeHeaders:
+    """以不区分大小写的方式读取ASGI请求头"""
+
+    def __init__(self, scope):
+        self._headers = {}
+        for name, value in scope.get('headers', []):
+            self._headers[name.decode('latin-1').lower()] = value.decode('latin-1')
+
+    def get(self, name, default=None):
+        return self._headers.get(name.lower(), default)
+
+def encode_headers(headers):
+    """将响应头字典转换为ASGI格式"""
+    return [(str(name).encode('latin-1'), str(value).encode('latin-1'))
+            for name, value in headers.items()]
+
+async def send_json_error(send, status, message, extra_headers=None):
+    """返回与Flask接口格式一致的JSON错误"""
+    body = flask_app.json.dumps({"error": message}).encode('utf-8')
+    headers = {'Content-Type': 'application/json', 'Content-Length': str(len(body)),
+               'Access-Control-Allow-Origin': '*'}
+    headers.update(extra_headers or {})
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': encode_headers(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def watch_disconnect(receive, disconnected):
+    """后台监听客户端断开"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+async def send_file_segment(send, file_obj, start, length, bucket, disconnected, zero_copy):
+    """
+    异步发送文件的一段
+    每块数据在I/O线程池中用os.pread读取，await send会在客户端接收变慢时自然阻塞（背压）；
+    服务器支持zerocopysend扩展且未限速时，交由服务器用os.sendfile发送
+    """
+    chunk_size = flask_app.config['STREAM_CHUNK_SIZE']
+    if bucket is not None:
+        # 限速时缩小每块大小，使发送节奏平滑
+        chunk_size = min(chunk_size, max(bucket.rate // 4, 16 * 1024))
+    loop = asyncio.get_running_loop()
+    if zero_copy and bucket is None:
+        await send({'type': 'http.response.zerocopysend', 'file': file_obj,
+                    'offset': start, 'count': length, 'more_body': True})
+        return True
+
+    fd = file_obj.fileno()
+    offset, remaining = start, length
+    while remaining > 0:
+        if disconnected.is_set():
+            return False
+        size = min(chunk_size, remaining)
+        if bucket is not None:
+            await bucket.consume(size)
+        chunk = await loop.run_in_executor(io_pool, os.pread, fd, size, offset)
+        if not chunk:
+            break
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        offset += len(chunk)
+        remaining -= len(chunk)
+    return True
+
+async def handle_stream(scope, receive, send):
+    """异步处理 /api/stream"""
+    query = parse_qs(scope.get('query_string', b'').decode('utf-8'))
+    file_path = query.get('path', [None])[0]
+    plan = await asyncio.get_running_loop().run_in_executor(
+        io_pool, flask_module.plan_file_stream, file_path, ScopeHeaders(scope)
+    )
+    if plan['error']:
+        await send_json_error(send, plan['status'], plan['error'])
+        return
+
+    headers = dict(plan['headers'], **{'Access-Control-Allow-Origin': '*'})
+    has_body = plan['body_range'] is not None or plan['ranges'] is not None
+    if not has_body or scope['method'] == 'HEAD':
+        await send({'type': 'http.response.start', 'status': plan['status'],
+                    'headers': encode_headers(headers)})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    client = (scope.get('client') or ('unknown', 0))[0]
+    rejected = await stream_limiter.acquire(client)
+    if rejected:
+        await send_json_error(send, *rejected, extra_headers={'Retry-After': '1'})
+        return
+
+    disconnected = asyncio.Event()
+    watcher = asyncio.create_task(watch_disconnect(receive, disconnected))
+    zero_copy = 'http.response.zerocopysend' in scope.get('extensions', {})
+    bucket = stream_limiter.bucket(client)
+    file_obj = None
+    try:
+        file_obj = open(plan['file_abspath'], 'rb')
+        await send({'type': 'http.response.start', 'status': plan['status'],
+                    'headers': encode_headers(headers)})
+        if plan['body_range'] is not None:
+            await send_file_segment(send, file_obj, *plan['body_range'], bucket, disconnected, zero_copy)
+        else:
+            for start, end in plan['ranges']:
+                await send({'type': 'http.response.body', 'more_body': True,
+                            'body': flask_module.multipart_part_header(
+                                start, end, plan['file_size'], plan['mime_type'], plan['boundary'])})
+                if not await send_file_segment(send, file_obj, start, end - start + 1,
+                                               bucket, disconnected, zero_copy=False):
+                    break
+            else:
+                await send({'type': 'http.response.body', 'more_body': True,
+                            'body': flask_module.multipart_trailer(plan['boundary'])})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        if file_obj is not None:
+            file_obj.close()
+        stream_limiter.release(client)
+
+def build_environ(scope, body):
+    """由ASGI scope构造WSGI environ"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            continue
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+async def handle_wsgi(scope, receive, send):
+    """在线程池中执行Flask应用，逐块转发响应（包括流式JSON）"""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    loop = asyncio.get_running_loop()
+    environ = build_environ(scope, body)
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.encode('latin-1'), value.encode('latin-1'))
+                               for name, value in headers]
+
+    def run_app():
+        result = flask_app(environ, start_response)
+        return result, iter(result)
+
+    result, iterator = await loop.run_in_executor(wsgi_pool, run_app)
+    try:
+        await send({'type': 'http.response.start', 'status': response['status'],
+                    'headers': response['headers']})
+        while True:
+            chunk = await loop.run_in_executor(wsgi_pool, next, iterator, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            await loop.run_in_executor(wsgi_pool, result.close)
+
+async def application(scope, receive, send):
+    """ASGI应用入口"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                io_pool.shutdown(wait=False)
+                wsgi_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    if scope['path'] == '/api/stream' and scope['method'] in ('GET', 'HEAD'):
+        await handle_stream(scope, receive, send)
+    elif scope['path'] == '/api/stream-stats':
+        body = flask_app.json.dumps(stream_limiter.stats()).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': encode_headers({'Content-Type': 'application/json',
+                                               'Content-Length': str(len(body))})})
+        await send({'type': 'http.response.body', 'body': body})
+    else:
+        await handle_wsgi(scope, receive, send)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(application, host='0.0.0.0', port=8888, log_level='info')
@@ -0,0 +1,162 @@
+"""
+比较几种文件哈希方式的读取量、耗时和碰撞率
+
+参与比较的方式:
+    head-6.5MB-md5    media_metadata_importer.get_file_hash 的现有方式（文件开头约6.5MB的md5）
+    head-64KB-sha256  find_dunplicate_file_with_hash.calculate_hash 的现有方式（文件开头64KB的sha256）
+    sample-NxB-算法    采样指纹：文件大小 + N个均匀分布的块（头、中间...、尾），可指定多组块数和算法
+
+碰撞：两个内容不同的文件得到了相同的哈希值（会被误判为重复）。
+只有哈希值相同的文件才需要确认内容是否相同，因此只对这些文件计算完整md5作为真值（不计入读取量）。
+碰撞率 = 与内容不同的文件哈希值相同的文件数 / 文件总数。
+
+所有方式都不使用哈希缓存。文件按方式顺序依次读取，后面的方式可能读到系统页缓存，
+耗时仅供参考，读取量(MB)才是在外置机械硬盘上决定速度的指标。
+
+用法:
+    python benchmark_fingerprint.py /Volumes/STORE/sex_files/tg
+    python benchmark_fingerprint.py /Volumes/STORE/sex_files/tg --blocks 3 --blocks 5 --algorithm md5 --algorithm fast
+"""
+import argparse
+import concurrent.futures
+import time
+from collections import defaultdict
+
+import hash_cache
+import hash_engine
+import import_metrics
+import media_walker
+from find_dunplicate_file_with_hash import IMAGE_EXTENSIONS, VIDEO_EXTENSIONS
+from media_metadata_importer import HASH_BLOCK_SIZE, HASH_MAX_BLOCKS
+
+# calculate_hash 的默认窗口
+CALCULATE_HASH_BYTES = 65536
+
+def collect_files(root_dir, suffixes, limit=None):
+    """
+    :return: [(file_path, stat_result)]，跳过软链接和空文件
+    """
+    files = []
+    for entry in media_walker.walk_files(root_dir, suffixes=suffixes):
+        try:
+            if entry.is_symlink():
+                continue
+            stat_info = entry.stat()
+        except OSError as e:
+            print(f"读取文件信息 {entry.path} 时出错: {e}")
+            continue
+        if stat_info.st_size:
+            files.append((entry.path, stat_info))
+            if limit and len(files) >= limit:
+                break
+    return files
+
+def run_method(files, algorithm, hash_func):
+    """
+    用一个独立的HashEngine（不使用缓存）计算所有文件的哈希
+    :param hash_func: (engine, file_path, stat_info) -> 哈希值
+    :return: ({file_path: 哈希值}, 读取字节数, 耗时秒数)
+    """
+    metrics = import_metrics.PipelineMetrics()
+    digests = {}
+    with hash_engine.HashEngine(algorithm=algorithm, metrics=metrics) as engine:
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=engine.workers) as executor:
+            results = executor.map(lambda item: hash_func(engine, *item), files)
+            for (file_path, _), digest in zip(files, results):
+                if digest is not None:
+                    digests[file_path] = digest
+        elapsed = time.perf_counter() - start
+    return digests, metrics.counters.get('bytes_read', 0), elapsed
+
+def colliding_groups(digests):
+    """哈希值相同的文件组（每组至少2个文件）"""
+    groups = defaultdict(list)
+    for file_path, digest in digests.items():
+        groups[digest].append(file_path)
+    return [paths for paths in groups.values() if len(paths) > 1]
+
+def count_collisions(groups, truth):
+    """组内存在内容不同的文件时，组内所有与其他内容不同的文件都算作碰撞"""
+    collided = 0
+    for paths in groups:
+        contents = defaultdict(int)
+        for path in paths:
+            contents[truth.get(path, path)] += 1
+        if len(contents) > 1:
+            collided += len(paths)
+    return collided
+
+def build_methods(sample_size, blocks_options, algorithms):
+    """:return: [(名称, 算法, hash_func)]"""
+    head_bytes = HASH_BLOCK_SIZE * HASH_MAX_BLOCKS
+    methods = [
+        ('head-6.5MB-md5', 'md5',
+         lambda engine, path, stat_info: engine.hash_file(path, stat_info, max_bytes=head_bytes)),
+        ('head-64KB-sha256', 'sha256',
+         lambda engine, path, stat_info: engine.hash_file(path, stat_info, max_bytes=CALCULATE_HASH_BYTES)),
+    ]
+    for algorithm in algorithms:
+        for blocks in blocks_options:
+            name = f"sample-{blocks}x{sample_size // 1024}KB-{hash_engine.resolve_algorithm(algorithm)}"
+            methods.append((
+                name, algorithm,
+                lambda engine, path, stat_info, blocks=blocks: engine.hash_sample(
+                    path, stat_info, block_size=sample_size, blocks=blocks
+                )
+            ))
+    return methods
+
+def main():
+    parser = argparse.ArgumentParser(description="比较文件哈希方式的读取量、耗时和碰撞率")
+    parser.add_argument('root_dir', help="用于测试的目录（建议包含大量视频）")
+    parser.add_argument('--blocks', type=int, action='append', default=None,
+                        help="采样指纹的块数，可重复指定（默认3）")
+    parser.add_argument('--sample-size', type=int, default=HASH_BLOCK_SIZE, help="采样块大小(字节)")
+    parser.add_argument('--algorithm', action='append', default=None,
+                        help="采样指纹使用的算法，可重复指定（默认md5和fast）")
+    parser.add_argument('--limit', type=int, default=None, help="最多测试的文件数")
+    args = parser.parse_args()
+
+    files = collect_files(args.root_dir, IMAGE_EXTENSIONS + VIDEO_EXTENSIONS, args.limit)
+    total_bytes = sum(stat_info.st_size for _, stat_info in files)
+    print(f"共 {len(files)} 个媒体文件，{total_bytes / (1 << 20):.1f} MB")
+    if not files:
+        return
+
+    methods = build_methods(args.sample_size, args.blocks or [3], args.algorithm or ['md5', 'fast'])
+    results = []
+    candidates = set()
+    for name, algorithm, hash_func in methods:
+        print(f"正在计算: {name}")
+        digests, bytes_read, elapsed = run_method(files, algorithm, hash_func)
+        groups = colliding_groups(digests)
+        for paths in groups:
+            candidates.update(paths)
+        results.append((name, digests, groups, bytes_read, elapsed))
+
+    # 真值：只对哈希值相同的文件计算完整md5（可使用共享哈希缓存）
+    print(f"正在计算 {len(candidates)} 个候选文件的完整md5作为真值...")
+    stat_by_path = dict(files)
+    truth = {}
+    with hash_engine.HashEngine(algorithm='md5', cache=hash_cache.HashCache()) as engine:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=engine.workers) as executor:
+            paths = sorted(candidates)
+            digests = executor.map(
+                lambda path: engine.hash_file(path, stat_by_path[path], max_bytes=None), paths
+            )
+            for path, digest in zip(paths, digests):
+                if digest is not None:
+                    truth[path] = (stat_by_path[path].st_size, digest)
+
+    print()
+    print(f"{'方式':<26}{'读取MB':>12}{'占比':>9}{'耗时s':>9}{'相同组':>8}{'碰撞文件':>10}{'碰撞率':>10}")
+    for name, digests, groups, bytes_read, elapsed in results:
+        collided = count_collisions(groups, truth)
+        print(
+            f"{name:<26}{bytes_read / (1 << 20):>12.1f}{bytes_read / total_bytes * 100:>8.2f}%"
+            f"{elapsed:>9.2f}{len(groups):>8}{collided:>10}{collided / len(files) * 100:>9.3f}%"
+        )
+
+if __name__ == "__main__":
+    main()
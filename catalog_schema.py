@@ -0,0 +1,405 @@
+"""
+媒体目录数据库(media_data)的结构维护
+
+app.py 和导入脚本共用这里的建表/建索引语句，所有语句都是幂等的，
+可以在每次启动时执行。完整的表结构说明见 README.md。
+"""
+import sqlite3
+
+# media_data 表结构（与README中的定义保持一致）
+CREATE_MEDIA_DATA_SQL = """
+CREATE TABLE IF NOT EXISTS media_data (
+    media_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_name TEXT NOT NULL,
+    file_path TEXT UNIQUE NOT NULL,
+    file_type TEXT,
+    file_size INTEGER,
+    poster_path TEXT,
+    created_time DATETIME,
+    modified_time DATETIME,
+    hash_value TEXT,
+    parent_folder TEXT,
+    group_code TEXT,
+    media_kind TEXT,
+    file_mtime_ns INTEGER,
+    file_inode INTEGER,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    codec TEXT,
+    bitrate INTEGER,
+    orientation INTEGER,
+    probe_size INTEGER,
+    probe_mtime_ns INTEGER
+)
+"""
+
+# 索引定义
+INDEX_SQLS = [
+    "CREATE INDEX IF NOT EXISTS idx_type ON media_data(file_type)",
+    "CREATE INDEX IF NOT EXISTS idx_created ON media_data(created_time)",
+    "CREATE INDEX IF NOT EXISTS idx_folder ON media_data(parent_folder)",
+    # 与 /api/files 的排序完全一致，用于游标(keyset)分页
+    "CREATE INDEX IF NOT EXISTS idx_folder_created_id "
+    "ON media_data(parent_folder, created_time DESC, media_id DESC)",
+    # 带类型/分组筛选时的复合索引，等值条件在前、排序列在后，筛选和排序都不需要额外扫描
+    "CREATE INDEX IF NOT EXISTS idx_kind_folder_created "
+    "ON media_data(media_kind, parent_folder, created_time DESC, media_id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_kind_group_folder_created "
+    "ON media_data(media_kind, group_code, parent_folder, created_time DESC, media_id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_group_folder_created "
+    "ON media_data(group_code, parent_folder, created_time DESC, media_id DESC)",
+    # 按时长/分辨率筛选（如"1080p以上且超过10分钟的视频"）
+    "CREATE INDEX IF NOT EXISTS idx_kind_height_duration ON media_data(media_kind, height, duration)",
+    "CREATE INDEX IF NOT EXISTS idx_kind_duration ON media_data(media_kind, duration)",
+    # 生成海报时按类型查找缺少封面的视频（覆盖索引）
+    "CREATE INDEX IF NOT EXISTS idx_kind_poster "
+    "ON media_data(media_kind, poster_path, file_path, parent_folder, group_code)",
+]
+
+# 按(媒体类别, group_code)汇总的文件数，供 /api/files 直接读取总数，
+# 避免每次请求都对media_data做COUNT(*)全表扫描
+CREATE_MEDIA_COUNTS_SQL = """
+CREATE TABLE IF NOT EXISTS media_counts (
+    media_kind TEXT NOT NULL,              -- 媒体类别：video / image / other
+    group_code TEXT NOT NULL DEFAULT '',   -- 分组标识（NULL记为空串）
+    file_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (media_kind, group_code)
+) WITHOUT ROWID
+"""
+
+# 由file_type推导媒体类别的SQL表达式，{row}为NEW或OLD
+MEDIA_KIND_EXPR = (
+    "CASE WHEN {row}.file_type LIKE 'video/%' THEN 'video' "
+    "WHEN {row}.file_type LIKE 'image/%' THEN 'image' ELSE 'other' END"
+)
+
+_COUNT_INCREMENT_SQL = (
+    "INSERT INTO media_counts (media_kind, group_code, file_count) "
+    "VALUES (" + MEDIA_KIND_EXPR.format(row='NEW') + ", IFNULL(NEW.group_code, ''), 1) "
+    "ON CONFLICT (media_kind, group_code) DO UPDATE SET file_count = file_count + 1;"
+)
+_COUNT_DECREMENT_SQL = (
+    "UPDATE media_counts SET file_count = file_count - 1 "
+    "WHERE media_kind = " + MEDIA_KIND_EXPR.format(row='OLD') +
+    " AND group_code = IFNULL(OLD.group_code, '');"
+)
+
+# 触发器保证任何写入media_data的脚本都会同步维护media_counts。
+# 注意：INSERT OR REPLACE的隐式删除不会触发DELETE触发器，写入时请使用UPSERT
+COUNT_TRIGGER_SQLS = [
+    "CREATE TRIGGER IF NOT EXISTS trg_media_counts_insert AFTER INSERT ON media_data "
+    "BEGIN " + _COUNT_INCREMENT_SQL + " END",
+    "CREATE TRIGGER IF NOT EXISTS trg_media_counts_delete AFTER DELETE ON media_data "
+    "BEGIN " + _COUNT_DECREMENT_SQL + " END",
+    "CREATE TRIGGER IF NOT EXISTS trg_media_counts_update "
+    "AFTER UPDATE OF file_type, group_code ON media_data "
+    "BEGIN " + _COUNT_DECREMENT_SQL + " " + _COUNT_INCREMENT_SQL + " END",
+]
+
+# 目录版本号：media_data的任何写入都会使版本号加1，API缓存以此判断数据是否变化
+CREATE_CATALOG_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+_VERSION_BUMP_SQL = "UPDATE catalog_version SET version = version + 1 WHERE id = 1;"
+
+VERSION_TRIGGER_SQLS = [
+    "CREATE TRIGGER IF NOT EXISTS trg_catalog_version_insert AFTER INSERT ON media_data "
+    "BEGIN " + _VERSION_BUMP_SQL + " END",
+    "CREATE TRIGGER IF NOT EXISTS trg_catalog_version_delete AFTER DELETE ON media_data "
+    "BEGIN " + _VERSION_BUMP_SQL + " END",
+    "CREATE TRIGGER IF NOT EXISTS trg_catalog_version_update AFTER UPDATE ON media_data "
+    "BEGIN " + _VERSION_BUMP_SQL + " END",
+]
+
+# 写入时未提供media_kind的行（如README中从media_metadata整表复制）由触发器补齐
+MEDIA_KIND_TRIGGER_SQLS = [
+    "CREATE TRIGGER IF NOT EXISTS trg_media_kind_insert AFTER INSERT ON media_data "
+    "WHEN NEW.media_kind IS NULL BEGIN "
+    "UPDATE media_data SET media_kind = " + MEDIA_KIND_EXPR.format(row='NEW') +
+    " WHERE media_id = NEW.media_id; END",
+    "CREATE TRIGGER IF NOT EXISTS trg_media_kind_update AFTER UPDATE OF file_type ON media_data "
+    "BEGIN "
+    "UPDATE media_data SET media_kind = " + MEDIA_KIND_EXPR.format(row='NEW') +
+    " WHERE media_id = NEW.media_id; END",
+]
+
+def media_kind_of(file_type):
+    """由MIME类型得到媒体类别：video / image / other（与MEDIA_KIND_EXPR一致）"""
+    if file_type and file_type.lower().startswith('video/'):
+        return 'video'
+    if file_type and file_type.lower().startswith('image/'):
+        return 'image'
+    return 'other'
+
+def column_exists(conn, table_name, column_name):
+    """判断表中是否存在指定列"""
+    return any(row[1] == column_name for row in conn.execute(f"PRAGMA table_info({table_name})"))
+
+def migrate_media_kind(conn):
+    """为旧库增加media_kind列并回填已有数据"""
+    if column_exists(conn, 'media_data', 'media_kind'):
+        return
+    conn.execute("ALTER TABLE media_data ADD COLUMN media_kind TEXT")
+    conn.execute(
+        "UPDATE media_data SET media_kind = " + MEDIA_KIND_EXPR.format(row='media_data')
+    )
+
+# 增量导入用于判断文件是否变化的stat信息列
+FILE_STAT_COLUMNS = [
+    ('file_mtime_ns', 'INTEGER'),  # 修改时间(纳秒)
+    ('file_inode', 'INTEGER'),     # inode编号
+]
+
+def ensure_columns(conn, table_name, columns):
+    """为指定表补齐缺少的列（旧库迁移）"""
+    for column_name, column_type in columns:
+        if not column_exists(conn, table_name, column_name):
+            conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+
+def ensure_file_stat_columns(conn, table_name):
+    """为指定表补齐增量导入需要的stat信息列（旧库迁移）"""
+    ensure_columns(conn, table_name, FILE_STAT_COLUMNS)
+
+# ffprobe/EXIF提取的媒体信息列（media_probe.py写入）
+PROBE_COLUMNS = [
+    ('duration', 'REAL'),           # 时长(秒)
+    ('width', 'INTEGER'),           # 显示宽度（已按旋转方向换算）
+    ('height', 'INTEGER'),          # 显示高度
+    ('codec', 'TEXT'),              # 视频编码或图片格式
+    ('bitrate', 'INTEGER'),         # 码率(bit/s)
+    ('orientation', 'INTEGER'),     # 顺时针旋转角度：0/90/180/270
+    ('probe_size', 'INTEGER'),      # 提取时的文件大小，与file_size不同说明需要重新提取
+    ('probe_mtime_ns', 'INTEGER'),  # 提取时的修改时间
+]
+
+# 感知哈希（media_phash.py写入）：图片1个、视频若干个采样帧的64位pHash/dHash，
+# pHash按16位切成4段分别建索引（multi-index hashing），汉明距离查询只需按段查找
+PHASH_BANDS = 4
+PHASH_BAND_BITS = 16
+
+CREATE_MEDIA_PHASH_SQL = """
+CREATE TABLE IF NOT EXISTS media_phash (
+    media_id INTEGER NOT NULL,   -- media_data.media_id
+    frame INTEGER NOT NULL,      -- 图片为0，视频为采样帧序号1..N（只与同序号的帧比较）
+    phash INTEGER NOT NULL,      -- 64位pHash（按有符号整数存储）
+    dhash INTEGER NOT NULL,      -- 64位dHash
+    band0 INTEGER NOT NULL,      -- pHash的第0~15位
+    band1 INTEGER NOT NULL,      -- 第16~31位
+    band2 INTEGER NOT NULL,      -- 第32~47位
+    band3 INTEGER NOT NULL,      -- 第48~63位
+    PRIMARY KEY (media_id, frame)
+) WITHOUT ROWID
+"""
+
+PHASH_INDEX_SQLS = [
+    f"CREATE INDEX IF NOT EXISTS idx_phash_band{band} ON media_phash(band{band})"
+    for band in range(PHASH_BANDS)
+]
+
+# media_data中的记录删除后，对应的感知哈希一并删除
+PHASH_TRIGGER_SQLS = [
+    "CREATE TRIGGER IF NOT EXISTS trg_media_phash_delete AFTER DELETE ON media_data BEGIN "
+    "DELETE FROM media_phash WHERE media_id = OLD.media_id; END",
+]
+
+# 计算感知哈希时的文件大小和修改时间，与file_size/file_mtime_ns不同说明需要重新计算
+PHASH_COLUMNS = [
+    ('phash_size', 'INTEGER'),
+    ('phash_mtime_ns', 'INTEGER'),
+]
+
+def table_exists(conn, table_name):
+    """判断表是否存在"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table_name,)
+    ).fetchone()
+    return row is not None
+
+def rebuild_media_counts(conn):
+    """根据media_data全量重建media_counts（用于初始化或校正）"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM media_counts")
+    cursor.execute(
+        "INSERT INTO media_counts (media_kind, group_code, file_count) "
+        "SELECT " + MEDIA_KIND_EXPR.format(row='media_data') + " AS kind, "
+        "IFNULL(group_code, '') AS code, COUNT(*) "
+        "FROM media_data GROUP BY kind, code"
+    )
+    conn.commit()
+
+def count_media(conn, media_kind=None, group_code=None):
+    """
+    从media_counts读取文件数
+    :param media_kind: 可选，'video'或'image'
+    :param group_code: 可选，按group_code筛选
+    :return: 文件总数
+    """
+    query = "SELECT IFNULL(SUM(file_count), 0) FROM media_counts WHERE 1=1"
+    params = []
+    if media_kind:
+        query += " AND media_kind = ?"
+        params.append(media_kind)
+    if group_code:
+        query += " AND group_code = ?"
+        params.append(group_code)
+    return conn.execute(query, params).fetchone()[0]
+
+# 文件名/文件夹全文检索（FTS5 trigram分词，支持中文等任意子串匹配），
+# 以media_data为外部内容表，通过触发器保持同步
+CREATE_MEDIA_SEARCH_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS media_search USING fts5("
+    "file_name, parent_folder, content='media_data', content_rowid='media_id', "
+    "tokenize='trigram')"
+)
+
+SEARCH_TRIGGER_SQLS = [
+    "CREATE TRIGGER IF NOT EXISTS trg_media_search_insert AFTER INSERT ON media_data BEGIN "
+    "INSERT INTO media_search (rowid, file_name, parent_folder) "
+    "VALUES (NEW.media_id, NEW.file_name, NEW.parent_folder); END",
+    "CREATE TRIGGER IF NOT EXISTS trg_media_search_delete AFTER DELETE ON media_data BEGIN "
+    "INSERT INTO media_search (media_search, rowid, file_name, parent_folder) "
+    "VALUES ('delete', OLD.media_id, OLD.file_name, OLD.parent_folder); END",
+    "CREATE TRIGGER IF NOT EXISTS trg_media_search_update "
+    "AFTER UPDATE OF file_name, parent_folder ON media_data BEGIN "
+    "INSERT INTO media_search (media_search, rowid, file_name, parent_folder) "
+    "VALUES ('delete', OLD.media_id, OLD.file_name, OLD.parent_folder); "
+    "INSERT INTO media_search (rowid, file_name, parent_folder) "
+    "VALUES (NEW.media_id, NEW.file_name, NEW.parent_folder); END",
+]
+
+def ensure_search_index(conn):
+    """
+    创建全文检索表及同步触发器，首次创建时从media_data全量构建
+    SQLite不支持FTS5或trigram分词（3.34以下）时跳过
+    :return: 检索是否可用
+    """
+    if table_exists(conn, 'media_search'):
+        # 触发器可能在批量导入时被删除，补齐即可（索引内容由调用方负责重建）
+        for sql in SEARCH_TRIGGER_SQLS:
+            conn.execute(sql)
+        conn.commit()
+        return True
+    try:
+        conn.execute(CREATE_MEDIA_SEARCH_SQL)
+    except sqlite3.OperationalError:
+        return False
+    for sql in SEARCH_TRIGGER_SQLS:
+        conn.execute(sql)
+    conn.execute("INSERT INTO media_search (media_search) VALUES ('rebuild')")
+    conn.commit()
+    return True
+
+# 批量导入：首次建库时先删除二级索引和逐行维护的触发器，导入完成后统一重建。
+# 标记表存在说明批量导入正在进行或尚未收尾（包括中途崩溃）：此时ensure_schema不做任何修改，
+# 只由导入脚本通过finish_bulk_load收尾（导入结束时，或 --finish-bulk）
+BULK_LOAD_MARKER_TABLE = 'catalog_bulk_load'
+
+# 批量导入期间删除的触发器：计数、全文检索、版本号都改为导入结束后一次性重建
+BULK_DEFERRED_TRIGGER_SQLS = COUNT_TRIGGER_SQLS + SEARCH_TRIGGER_SQLS + VERSION_TRIGGER_SQLS
+
+def _object_name(create_sql):
+    """从 CREATE INDEX/TRIGGER IF NOT EXISTS <name> ... 语句中取出对象名"""
+    return create_sql.split()[5]
+
+def apply_bulk_pragmas(conn):
+    """
+    批量写入连接的设置：WAL、加大缓存，索引排序使用内存临时表
+    WAL模式下synchronous=NORMAL提交时不再fsync，只在检查点时同步，断电或硬盘被拔出也不会损坏数据库
+    """
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -262144")  # 256MB
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+def begin_bulk_load(conn):
+    """
+    进入批量导入模式：删除二级索引（保留file_path唯一索引，UPSERT依赖它）
+    和逐行维护的触发器
+    """
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {BULK_LOAD_MARKER_TABLE} (id INTEGER PRIMARY KEY)")
+    for sql in INDEX_SQLS:
+        conn.execute(f"DROP INDEX IF EXISTS {_object_name(sql)}")
+    for sql in BULK_DEFERRED_TRIGGER_SQLS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {_object_name(sql)}")
+    conn.commit()
+
+def _complete_bulk_load(conn):
+    """重建批量导入期间跳过的汇总数据并更新统计信息（索引和触发器已由ensure_schema重建）"""
+    rebuild_media_counts(conn)
+    if table_exists(conn, 'media_search'):
+        conn.execute("INSERT INTO media_search (media_search) VALUES ('rebuild')")
+    bump_catalog_version(conn)
+    conn.execute(f"DROP TABLE {BULK_LOAD_MARKER_TABLE}")
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+
+def is_bulk_loading(conn):
+    """批量导入是否正在进行或尚未收尾"""
+    return table_exists(conn, BULK_LOAD_MARKER_TABLE)
+
+def finish_bulk_load(conn):
+    """结束批量导入模式：重建索引和触发器、汇总表、全文检索，执行ANALYZE（只应由导入脚本调用）"""
+    ensure_schema(conn, finish_bulk=True)
+
+def get_catalog_version(conn):
+    """读取当前目录版本号"""
+    row = conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+def bump_catalog_version(conn):
+    """手动将目录版本号加1（用于触发器覆盖不到的变化，调用方负责提交）"""
+    conn.execute(_VERSION_BUMP_SQL)
+
+def ensure_schema(conn, finish_bulk=False):
+    """
+    确保media_data表、索引、目录版本号、计数汇总表、感知哈希表以及全文检索表存在
+    批量导入进行中时直接返回，不在导入期间重建索引和触发器
+    :param conn: sqlite3连接
+    :param finish_bulk: 由finish_bulk_load传入，重建后结束批量导入模式
+    """
+    if not finish_bulk and is_bulk_loading(conn):
+        return
+    cursor = conn.cursor()
+    cursor.execute(CREATE_MEDIA_DATA_SQL)
+    migrate_media_kind(conn)
+    ensure_file_stat_columns(conn, 'media_data')
+    ensure_columns(conn, 'media_data', PROBE_COLUMNS)
+    ensure_columns(conn, 'media_data', PHASH_COLUMNS)
+    for sql in INDEX_SQLS:
+        cursor.execute(sql)
+    cursor.execute(CREATE_MEDIA_PHASH_SQL)
+    for sql in PHASH_INDEX_SQLS + PHASH_TRIGGER_SQLS:
+        cursor.execute(sql)
+    for sql in MEDIA_KIND_TRIGGER_SQLS:
+        cursor.execute(sql)
+
+    cursor.execute(CREATE_CATALOG_VERSION_SQL)
+    cursor.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)")
+    for sql in VERSION_TRIGGER_SQLS:
+        cursor.execute(sql)
+
+    counts_missing = not table_exists(conn, 'media_counts')
+    cursor.execute(CREATE_MEDIA_COUNTS_SQL)
+    for sql in COUNT_TRIGGER_SQLS:
+        cursor.execute(sql)
+    conn.commit()
+    if counts_missing:
+        rebuild_media_counts(conn)
+    ensure_search_index(conn)
+    if finish_bulk and is_bulk_loading(conn):
+        _complete_bulk_load(conn)
+
+def ensure_schema_at(db_path):
+    """打开指定路径的数据库并确保表结构存在"""
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_schema(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,211 @@
+"""
+多硬盘目录分片
+
+每个硬盘（卷）一个独立的数据库文件（分片），各自导入、互不锁定；
+app.py 通过 ATTACH DATABASE 把在线的分片挂到同一个连接上联合查询。
+
+分片配置为JSON文件，按顺序列出每个分片:
+    [
+        {"name": "store", "root": "/Volumes/STORE", "db": "/Users/lee/sqlite3/shards/store.db"},
+        {"name": "backup", "root": "/Volumes/BACKUP", "db": "/Users/lee/sqlite3/shards/backup.db"}
+    ]
+分片在列表中的位置即分片序号，用于生成全局唯一的media_id（media_id * SHARD_ID_STRIDE + 序号），
+因此已有分片的顺序不要调整，新硬盘追加到末尾。
+同时在线的分片数受SQLite的ATTACH上限限制（SQLITE_MAX_ATTACHED，默认10）。
+
+联合查询时在连接上创建同名的临时视图 media_data / media_counts / media_phash / catalog_version，
+临时视图优先于main中的同名表，原有的单库查询语句无需修改即可跨分片执行；
+需要分页的热点查询另外按分片生成"各分片排序取前N条再合并"的语句（见app.py）。
+"""
+import json
+import os
+import sqlite3
+import zlib
+
+import catalog_schema
+
+# 全局media_id = 分片内media_id * SHARD_ID_STRIDE + 分片序号
+SHARD_ID_STRIDE = 64
+# 挂载到连接上的库名前缀：shard_0、shard_1...
+SCHEMA_PREFIX = 'shard_'
+# 检查分片schema时的锁等待时间（秒），分片正在导入时不阻塞查询
+PREPARE_TIMEOUT = 1
+
+def load_shards(config_path):
+    """
+    读取分片配置
+    :return: [{'index', 'name', 'root', 'db'}]
+    :raises ValueError: 配置格式无效
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"分片配置 {config_path} 应为列表")
+    if len(entries) > SHARD_ID_STRIDE:
+        raise ValueError(f"分片数量不能超过 {SHARD_ID_STRIDE}")
+    shards = []
+    names = set()
+    for index, entry in enumerate(entries):
+        try:
+            name, root, db = entry['name'], entry['root'], entry['db']
+        except (KeyError, TypeError):
+            raise ValueError(f"分片配置第 {index + 1} 项缺少name/root/db")
+        if name in names:
+            raise ValueError(f"分片名称重复: {name}")
+        names.add(name)
+        shards.append({
+            'index': index,
+            'name': name,
+            'root': os.path.abspath(os.path.expanduser(root)),
+            'db': os.path.abspath(os.path.expanduser(db)),
+        })
+    return shards
+
+def find_shard(shards, name):
+    """按名称查找分片，不存在时返回None"""
+    return next((shard for shard in shards if shard['name'] == name), None)
+
+def is_shard_online(shard):
+    """硬盘已挂载（根目录存在）且分片数据库文件存在"""
+    return os.path.isdir(shard['root']) and os.path.isfile(shard['db'])
+
+def prepare_shard(shard):
+    """
+    检查分片是否可以参与查询，并确保表结构是最新的
+    批量导入尚未收尾的分片（没有二级索引）暂不参与查询，由导入脚本负责收尾；
+    分片正被导入锁定时同样跳过，下次检查时再试
+    :return: 是否可用
+    """
+    try:
+        conn = sqlite3.connect(shard['db'], timeout=PREPARE_TIMEOUT)
+        try:
+            if catalog_schema.is_bulk_loading(conn):
+                print(f"分片 {shard['name']} 正在批量导入，暂不参与查询")
+                return False
+            catalog_schema.ensure_schema(conn)
+            conn.execute("PRAGMA journal_mode=WAL")
+            return True
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"分片 {shard['name']} 暂不可用: {e}")
+        return False
+
+def schema_name(shard):
+    return f"{SCHEMA_PREFIX}{shard['index']}"
+
+def attached_shards(conn):
+    """
+    连接上已挂载的分片
+    :return: [(分片序号, 库名)]，按序号排序；未使用分片时为空列表
+    """
+    shards = []
+    for row in conn.execute("PRAGMA database_list"):
+        name = row[1]
+        if name.startswith(SCHEMA_PREFIX) and name[len(SCHEMA_PREFIX):].isdigit():
+            shards.append((int(name[len(SCHEMA_PREFIX):]), name))
+    return sorted(shards)
+
+def shard_set_signature(indexes):
+    """在线分片组合的标识，计入联合版本号：分片上下线后缓存和ETag随之失效"""
+    # 放在高位，低31位留给各分片版本号之和；总值不超过SQLite的64位整数范围
+    key = ','.join(str(index) for index in sorted(indexes))
+    return (zlib.crc32(key.encode('ascii')) & 0x7FFFFFFF) << 31
+
+def is_db_on_volume(shard):
+    """分片数据库是否放在该硬盘上（随硬盘一起拔出）"""
+    return os.path.commonpath([shard['db'], shard['root']]) == shard['root']
+
+def attach_shards(conn, shards, cache_size_kb=None, mmap_size=0):
+    """
+    把分片挂到连接上，并创建跨分片的临时视图
+    main库需要已有media_data等表（用于确定列顺序；没有分片在线时查询的就是这些空表）
+    :param shards: 在线的分片列表
+    :param cache_size_kb: 每个分片的页缓存大小（cache_size、mmap_size只对单个库生效）
+    :param mmap_size: 内存映射读取的大小；数据库在可移动硬盘上时不使用mmap，
+                      硬盘被拔出后访问映射内存会导致进程收到SIGBUS
+    """
+    for shard in shards:
+        name = schema_name(shard)
+        conn.execute("ATTACH DATABASE ? AS " + name, (shard['db'],))
+        if cache_size_kb:
+            conn.execute(f"PRAGMA {name}.cache_size=-{int(cache_size_kb)}")
+        if mmap_size and not is_db_on_volume(shard):
+            conn.execute(f"PRAGMA {name}.mmap_size={int(mmap_size)}")
+    if shards:
+        create_federated_views(conn, [(shard['index'], schema_name(shard)) for shard in shards])
+
+def create_federated_views(conn, attached):
+    """
+    创建跨分片的临时视图（视图中的media_id已换算为全局id）
+    :param attached: [(分片序号, 库名)]
+    """
+    def create_media_view(table):
+        columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+
+        def arm(index, name):
+            select = ', '.join(
+                f"media_id * {SHARD_ID_STRIDE} + {index} AS media_id" if column == 'media_id' else column
+                for column in columns
+            )
+            return f"SELECT {select} FROM {name}.{table}"
+
+        conn.execute(
+            f"CREATE TEMP VIEW {table} AS " +
+            " UNION ALL ".join(arm(index, name) for index, name in attached)
+        )
+
+    create_media_view('media_data')
+    create_media_view('media_phash')
+    conn.execute(
+        "CREATE TEMP VIEW media_counts AS " +
+        " UNION ALL ".join(
+            f"SELECT media_kind, group_code, file_count FROM {name}.media_counts"
+            for _, name in attached
+        )
+    )
+    signature = shard_set_signature(index for index, _ in attached)
+    conn.execute(
+        f"CREATE TEMP VIEW catalog_version AS SELECT 1 AS id, {signature} + SUM(version) AS version "
+        "FROM (" + " UNION ALL ".join(
+            f"SELECT version FROM {name}.catalog_version WHERE id = 1" for _, name in attached
+        ) + ")"
+    )
+
+def to_local_id(global_id, index):
+    """
+    把全局media_id换算为分片index内的上界：
+    分片内 local_id < 返回值 等价于 全局 local_id * SHARD_ID_STRIDE + index < global_id
+    """
+    return -((index - global_id) // SHARD_ID_STRIDE)
+
+def select_by_media_ids(conn, table, columns, media_ids, chunk_size=500):
+    """
+    按media_id批量查询media_data/media_phash
+    联合视图中的media_id是换算后的表达式，按它筛选无法使用主键，因此挂载了分片时换算为各分片内的id分别查询
+    :param columns: 除media_id外要查询的列（SQL片段）
+    :return: 行列表，第一列为media_id（全局id，列名为media_id）
+    """
+    shards = dict(attached_shards(conn))
+    groups = {}
+    for media_id in media_ids:
+        if shards:
+            groups.setdefault(media_id % SHARD_ID_STRIDE, []).append(media_id // SHARD_ID_STRIDE)
+        else:
+            groups.setdefault(None, []).append(media_id)
+    rows = []
+    for index, ids in groups.items():
+        if index is None:
+            source, id_column = table, "media_id"
+        elif index in shards:
+            source, id_column = f"{shards[index]}.{table}", f"media_id * {SHARD_ID_STRIDE} + {index} AS media_id"
+        else:
+            continue
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            rows.extend(conn.execute(
+                f"SELECT {id_column}, {columns} FROM {source} "
+                f"WHERE media_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ))
+    return rows
@@ -0,0 +1,222 @@
+"""
+分阶段查找重复文件：文件大小 -> 头尾采样哈希 -> 完整哈希
+
+1. 按文件大小分组，大小唯一的文件不可能重复，不读取内容
+2. 大小相同的文件读取开头和结尾各 sample_size 字节计算采样哈希（--sample-blocks 可增加中间的采样块）
+   （文件不大于全部采样块时采样哈希就是完整哈希，不需要第3步）
+3. 采样哈希仍然相同的文件，分块读取整个文件计算完整哈希（不会整个读入内存）
+
+大部分文件大小唯一，读取量通常只有全部文件大小的很小一部分，结束时会输出实际读取的字节数。
+同一文件的硬链接（相同设备和inode）只保留一个路径，软链接不参与比较。
+
+用法:
+    python duplicate_finder.py /Volumes/STORE/sex_files/tg
+    python duplicate_finder.py /Volumes/STORE/sex_files/tg --report duplicates.json
+报告可交给 duplicate_resolver.py 按保留策略删除或替换为硬链接/克隆
+"""
+import argparse
+import concurrent.futures
+import json
+from collections import defaultdict
+
+import hash_cache
+import hash_engine
+import import_metrics
+import media_walker
+
+DEFAULT_ALGORITHM = 'md5'
+# 采样块大小：开头和结尾各读取这么多字节
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_BLOCKS = 2
+
+def collect_files(root_dirs, min_size=1, stats=None, **walk_options):
+    """
+    遍历目录，按文件大小分组
+    :param walk_options: 传给media_walker.walk_files的过滤参数（suffixes、predicate、skip_hidden等）
+    :param min_size: 小于该大小的文件不参与比较（默认跳过空文件）
+    :param stats: 可选，统计信息字典，累加 'files'、'total_bytes'、'hardlinks'
+    :return: {文件大小: [(file_path, stat_result)]}
+    """
+    stats = stats if stats is not None else {}
+    for key in ('files', 'total_bytes', 'hardlinks'):
+        stats.setdefault(key, 0)
+    by_size = defaultdict(list)
+    seen_inodes = set()
+    for root_dir in root_dirs:
+        for entry in media_walker.walk_files(root_dir, **walk_options):
+            try:
+                if entry.is_symlink():
+                    continue
+                stat_info = entry.stat()
+            except OSError as e:
+                print(f"读取文件信息 {entry.path} 时出错: {e}")
+                continue
+            if stat_info.st_size < min_size:
+                continue
+            inode = (stat_info.st_dev, stat_info.st_ino)
+            if inode in seen_inodes:
+                # 硬链接本来就共用存储，不算重复
+                stats['hardlinks'] += 1
+                continue
+            seen_inodes.add(inode)
+            stats['files'] += 1
+            stats['total_bytes'] += stat_info.st_size
+            by_size[stat_info.st_size].append((entry.path, stat_info))
+    return by_size
+
+def _regroup(engine, candidates, hash_func, workers):
+    """
+    并发计算哈希，把每组候选文件按(原分组键, 哈希值)重新分组，只保留仍有多个文件的组
+    :param candidates: {分组键: [(file_path, stat_result)]}
+    :return: {(分组键, 哈希值): [(file_path, stat_result)]}
+    """
+    items = [(key, item) for key, group in candidates.items() for item in group]
+    groups = defaultdict(list)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        digests = executor.map(lambda pair: hash_func(*pair[1]), items)
+        for (key, item), digest in zip(items, digests):
+            if digest is not None:
+                groups[(key, digest)].append(item)
+    return {key: group for key, group in groups.items() if len(group) > 1}
+
+def _counter(engine, name):
+    """引擎上记录的计数（没有metrics时返回None，改用按文件大小估算的读取量）"""
+    if engine.metrics is None:
+        return None
+    return engine.metrics.counters.get(name, 0)
+
+def find_duplicate_groups(root_dirs, engine=None, sample_size=SAMPLE_SIZE, sample_blocks=SAMPLE_BLOCKS,
+                          min_size=1,
+                          **walk_options):
+    """
+    分阶段查找重复文件
+    :param root_dirs: 要扫描的目录列表
+    :param engine: 可选，HashEngine（由调用方关闭），默认使用md5和共享哈希缓存（结束时关闭）；
+                   带metrics时按实际读取量统计
+    :param sample_size: 采样块大小
+    :param sample_blocks: 采样块数（均匀分布，含头尾）
+    :param min_size: 小于该大小的文件不参与比较
+    :param walk_options: 遍历过滤参数，如suffixes=('.mp4',)、predicate=func，见media_walker.walk_dirs
+    :return: (重复文件组列表 [{'digest', 'size', 'paths'}]，统计信息)
+             digest为完整文件的哈希值；统计信息中bytes_read为实际读取的字节数（命中哈希缓存的文件不读取）
+    """
+    if engine is None:
+        # 自己创建的引擎用完即关闭，保证哈希缓存中攒批的记录写入磁盘
+        with hash_engine.HashEngine(algorithm=DEFAULT_ALGORITHM, cache=hash_cache.HashCache(),
+                                    metrics=import_metrics.PipelineMetrics()) as engine:
+            return find_duplicate_groups(root_dirs, engine, sample_size, sample_blocks, min_size,
+                                         **walk_options)
+    workers = engine.workers
+    stats = {}
+    by_size = collect_files(root_dirs, min_size, stats, **walk_options)
+
+    # 第1步：大小相同的才可能重复
+    size_groups = {size: group for size, group in by_size.items() if len(group) > 1}
+    stats['size_candidates'] = sum(len(group) for group in size_groups.values())
+
+    # 第2步：头尾采样哈希
+    sample_window = sample_blocks * sample_size
+    bytes_before = _counter(engine, 'bytes_read')
+    sampled = _regroup(
+        engine, size_groups,
+        lambda path, stat_info: engine.hash_sample(path, stat_info, block_size=sample_size,
+                                                     blocks=sample_blocks),
+        workers
+    )
+    bytes_after = _counter(engine, 'bytes_read')
+    if bytes_before is None:
+        stats['sample_bytes_read'] = sum(
+            min(size, sample_window) * len(group) for size, group in size_groups.items()
+        )
+    else:
+        stats['sample_bytes_read'] = bytes_after - bytes_before
+    stats['sample_candidates'] = sum(len(group) for group in sampled.values())
+
+    # 第3步：采样覆盖不了整个文件的，计算完整哈希
+    duplicates = []
+    need_full = {}
+    for (size, digest), group in sampled.items():
+        if size <= sample_window:
+            duplicates.append({'digest': digest, 'size': size, 'paths': [path for path, _ in group]})
+        else:
+            need_full[(size, digest)] = group
+    full = _regroup(
+        engine, need_full,
+        lambda path, stat_info: engine.hash_file(path, stat_info, max_bytes=None),
+        workers
+    )
+    if bytes_after is None:
+        stats['full_bytes_read'] = sum(size * len(group) for (size, _), group in need_full.items())
+    else:
+        stats['full_bytes_read'] = _counter(engine, 'bytes_read') - bytes_after
+    for ((size, _), digest), group in full.items():
+        duplicates.append({'digest': digest, 'size': size, 'paths': [path for path, _ in group]})
+
+    duplicates.sort(key=lambda group: group['size'] * (len(group['paths']) - 1), reverse=True)
+    stats['groups'] = len(duplicates)
+    stats['duplicate_files'] = sum(len(group['paths']) - 1 for group in duplicates)
+    stats['reclaimable_bytes'] = sum(group['size'] * (len(group['paths']) - 1) for group in duplicates)
+    stats['bytes_read'] = stats['sample_bytes_read'] + stats['full_bytes_read']
+    stats['cache_hits'] = _counter(engine, 'cache_hits') or 0
+    return duplicates, stats
+
+def format_bytes(num_bytes):
+    """把字节数格式化为易读的字符串"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f}{unit}" if unit != 'B' else f"{num_bytes}B"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f}TB"
+
+def print_stats(stats):
+    """打印各阶段的文件数和读取量"""
+    total = stats['total_bytes']
+    ratio = stats['bytes_read'] / total * 100 if total else 0
+    print(f"共 {stats['files']} 个文件，{format_bytes(total)}（另有 {stats['hardlinks']} 个硬链接未比较）")
+    print(f"大小相同: {stats['size_candidates']} 个，采样哈希相同: {stats['sample_candidates']} 个")
+    print(f"实际读取 {format_bytes(stats['bytes_read'])}（{ratio:.3f}%）："
+          f"采样 {format_bytes(stats['sample_bytes_read'])}，完整 {format_bytes(stats['full_bytes_read'])}，"
+          f"命中哈希缓存 {stats['cache_hits']} 次")
+    print(f"重复文件 {stats['duplicate_files']} 个（{stats['groups']} 组），"
+          f"可释放 {format_bytes(stats['reclaimable_bytes'])}")
+
+def write_report(report_path, duplicates, stats, algorithm):
+    """把重复文件组写为JSON报告"""
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'algorithm': algorithm, 'groups': duplicates, 'stats': stats},
+                  f, ensure_ascii=False, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="按 大小 -> 采样哈希 -> 完整哈希 分阶段查找重复文件")
+    parser.add_argument('root_dirs', nargs='+', help="要扫描的目录")
+    parser.add_argument('--suffix', action='append', default=None,
+                        help="只比较这些后缀的文件（可重复指定，如 --suffix .mp4 --suffix .jpg）")
+    parser.add_argument('--algorithm', default=DEFAULT_ALGORITHM,
+                        help="哈希算法：hashlib算法名、xxh3_128等（需安装xxhash）或fast（非加密快速哈希）")
+    parser.add_argument('--sample-size', type=int, default=SAMPLE_SIZE, help="头尾采样块大小(字节)")
+    parser.add_argument('--sample-blocks', type=int, default=SAMPLE_BLOCKS, help="采样块数（均匀分布，含头尾）")
+    parser.add_argument('--min-size', type=int, default=1, help="小于该大小的文件不参与比较")
+    parser.add_argument('--report', default=None, help="把重复文件组写入该JSON文件")
+    hash_engine.add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    with hash_engine.engine_from_args(args, algorithm=args.algorithm,
+                                          metrics=import_metrics.PipelineMetrics()) as engine:
+        duplicates, stats = find_duplicate_groups(
+            args.root_dirs, suffixes=args.suffix, engine=engine,
+            sample_size=args.sample_size, sample_blocks=args.sample_blocks,
+            min_size=args.min_size
+        )
+    algorithm = engine.algorithm
+    for group in duplicates:
+        print(f"\n{algorithm}:{group['digest']}  {format_bytes(group['size'])}")
+        for path in group['paths']:
+            print(f"- {path}")
+    print()
+    print_stats(stats)
+    if args.report:
+        write_report(args.report, duplicates, stats, algorithm)
+        print(f"报告已写入 {args.report}")
+
+if __name__ == "__main__":
+    main()
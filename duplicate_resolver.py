@@ -0,0 +1,413 @@
+"""
+处理重复文件：读取查找重复文件的报告，按保留策略生成处理计划并执行，同时更新目录数据库
+
+报告:
+    duplicate_finder.py --report 生成的完全相同文件组 {"algorithm", "groups": [{"digest", "size", "paths"}]}
+    media_phash.py --report 生成的近似文件组 {"kind": "perceptual", "groups": [{"paths", "max_distance"}]}
+    （近似文件内容不同，只能删除，不能链接或克隆；组是相连文件对的连通分量，A~B、B~C时A与C可能相差很远，
+    因此只删除与保留文件的距离不超过报告阈值的文件，距离按数据库media_phash中当前文件版本的感知哈希计算）
+
+保留策略（每组保留一个文件，其余按处理方式处理）:
+    oldest     修改时间最早的（通常是原始文件），相同时取路径最短的
+    shortest   路径最短的
+    root       位于 --prefer-root 指定目录下的（按指定顺序优先），都不在时取最早的
+
+处理方式:
+    delete     删除重复文件
+    hardlink   把重复文件替换为保留文件的硬链接（必须在同一个卷上），原路径仍可访问
+    reflink    把重复文件替换为保留文件的写时复制克隆（APFS/Btrfs/XFS等），原路径仍可访问且可以各自修改
+
+执行前会重新检查每个文件：大小、修改时间、inode与生成计划时不同则跳过；
+完全相同的文件组还会计算保留文件和重复文件的完整哈希（使用共享哈希缓存），与报告不一致时跳过。
+硬链接/克隆先在同目录写临时文件，再原子替换重复文件，失败时原文件保持不变。
+全部文件处理完后，在一个事务中删除或更新media_data中对应的记录。
+
+用法:
+    python duplicate_resolver.py duplicates.json --keep oldest --action hardlink --dry-run
+    python duplicate_resolver.py duplicates.json --keep root --prefer-root /Volumes/STORE --action delete --db media_player.db
+    python duplicate_resolver.py duplicates.json --keep shortest --action reflink --shards shards.json
+"""
+import argparse
+import concurrent.futures
+import ctypes
+import ctypes.util
+import json
+import os
+import sqlite3
+import stat
+import sys
+
+import catalog_shards
+import hash_engine
+import media_phash
+from duplicate_finder import format_bytes
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DATABASE_PATH = '/Users/lee/sqlite3/media_player.db'
+
+KEEP_POLICIES = ('oldest', 'shortest', 'root')
+ACTIONS = ('delete', 'hardlink', 'reflink')
+PERCEPTUAL_KIND = 'perceptual'
+# 删除、链接、克隆都只修改文件系统元数据，可以多个并行；完整哈希校验的读取并发由HashEngine控制
+RESOLVE_WORKERS = 8
+# Linux的FICLONE ioctl（_IOW(0x94, 9, int)）
+FICLONE = 0x40049409
+TEMP_SUFFIX = '.dedup-tmp'
+
+def load_report(report_path):
+    """
+    读取重复文件报告
+    :return: (报告, 是否为近似文件报告)
+    :raises ValueError: 格式无效
+    """
+    with open(report_path, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    if not isinstance(report, dict) or not isinstance(report.get('groups'), list):
+        raise ValueError(f"{report_path} 不是重复文件报告（缺少groups）")
+    return report, report.get('kind') == PERCEPTUAL_KIND
+
+def is_under(path, root):
+    return os.path.commonpath([path, root]) == root
+
+def keep_sort_key(policy, prefer_roots):
+    """
+    :return: 对 (file_path, stat_result) 排序的键函数，排在最前的文件被保留
+    """
+    def oldest(item):
+        path, stat_info = item
+        return stat_info.st_mtime_ns, len(path), path
+
+    if policy == 'oldest':
+        return oldest
+    if policy == 'shortest':
+        return lambda item: (len(item[0]), item[0])
+
+    def preferred(item):
+        rank = next((i for i, root in enumerate(prefer_roots) if is_under(item[0], root)), len(prefer_roots))
+        return (rank,) + oldest(item)
+    return preferred
+
+def reclaimable_bytes(stat_info):
+    """处理一个重复文件能释放的空间：还有其他硬链接时数据仍被引用，不释放"""
+    return stat_info.st_size if stat_info.st_nlink <= 1 else 0
+
+def build_plan(groups, policy='oldest', action='delete', prefer_roots=(), distance=None, max_distance=None):
+    """
+    生成处理计划（只读取文件信息，不修改文件）
+    :param groups: 报告中的文件组 [{'paths', 'digest'?, 'size'?}]
+    :param prefer_roots: root策略优先保留的目录
+    :param distance: 近似文件报告使用，(保留路径, 保留stat, 路径, stat) -> 距离或None（无法比较）
+    :param max_distance: 与保留文件的距离超过该值（或无法比较）的文件不处理
+    :return: (计划 [{'keep', 'keep_stat', 'digest', 'items': [{'path', 'stat', 'bytes', 'distance'}]}]，统计信息)
+             bytes为处理该文件能释放的空间
+    """
+    prefer_roots = [os.path.abspath(root) for root in prefer_roots]
+    sort_key = keep_sort_key(policy, prefer_roots)
+    stats = {'groups': 0, 'actions': 0, 'missing': 0, 'already_linked': 0, 'cross_device': 0,
+             'too_far': 0, 'bytes_reclaimed': 0}
+    plan = []
+    for group in groups:
+        files = []
+        for path in group['paths']:
+            try:
+                stat_info = os.stat(path, follow_symlinks=False)
+            except OSError:
+                stats['missing'] += 1
+                continue
+            if not stat.S_ISREG(stat_info.st_mode):
+                stats['missing'] += 1
+                continue
+            files.append((os.path.abspath(path), stat_info))
+        if len(files) < 2:
+            continue
+        files.sort(key=sort_key)
+        keep_path, keep_stat = files[0]
+        items = []
+        for path, stat_info in files[1:]:
+            if action != 'delete' and (stat_info.st_dev, stat_info.st_ino) == (keep_stat.st_dev, keep_stat.st_ino):
+                stats['already_linked'] += 1
+                continue
+            if action == 'hardlink' and stat_info.st_dev != keep_stat.st_dev:
+                stats['cross_device'] += 1
+                continue
+            item_distance = None
+            if distance is not None:
+                item_distance = distance(keep_path, keep_stat, path, stat_info)
+                if item_distance is None or item_distance > max_distance:
+                    stats['too_far'] += 1
+                    continue
+            items.append({'path': path, 'stat': stat_info, 'bytes': reclaimable_bytes(stat_info),
+                          'distance': item_distance})
+        if not items:
+            continue
+        plan.append({'keep': keep_path, 'keep_stat': keep_stat, 'digest': group.get('digest'), 'items': items})
+        stats['groups'] += 1
+        stats['actions'] += len(items)
+        stats['bytes_reclaimed'] += sum(item['bytes'] for item in items)
+    return plan, stats
+
+def file_version(stat_info):
+    return stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ino
+
+def _load_clonefile():
+    """macOS的clonefile(2)，不可用时返回None"""
+    if sys.platform != 'darwin':
+        return None
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    clonefile = getattr(libc, 'clonefile', None)
+    if clonefile is not None:
+        clonefile.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32]
+    return clonefile
+
+_clonefile = _load_clonefile()
+
+def clone_file(src_path, dst_path):
+    """
+    创建src_path的写时复制克隆dst_path（dst_path不能已存在）
+    :raises OSError: 文件系统不支持克隆（如EOPNOTSUPP、EXDEV）或其他错误
+    """
+    if _clonefile is not None:
+        if _clonefile(os.fsencode(src_path), os.fsencode(dst_path), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), dst_path)
+        return
+    if fcntl is None:
+        raise OSError(f"当前平台不支持克隆文件: {dst_path}")
+    with open(src_path, 'rb') as src, open(dst_path, 'xb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(dst_path)
+            raise
+
+def replace_with(keep_path, dup_path, action):
+    """
+    把dup_path原子替换为keep_path的硬链接或克隆：先在同目录创建临时文件，再os.replace
+    克隆保留重复文件原来的权限和修改时间
+    """
+    temp_path = dup_path + TEMP_SUFFIX
+    if action == 'hardlink':
+        os.link(keep_path, temp_path)
+    else:
+        clone_file(keep_path, temp_path)
+    try:
+        if action == 'reflink':
+            dup_stat = os.stat(dup_path)
+            os.chmod(temp_path, dup_stat.st_mode & 0o7777)
+            os.utime(temp_path, ns=(dup_stat.st_atime_ns, dup_stat.st_mtime_ns))
+        os.replace(temp_path, dup_path)
+    except OSError:
+        os.remove(temp_path)
+        raise
+
+def _verify(engine, entry, item):
+    """执行前确认保留文件和重复文件都没有变化，且完整哈希与报告一致"""
+    keep_stat = os.stat(entry['keep'])
+    dup_stat = os.stat(item['path'], follow_symlinks=False)
+    if file_version(keep_stat) != file_version(entry['keep_stat']) or \
+            file_version(dup_stat) != file_version(item['stat']):
+        return "生成计划后文件有变化"
+    if engine is not None and entry['digest']:
+        for path, stat_info in ((entry['keep'], keep_stat), (item['path'], dup_stat)):
+            if engine.hash_file(path, stat_info, max_bytes=None) != entry['digest']:
+                return f"完整哈希与报告不一致: {path}"
+    return None
+
+def _resolve_item(engine, entry, item, action):
+    """
+    处理一个重复文件
+    :return: (状态 'done'/'skipped'/'failed', 说明, 处理后的stat结果)
+    """
+    try:
+        reason = _verify(engine, entry, item)
+        if reason:
+            return 'skipped', reason, None
+        if action == 'delete':
+            os.remove(item['path'])
+            return 'done', None, None
+        replace_with(entry['keep'], item['path'], action)
+        return 'done', None, os.stat(item['path'])
+    except OSError as e:
+        return 'failed', str(e), None
+
+def execute_plan(plan, action, engine=None, workers=RESOLVE_WORKERS):
+    """
+    并行执行计划
+    :param engine: 用于校验完整哈希的HashEngine，为None时只检查文件信息是否变化
+    :return: (统计信息, 已删除的路径列表, {已替换的路径: stat结果})
+    """
+    stats = {'done': 0, 'skipped': 0, 'failed': 0, 'bytes_reclaimed': 0}
+    removed, replaced = [], {}
+    tasks = [(entry, item) for entry in plan for item in entry['items']]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda task: _resolve_item(engine, task[0], task[1], action), tasks)
+        for (entry, item), (status, message, new_stat) in zip(tasks, results):
+            stats[status] += 1
+            if status != 'done':
+                print(f"{'跳过' if status == 'skipped' else '失败'} {item['path']}: {message}")
+                continue
+            stats['bytes_reclaimed'] += item['bytes']
+            if new_stat is None:
+                removed.append(item['path'])
+            else:
+                replaced[item['path']] = new_stat
+    return stats, removed, replaced
+
+def open_catalog(db_path=None, shards_file=None):
+    """
+    打开需要更新的目录数据库；使用分片时以内存库为main，ATTACH所有在线的分片
+    :return: (连接, [(根目录, 库名)])，库名用于拼接 {库名}.media_data
+    """
+    if shards_file:
+        shards = [shard for shard in catalog_shards.load_shards(shards_file)
+                  if catalog_shards.is_shard_online(shard)]
+        conn = sqlite3.connect(':memory:', timeout=30)
+        for shard in shards:
+            conn.execute("ATTACH DATABASE ? AS " + catalog_shards.schema_name(shard), (shard['db'],))
+        return conn, [(shard['root'], catalog_shards.schema_name(shard)) for shard in shards]
+    return sqlite3.connect(db_path, timeout=30), [(None, 'main')]
+
+def schema_of(targets, path):
+    """文件所在的库名，不属于任何在线分片时返回None"""
+    return next((schema for root, schema in targets if root is None or is_under(path, root)), None)
+
+def perceptual_distance(conn, targets):
+    """
+    :return: distance(保留路径, 保留stat, 路径, stat)，两个文件按media_phash计算的距离；
+             任一文件没有与当前版本（大小、修改时间）对应的感知哈希时返回None
+    """
+    cache = {}
+
+    def frame_hashes(path, stat_info):
+        if path not in cache:
+            schema = schema_of(targets, path)
+            rows = [] if schema is None else conn.execute(
+                f"SELECT p.frame, p.phash FROM {schema}.media_data d "
+                f"JOIN {schema}.media_phash p ON p.media_id = d.media_id "
+                "WHERE d.file_path = ? AND d.phash_size = ? AND d.phash_mtime_ns = ?",
+                (path, stat_info.st_size, stat_info.st_mtime_ns)
+            ).fetchall()
+            cache[path] = {frame: media_phash.to_unsigned(value) for frame, value in rows}
+        return cache[path]
+
+    def distance(keep_path, keep_stat, path, stat_info):
+        return media_phash.media_distance(frame_hashes(keep_path, keep_stat), frame_hashes(path, stat_info))
+    return distance
+
+def update_catalog(conn, targets, removed, replaced):
+    """
+    在一个事务中删除已删除文件的记录，并更新已替换文件的inode和修改时间
+    （内容与原来相同，hash_value等其他列不变；media_counts、搜索索引、感知哈希由触发器同步）
+    :return: {'rows_deleted', 'rows_updated'}
+    """
+    stats = {'rows_deleted': 0, 'rows_updated': 0}
+    with conn:
+        for path in removed:
+            schema = schema_of(targets, path)
+            if schema:
+                stats['rows_deleted'] += conn.execute(
+                    f"DELETE FROM {schema}.media_data WHERE file_path = ?", (path,)
+                ).rowcount
+        for path, stat_info in replaced.items():
+            schema = schema_of(targets, path)
+            if schema:
+                stats['rows_updated'] += conn.execute(
+                    f"UPDATE {schema}.media_data SET file_size = ?, file_mtime_ns = ?, file_inode = ? "
+                    "WHERE file_path = ?",
+                    (stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ino, path)
+                ).rowcount
+    return stats
+
+def print_plan(plan, action):
+    label = {'delete': '删除', 'hardlink': '硬链接', 'reflink': '克隆'}[action]
+    for entry in plan:
+        print(f"\n保留 {entry['keep']}")
+        for item in entry['items']:
+            distance = f"  距离 {item['distance']:.1f}" if item['distance'] is not None else ''
+            print(f"- {label} {item['path']}  {format_bytes(item['stat'].st_size)}{distance}")
+
+def main():
+    parser = argparse.ArgumentParser(description="按保留策略删除重复文件或替换为硬链接/克隆，并更新目录数据库")
+    parser.add_argument('report', help="duplicate_finder.py 或 media_phash.py 生成的JSON报告")
+    parser.add_argument('--keep', choices=KEEP_POLICIES, default='oldest', help="每组保留哪个文件")
+    parser.add_argument('--prefer-root', action='append', default=[],
+                        help="root策略优先保留该目录下的文件（可重复指定，按顺序优先）")
+    parser.add_argument('--action', choices=ACTIONS, default='delete', help="如何处理其余的文件")
+    parser.add_argument('--dry-run', action='store_true', help="只输出计划和可释放的空间，不修改文件")
+    parser.add_argument('--no-verify', action='store_true',
+                        help="执行前不计算完整哈希校验（仍会检查文件是否变化）")
+    parser.add_argument('--workers', type=int, default=RESOLVE_WORKERS, help="并行处理的文件数")
+    parser.add_argument('--db', dest='db_path', default=DATABASE_PATH, help="需要同步的数据库文件路径")
+    parser.add_argument('--shards', dest='shards_file', default=None,
+                        help="多硬盘分片配置文件，按文件所在硬盘更新对应分片")
+    parser.add_argument('--no-catalog', action='store_true', help="不更新数据库")
+    hash_engine.add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        report, perceptual = load_report(args.report)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if perceptual and args.action != 'delete':
+        parser.error("近似文件内容不同，只能使用 --action delete")
+    if args.keep == 'root' and not args.prefer_root:
+        parser.error("--keep root 需要指定 --prefer-root")
+
+    catalog = None
+    if not args.no_catalog:
+        if args.shards_file or os.path.isfile(args.db_path):
+            catalog = open_catalog(args.db_path, args.shards_file)
+        else:
+            print(f"数据库 {args.db_path} 不存在，不更新数据库")
+    if perceptual and catalog is None:
+        parser.error("近似文件报告需要从数据库读取感知哈希，请指定 --db 或 --shards")
+    try:
+        resolve(args, report, perceptual, catalog)
+    finally:
+        if catalog is not None:
+            catalog[0].close()
+
+def resolve(args, report, perceptual, catalog):
+    """生成并输出计划，非 --dry-run 时执行并同步数据库"""
+    distance, max_distance = None, None
+    if perceptual:
+        distance = perceptual_distance(*catalog)
+        max_distance = report.get('max_distance', media_phash.DEFAULT_MAX_DISTANCE)
+    plan, stats = build_plan(report['groups'], args.keep, args.action, args.prefer_root,
+                             distance=distance, max_distance=max_distance)
+    print_plan(plan, args.action)
+    print()
+    print(f"共 {stats['groups']} 组，待处理 {stats['actions']} 个文件，"
+          f"可释放 {format_bytes(stats['bytes_reclaimed'])}")
+    print(f"已不存在或不是普通文件 {stats['missing']} 个，已是同一文件 {stats['already_linked']} 个，"
+          f"不在同一个卷（无法硬链接）{stats['cross_device']} 个")
+    if perceptual:
+        print(f"与保留文件的距离超过 {max_distance} 或没有当前版本的感知哈希（不处理）{stats['too_far']} 个")
+    if args.dry_run or not plan:
+        return
+
+    engine = None
+    if not perceptual and not args.no_verify:
+        engine = hash_engine.engine_from_args(args, algorithm=report.get('algorithm', hash_engine.DEFAULT_ALGORITHM))
+    try:
+        result, removed, replaced = execute_plan(plan, args.action, engine, args.workers)
+    finally:
+        if engine is not None:
+            engine.close()
+    print(f"完成 {result['done']}，跳过 {result['skipped']}，失败 {result['failed']}，"
+          f"释放 {format_bytes(result['bytes_reclaimed'])}")
+
+    if catalog is not None:
+        try:
+            rows = update_catalog(*catalog, removed, replaced)
+            print(f"数据库已更新：删除 {rows['rows_deleted']} 条，更新 {rows['rows_updated']} 条记录")
+        except sqlite3.Error as e:
+            print(f"更新数据库失败（文件已处理，可运行导入脚本的 --incremental 重新同步）: {e}")
+
+if __name__ == "__main__":
+    main()
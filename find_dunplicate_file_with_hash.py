@@ -1,7 +1,9 @@
 import os
-import hashlib
 import concurrent.futures
-import multiprocessing
+import media_walker
+import hash_cache
+import hash_engine
+import import_metrics
 
 # --------------------------
 # 在这里设置你要处理的目录路径
@@ -16,22 +18,25 @@ IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp',
 VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.mpeg', 
                    '.mpg', '.m4v', '.qt', '.avchd', '.webm', '.mts')
 
+# 哈希方式：'head' 只哈希文件前64KB；'sample' 哈希文件大小 + 头/中/尾均匀分布的 SAMPLE_BLOCKS 个64KB块，
+# 开头相同（同样的封装头、片头）的不同视频不会得到相同的哈希值
+HASH_MODE = 'head'
+SAMPLE_BLOCKS = 3
+
+# 运行指标：速率、读取/哈希耗时，处理过程中在终端实时显示
+METRICS = import_metrics.PipelineMetrics()
+# 共享哈希引擎：读取并发、每个设备的并发和哈希计算并发分开限制；文件未变化时直接取共享哈希缓存中的结果
+HASH_ENGINE = hash_engine.HashEngine(algorithm='sha256', max_bytes=65536, metrics=METRICS,
+                                     cache=hash_cache.HashCache())
+
 def calculate_hash(file_path, block_size=65536):
-    """计算文件前65536字节的SHA-256哈希值"""
-    hasher = hashlib.sha256()
-    try:
-        if not os.access(file_path, os.R_OK):
-            print(f"权限不足: {file_path}")
-            return None
-            
-        with open(file_path, 'rb') as f:
-            data = f.read(block_size)
-            if data:
-                hasher.update(data)
-            return hasher.hexdigest()
-    except Exception as e:
-        print(f"处理错误 {file_path}: {str(e)}")
+    """计算文件前65536字节的SHA-256哈希值（HASH_MODE为'sample'时计算采样指纹）"""
+    if not os.access(file_path, os.R_OK):
+        print(f"权限不足: {file_path}")
         return None
+    if HASH_MODE == 'sample':
+        return HASH_ENGINE.hash_sample(file_path, block_size=block_size, blocks=SAMPLE_BLOCKS)
+    return HASH_ENGINE.hash_file(file_path, max_bytes=block_size)
 
 def is_media_file(file_path):
     """判断是否为媒体文件（排除macOS隐藏文件）"""
@@ -51,26 +56,24 @@ def process_file(file_path):
 
 def get_media_files(root_dir):
     """获取指定目录及其子目录中的所有媒体文件"""
-    media_files = []
-    for dirpath, _, filenames in os.walk(root_dir):
-        # 跳过macOS特殊目录和文件
-        if '.DS_Store' in filenames:
-            filenames.remove('.DS_Store')
-        if any(exclude in dirpath for exclude in ('.git', '.svn', '.bundle')):
-            continue
-            
-        for filename in filenames:
-            file_path = os.path.join(dirpath, filename)
-            if is_media_file(file_path):
-                media_files.append(file_path)
-    return media_files
+    # 并行遍历，跳过隐藏文件（macOS的._文件等）、.DS_Store以及.git/.svn/.bundle目录
+    return list(METRICS.timed_iter('walk', media_walker.walk_file_paths(
+        root_dir, suffixes=IMAGE_EXTENSIONS + VIDEO_EXTENSIONS,
+        predicate=lambda entry: not entry.name.startswith('.')
+    )))
 
 def get_optimal_thread_count():
-    """获取适合macOS的最佳线程数"""
-    cpu_count = multiprocessing.cpu_count()
-    return max(2, min(32, cpu_count * 2))  # 基于macOS I/O特性优化
+    """处理线程数：保证读取和哈希计算都不空闲，实际并发由HASH_ENGINE限制"""
+    return HASH_ENGINE.workers
 
 def main():
+    # 异常或Ctrl+C中断时同样关闭引擎，写入尚未保存的哈希缓存
+    try:
+        run()
+    finally:
+        HASH_ENGINE.close()
+
+def run():
     # 处理目录路径中的波浪号（macOS用户目录）
     root_dir = os.path.expanduser(TARGET_DIRECTORY)
     
@@ -82,6 +85,8 @@ def main():
     print(f"正在扫描目录: {root_dir}")
     media_files = get_media_files(root_dir)
     print(f"发现 {len(media_files)} 个媒体文件，准备计算哈希值...")
+    METRICS.inc('discovered', len(media_files))
+    METRICS.mark_walk_done()
 
     if not media_files:
         print("没有找到媒体文件")
@@ -93,15 +98,17 @@ def main():
 
     # 多线程处理
     results = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+    with import_metrics.ProgressReporter(METRICS), \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         futures = {executor.submit(process_file, f): f for f in media_files}
         
         for future in concurrent.futures.as_completed(futures):
             result = future.result()
+            METRICS.inc('processed')
             if result:
                 results.append(result)
-                if len(results) % 10 == 0:
-                    print(f"已完成 {len(results)}/{len(media_files)}")
+            else:
+                METRICS.inc('failed')
 
     # 输出结果
     print("\n计算结果:")
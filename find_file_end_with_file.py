@@ -1,4 +1,4 @@
-import os
+import media_walker
 
 """
 查找文件夹及其子文件夹，找到以'_file'结尾的文件，并输出路径
@@ -8,18 +8,10 @@ Args:
     suffix(str): 要查找的文件名后缀
 """
 def find_files_with_suffix(folder_path, suffix="_file"):
-    found_files = []
-
-    # os.walk()会生成一个元组（dirpath, dirnames, filenames）
-    # 遍历目录树的每一个层次
-    for dirpath, dirnames, filenames in os.walk(folder_path):
-        # 遍历文件名是否以指定后缀结尾
-        for filename in filenames:
-            #检查文件名是否以指定后缀结尾
-            if filename.endswith(suffix):
-                # 如果符合条件，使用os.path.join()拼接完整路径并添加到列表
-                file_path = os.path.join(dirpath, filename)
-                found_files.append(file_path)
+    # 并行遍历目录树，只保留文件名以指定后缀结尾的文件
+    found_files = list(media_walker.walk_file_paths(
+        folder_path, predicate=lambda entry: entry.name.endswith(suffix)
+    ))
   
     return found_files
 
@@ -1,4 +1,5 @@
 import os 
+import media_walker
 def generate_video_list_html(folder_path, output_filename="video_list.html"):
     """
     遍历指定文件夹及其子文件夹，找到所有视频文件，并生成一个HTML网页。
@@ -13,15 +14,11 @@ def generate_video_list_html(folder_path, output_filename="video_list.html"):
     found_videos = []
     print("正在搜索视频文件...")
 
-    # 遍历目录树，找到所有视频文件
-    for dirpath, _, filenames in os.walk(folder_path):
-        for filename in filenames:
-            if any(filename.lower().endswith(ext) for ext in video_extensions):
-                # 确保路径格式正确
-                full_path = os.path.join(dirpath, filename)
-                # 将路径转换为URL格式，使用file://协议，并处理空格等特殊字符
-                url_path = "file://" + full_path.replace(os.sep, "/")
-                found_videos.append(url_path)
+    # 并行遍历目录树，找到所有视频文件（排序保证每次生成的列表顺序一致）
+    for full_path in sorted(media_walker.walk_file_paths(folder_path, suffixes=video_extensions)):
+        # 将路径转换为URL格式，使用file://协议，并处理空格等特殊字符
+        url_path = "file://" + full_path.replace(os.sep, "/")
+        found_videos.append(url_path)
     
     # 生成HTML内容
     html_content = f"""
@@ -2,6 +2,7 @@ import sqlite3
 import os
 import ffmpeg
 import sys
+import catalog_schema
 
 # 数据库和文件目录配置
 DATABASE_PATH = '/Users/lee/sqlite3/media_player.db'
@@ -47,13 +48,14 @@ def main():
     try:
         conn = sqlite3.connect(DATABASE_PATH)
         conn.row_factory = sqlite3.Row
+        catalog_schema.ensure_schema(conn)
         cursor = conn.cursor()
         
         # 查询所有类型为视频且poster_path为空的记录
         cursor.execute("""
             SELECT file_path, parent_folder, group_code 
             FROM media_data 
-            WHERE file_type LIKE 'video/%' AND (poster_path IS NULL OR poster_path = '')
+            WHERE media_kind = 'video' AND (poster_path IS NULL OR poster_path = '')
         """)
         
         rows = cursor.fetchall()
@@ -0,0 +1,176 @@
+"""
+共享的文件哈希缓存（SQLite）
+
+按 (设备, inode, 文件大小, 修改时间ns) 标识文件的一个版本，记录用哪种算法、哪个读取窗口算出的哈希值：
+    full               整个文件
+    head:6553600       文件开头6553600字节（导入脚本）
+    sample:65536x2     文件大小 + 均匀分布的2个65536字节块（查找重复文件的采样哈希）
+导入脚本、查找重复文件等工具都通过HashEngine先查缓存，文件没有变化时不再读取磁盘；
+文件修改后大小或修改时间变化，旧记录在写入新记录时一并删除。
+
+多个进程可以同时使用同一个缓存文件（WAL模式）。写入先在内存中攒批，
+达到 FLUSH_SIZE 条或超过 FLUSH_INTERVAL 秒时提交一次，close() 时提交剩余部分。
+
+用法:
+    cache = HashCache()
+    engine = hash_engine.HashEngine(algorithm='md5', cache=cache)
+    ...
+    engine.close()  # 同时关闭缓存
+"""
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.expanduser('~/.cache/media_tools/hash_cache.db')
+# 攒批写入：条数和时间间隔
+FLUSH_SIZE = 500
+FLUSH_INTERVAL = 5.0
+# 其他进程正在写入时的锁等待时间（秒）
+BUSY_TIMEOUT = 30
+FULL_WINDOW = 'full'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    device INTEGER NOT NULL,      -- st_dev
+    inode INTEGER NOT NULL,       -- st_ino
+    size INTEGER NOT NULL,        -- st_size
+    mtime_ns INTEGER NOT NULL,    -- st_mtime_ns
+    algorithm TEXT NOT NULL,      -- hashlib算法名
+    window TEXT NOT NULL,         -- 读取窗口：full / head:N / sample:NxM
+    digest TEXT NOT NULL,         -- 十六进制哈希值
+    file_path TEXT,               -- 计算时的路径（仅供查看，不参与匹配）
+    hashed_at REAL NOT NULL,      -- 计算时间(time.time())
+    PRIMARY KEY (device, inode, size, mtime_ns, algorithm, window)
+) WITHOUT ROWID
+"""
+
+def head_window(max_bytes, file_size):
+    """只读文件开头max_bytes字节；窗口覆盖整个文件时与完整哈希相同"""
+    if max_bytes is None or max_bytes >= file_size:
+        return FULL_WINDOW
+    return f"head:{max_bytes}"
+
+def sample_window(block_size, blocks):
+    return f"sample:{block_size}x{blocks}"
+
+def cache_key(stat_info):
+    """
+    由stat结果得到文件版本标识
+    :return: (device, inode, size, mtime_ns)；无法取得inode时（部分平台的DirEntry.stat()）返回None，不使用缓存
+    """
+    if not stat_info.st_ino:
+        return None
+    return (stat_info.st_dev, stat_info.st_ino, stat_info.st_size, stat_info.st_mtime_ns)
+
+class HashCache:
+    """
+    文件哈希缓存，线程安全；首次使用时才打开数据库
+    :param db_path: 缓存数据库路径
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(SCHEMA)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, stat_info, algorithm, window):
+        """
+        查询缓存
+        :return: 哈希值，未命中时返回None
+        """
+        key = cache_key(stat_info)
+        if key is None:
+            return None
+        with self._lock:
+            digest = self._pending.get(key + (algorithm, window), (None,))[0]
+            if digest is None:
+                try:
+                    row = self._connect().execute(
+                        "SELECT digest FROM file_hashes WHERE device = ? AND inode = ? AND size = ? "
+                        "AND mtime_ns = ? AND algorithm = ? AND window = ?",
+                        key + (algorithm, window)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    print(f"读取哈希缓存失败: {e}")
+                    row = None
+                digest = row[0] if row else None
+            if digest is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return digest
+
+    def put(self, stat_info, algorithm, window, digest, file_path=None):
+        """记录哈希值（攒批写入）"""
+        key = cache_key(stat_info)
+        if key is None or digest is None:
+            return
+        with self._lock:
+            self._pending[key + (algorithm, window)] = (digest, file_path, time.time())
+            if len(self._pending) >= FLUSH_SIZE or time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        rows = [key + value for key, value in self._pending.items()]
+        self._pending = {}
+        try:
+            conn = self._connect()
+            with conn:
+                # 同一个文件（device, inode）的旧版本记录已失效
+                conn.executemany(
+                    "DELETE FROM file_hashes WHERE device = ? AND inode = ? AND (size != ? OR mtime_ns != ?)",
+                    [row[:4] for row in rows]
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO file_hashes "
+                    "(device, inode, size, mtime_ns, algorithm, window, digest, file_path, hashed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+        except sqlite3.Error as e:
+            print(f"写入哈希缓存失败（{len(rows)} 条未保存）: {e}")
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def add_cache_arguments(parser):
+    """为命令行脚本添加哈希缓存相关参数"""
+    parser.add_argument('--hash-cache', default=DEFAULT_CACHE_PATH,
+                        help="共享哈希缓存数据库路径")
+    parser.add_argument('--no-hash-cache', action='store_true',
+                        help="不使用哈希缓存，每次都重新读取文件")
+
+def cache_from_args(args):
+    """根据add_cache_arguments添加的参数创建HashCache，关闭缓存时返回None"""
+    if args.no_hash_cache:
+        return None
+    return HashCache(args.hash_cache)
@@ -0,0 +1,469 @@
+"""
+共享的文件哈希引擎：读取（磁盘I/O）与计算哈希（CPU）分开限流
+
+- 读取并发：所有读取共用一个可调整的上限，开启自动调优时根据实测吞吐量增减
+- 设备并发：按 st_dev 区分设备，机械硬盘上同时读取的文件数受限，避免磁头来回寻道
+- 哈希计算：thread 后端在调用线程中计算（hashlib 计算时会释放GIL），
+  process 后端交给进程池计算，二者都受 hash_workers 限制
+- 算法：hashlib中的算法，或xxhash的xxh3_64/xxh3_128/xxh64等（需安装xxhash）；
+  'fast' 表示非加密的快速哈希，安装了xxhash时为xxh3_128，否则退回blake2b_128（128位摘要的blake2b）
+- 哈希缓存：传入hash_cache.HashCache时先按 (设备, inode, 大小, 修改时间) 查缓存，文件未变化时不读取
+
+用法:
+    with HashEngine(algorithm='md5', max_bytes=6553600) as engine:
+        digest = engine.hash_file(path)
+"""
+import concurrent.futures
+import hashlib
+import os
+import threading
+import time
+
+import hash_cache
+
+try:
+    import xxhash  # 可选依赖，安装后支持xxh3等非加密快速哈希
+except ImportError:
+    xxhash = None
+
+DEFAULT_ALGORITHM = 'md5'
+DEFAULT_READ_WORKERS = 16
+DEFAULT_HASH_WORKERS = os.cpu_count() or 1
+DEFAULT_READ_SIZE = 1 << 20
+# 机械硬盘上同时读取的文件数
+ROTATIONAL_DEVICE_READS = 2
+# 无法判断设备类型（如macOS外置硬盘）时的保守值
+UNKNOWN_DEVICE_READS = 4
+# 自动调优：每隔多少秒根据吞吐量调整一次读取并发
+TUNE_INTERVAL = 2.0
+
+BACKENDS = ('thread', 'process')
+
+FAST_ALGORITHM = 'fast'
+XXHASH_ALGORITHMS = ('xxh32', 'xxh64', 'xxh3_64', 'xxh3_128', 'xxh128')
+# 未安装xxhash时的快速哈希：hashlib中最快的blake2b，摘要长度与md5相同
+BLAKE2B_128 = 'blake2b_128'
+
+def resolve_algorithm(algorithm):
+    """把 'fast' 换成实际使用的算法名（哈希缓存中记录的是实际算法）"""
+    if algorithm == FAST_ALGORITHM:
+        return 'xxh3_128' if xxhash is not None else BLAKE2B_128
+    return algorithm
+
+def new_hasher(algorithm):
+    """
+    创建哈希对象
+    :raises ValueError: 不支持的算法，或xxhash算法但未安装xxhash
+    """
+    if algorithm in XXHASH_ALGORITHMS:
+        if xxhash is None:
+            raise ValueError(f"算法 {algorithm} 需要安装xxhash: pip install xxhash")
+        return getattr(xxhash, algorithm)()
+    if algorithm == BLAKE2B_128:
+        return hashlib.blake2b(digest_size=16)
+    return hashlib.new(algorithm)
+
+def _hash_chunks(algorithm, chunks):
+    """计算若干数据块的哈希值（进程池中执行，须为模块级函数）"""
+    hasher = new_hasher(algorithm)
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+def _read_and_hash(file_path, algorithm, read_size):
+    """读取整个文件并计算哈希（process后端哈希整个文件时在子进程中执行）"""
+    hasher = new_hasher(algorithm)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(read_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def sample_offsets(file_size, block_size, blocks=2):
+    """
+    均匀分布的采样块起点：第一块在文件开头，最后一块在文件末尾
+    :return: 起点列表；文件不大于一个块时只有[0]
+    """
+    if blocks <= 1 or file_size <= block_size:
+        return [0]
+    last = file_size - block_size
+    return [last * i // (blocks - 1) for i in range(blocks)]
+
+def read_blocks(file_path, offsets, block_size):
+    """按偏移读取若干块；有os.pread时不移动文件位置，一次打开读完所有块"""
+    fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        if hasattr(os, 'pread'):
+            return [os.pread(fd, block_size, offset) for offset in offsets]
+        blocks = []
+        for offset in offsets:
+            os.lseek(fd, offset, os.SEEK_SET)
+            blocks.append(os.read(fd, block_size))
+        return blocks
+    finally:
+        os.close(fd)
+
+def is_rotational_device(st_dev):
+    """
+    判断设备是否为机械硬盘（仅Linux可判断）
+    :return: True/False，无法判断时返回None
+    """
+    sys_path = f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}"
+    # 分区本身没有queue目录，需要看所属磁盘
+    for candidate in (sys_path, os.path.join(sys_path, '..')):
+        try:
+            with open(os.path.join(candidate, 'queue', 'rotational')) as f:
+                return f.read().strip() == '1'
+        except OSError:
+            continue
+    return None
+
+class AdjustableLimit:
+    """上限可以在运行时调整的信号量"""
+
+    def __init__(self, limit):
+        self._limit = max(1, limit)
+        self._active = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def set_limit(self, limit):
+        with self._cond:
+            self._limit = max(1, limit)
+            self._cond.notify_all()
+
+    def __enter__(self):
+        with self._cond:
+            while self._active >= self._limit:
+                self._cond.wait()
+            self._active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+class ThroughputTuner:
+    """
+    爬山法调整读取并发：每个周期比较吞吐量，变好则继续同方向调整，变差则反向
+    只调整读取并发；哈希计算是CPU密集型，hash_workers固定为CPU核数即可用满，不参与调整
+    """
+
+    def __init__(self, read_limit, minimum, maximum, interval=TUNE_INTERVAL):
+        self.read_limit = read_limit
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = interval
+        self.direction = 1
+        self.last_rate = None
+        self.window_bytes = 0
+        self.window_start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, nbytes):
+        with self.lock:
+            self.window_bytes += nbytes
+            now = time.monotonic()
+            elapsed = now - self.window_start
+            if elapsed < self.interval:
+                return
+            rate = self.window_bytes / elapsed
+            self.window_bytes = 0
+            self.window_start = now
+            if self.last_rate is not None and rate < self.last_rate * 0.95:
+                self.direction = -self.direction
+            self.last_rate = rate
+            limit = self.read_limit.limit
+            new_limit = min(self.maximum, max(self.minimum, limit + self.direction))
+            if new_limit == limit:
+                # 到达边界后反向试探
+                self.direction = -self.direction
+                return
+            self.read_limit.set_limit(new_limit)
+
+class HashEngine:
+    """
+    文件哈希引擎
+    :param algorithm: hashlib算法名、xxhash算法名或 'fast'
+    :param max_bytes: 只哈希文件开头的这么多字节，None表示整个文件
+    :param backend: 'thread' 或 'process'
+    :param read_workers: 同时读取的文件数上限（自动调优时为调整上限）
+    :param hash_workers: 同时计算哈希的数量
+    :param device_reads: 每个设备同时读取的文件数；None表示按设备类型自动判断，0表示不限制
+    :param auto_tune: 是否根据实测吞吐量自动调整读取并发
+    :param read_size: 每次read的字节数
+    :param metrics: 可选，import_metrics.PipelineMetrics，记录读取/哈希耗时和读取字节数
+    :param cache: 可选，hash_cache.HashCache，close()时一并关闭
+    """
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, max_bytes=None, backend='thread',
+                 read_workers=DEFAULT_READ_WORKERS, hash_workers=DEFAULT_HASH_WORKERS,
+                 device_reads=None, auto_tune=True, read_size=DEFAULT_READ_SIZE, metrics=None,
+                 cache=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"不支持的后端: {backend}，可选 {', '.join(BACKENDS)}")
+        algorithm = resolve_algorithm(algorithm)
+        new_hasher(algorithm)  # 提前校验算法名
+        self.algorithm = algorithm
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.read_workers = max(1, read_workers)
+        self.hash_workers = max(1, hash_workers)
+        self.device_reads = device_reads
+        self.read_size = read_size
+        self.metrics = metrics
+        self.cache = cache
+
+        initial = self.read_workers if not auto_tune else max(1, self.read_workers // 2)
+        self._read_limit = AdjustableLimit(initial)
+        self._tuner = ThroughputTuner(self._read_limit, 1, self.read_workers) if auto_tune else None
+        self._hash_slots = threading.BoundedSemaphore(self.hash_workers)
+        self._device_limits = {}
+        self._device_lock = threading.Lock()
+        self._process_pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def workers(self):
+        """调用方并发调用hash_file时建议使用的线程数，保证读取和计算都不空闲"""
+        return self.read_workers + self.hash_workers
+
+    @property
+    def read_limit(self):
+        """当前读取并发上限"""
+        return self._read_limit.limit
+
+    def _device_limit(self, st_dev):
+        with self._device_lock:
+            limit = self._device_limits.get(st_dev)
+            if limit is None:
+                if self.device_reads is not None:
+                    reads = self.device_reads
+                else:
+                    rotational = is_rotational_device(st_dev)
+                    if rotational is None:
+                        reads = UNKNOWN_DEVICE_READS
+                    else:
+                        reads = ROTATIONAL_DEVICE_READS if rotational else 0
+                limit = AdjustableLimit(reads) if reads > 0 else _NO_LIMIT
+                self._device_limits[st_dev] = limit
+            return limit
+
+    def _get_process_pool(self):
+        with self._pool_lock:
+            if self._process_pool is None:
+                self._process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.hash_workers)
+            return self._process_pool
+
+    def _read_window(self, f, max_bytes):
+        chunks = []
+        remaining = max_bytes
+        while remaining > 0:
+            chunk = f.read(min(self.read_size, remaining))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return chunks
+
+    def hash_file(self, file_path, stat_info=None, max_bytes=-1, algorithm=None):
+        """
+        计算文件哈希，可在多个线程中并发调用
+        :param stat_info: 可选，已取得的stat结果（用于确定所在设备）
+        :param max_bytes: 覆盖引擎的max_bytes设置，None表示整个文件
+        :param algorithm: 覆盖引擎的算法设置
+        :return: 十六进制哈希字符串，出错时返回None
+        """
+        if max_bytes == -1:
+            max_bytes = self.max_bytes
+        algorithm = resolve_algorithm(algorithm) if algorithm else self.algorithm
+        try:
+            if stat_info is None:
+                stat_info = os.stat(file_path)
+            window = hash_cache.head_window(max_bytes, stat_info.st_size)
+            digest = self._cache_get(stat_info, algorithm, window)
+            if digest is not None:
+                return digest
+            device_limit = self._device_limit(stat_info.st_dev)
+
+            if max_bytes is None:
+                digest = self._hash_whole_file(file_path, algorithm, device_limit, stat_info.st_size)
+                self._cache_put(stat_info, algorithm, window, digest, file_path)
+                return digest
+
+            # 先取设备名额再取全局名额：排队等待慢速硬盘的线程不占用全局名额，其他设备上的读取不受影响
+            with device_limit, self._read_limit:
+                # 只统计实际读取的时间，不含等待读取并发名额的时间
+                start = time.perf_counter()
+                with open(file_path, 'rb') as f:
+                    chunks = self._read_window(f, max_bytes)
+                read_time = time.perf_counter() - start
+            nbytes = sum(len(chunk) for chunk in chunks)
+            if self._tuner:
+                self._tuner.record(nbytes)
+            start = time.perf_counter()
+            digest = self._hash(algorithm, chunks)
+            self._record(read_time, time.perf_counter() - start, nbytes)
+            self._cache_put(stat_info, algorithm, window, digest, file_path)
+            return digest
+        except Exception as e:
+            print(f"计算文件 {file_path} 的哈希值时出错: {e}")
+            return None
+
+    def hash_sample(self, file_path, stat_info=None, block_size=65536, blocks=2, algorithm=None):
+        """
+        采样哈希（指纹）：文件大小加上均匀分布的blocks个块（头、中间...、尾），用pread按偏移读取
+        开头相同（同样的封装头、片头）但内容不同的视频可以区分开，读取量只有 block_size * blocks
+        文件不大于 block_size * blocks 时直接哈希整个文件，结果与完整哈希相同
+        不使用mmap：文件在可移动硬盘上时，拔出硬盘后访问映射内存会导致进程收到SIGBUS
+        :return: 十六进制哈希字符串，出错时返回None
+        """
+        algorithm = resolve_algorithm(algorithm) if algorithm else self.algorithm
+        try:
+            if stat_info is None:
+                stat_info = os.stat(file_path)
+            file_size = stat_info.st_size
+            if file_size <= block_size * blocks:
+                return self.hash_file(file_path, stat_info, max_bytes=file_size, algorithm=algorithm)
+            window = hash_cache.sample_window(block_size, blocks)
+            digest = self._cache_get(stat_info, algorithm, window)
+            if digest is not None:
+                return digest
+
+            device_limit = self._device_limit(stat_info.st_dev)
+            offsets = sample_offsets(file_size, block_size, blocks)
+            with device_limit, self._read_limit:
+                start = time.perf_counter()
+                chunks = [str(file_size).encode('ascii')] + read_blocks(file_path, offsets, block_size)
+                read_time = time.perf_counter() - start
+            nbytes = block_size * len(offsets)
+            if self._tuner:
+                self._tuner.record(nbytes)
+            start = time.perf_counter()
+            digest = self._hash(algorithm, chunks)
+            self._record(read_time, time.perf_counter() - start, nbytes)
+            self._cache_put(stat_info, algorithm, window, digest, file_path)
+            return digest
+        except Exception as e:
+            print(f"计算文件 {file_path} 的采样哈希值时出错: {e}")
+            return None
+
+    def _cache_get(self, stat_info, algorithm, window):
+        if self.cache is None:
+            return None
+        digest = self.cache.get(stat_info, algorithm, window)
+        if digest is not None and self.metrics is not None:
+            self.metrics.inc('cache_hits')
+        return digest
+
+    def _cache_put(self, stat_info, algorithm, window, digest, file_path):
+        if self.cache is not None:
+            self.cache.put(stat_info, algorithm, window, digest, file_path)
+
+    def _record(self, read_time, hash_time, nbytes):
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.observe('read', read_time)
+            if hash_time is not None:
+                metrics.observe('hash', hash_time)
+            metrics.inc('bytes_read', nbytes)
+
+    def _hash(self, algorithm, chunks):
+        with self._hash_slots:
+            if self.backend == 'process':
+                return self._get_process_pool().submit(_hash_chunks, algorithm, chunks).result()
+            return _hash_chunks(algorithm, chunks)
+
+    def _hash_whole_file(self, file_path, algorithm, device_limit, file_size):
+        # 整个文件不能一次读进内存：thread后端边读边算，process后端由子进程读取并计算
+        read_time = hash_time = 0.0
+        with device_limit, self._read_limit:
+            if self.backend == 'process':
+                # 子进程中读取和计算无法分开计时，全部计入读取
+                start = time.perf_counter()
+                with self._hash_slots:
+                    digest = self._get_process_pool().submit(
+                        _read_and_hash, file_path, algorithm, self.read_size
+                    ).result()
+                read_time, hash_time = time.perf_counter() - start, None
+            else:
+                hasher = new_hasher(algorithm)
+                with open(file_path, 'rb') as f:
+                    while True:
+                        start = time.perf_counter()
+                        chunk = f.read(self.read_size)
+                        middle = time.perf_counter()
+                        read_time += middle - start
+                        if not chunk:
+                            break
+                        hasher.update(chunk)
+                        hash_time += time.perf_counter() - middle
+                digest = hasher.hexdigest()
+        if self._tuner:
+            self._tuner.record(file_size)
+        self._record(read_time, hash_time, file_size)
+        return digest
+
+    def map(self, file_paths):
+        """
+        并发计算多个文件的哈希
+        :return: (file_path, 哈希值或None) 生成器，顺序为完成顺序
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.hash_file, path): path for path in file_paths}
+            for future in concurrent.futures.as_completed(futures):
+                yield futures[future], future.result()
+
+    def close(self):
+        with self._pool_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown()
+                self._process_pool = None
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class _NoLimit:
+    """不限制并发时使用的空上下文"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NO_LIMIT = _NoLimit()
+
+def add_engine_arguments(parser):
+    """为命令行脚本添加哈希引擎相关参数"""
+    parser.add_argument('--hash-backend', choices=BACKENDS, default='thread',
+                        help="哈希计算后端：thread（默认）或 process")
+    parser.add_argument('--read-workers', type=int, default=DEFAULT_READ_WORKERS,
+                        help="同时读取的文件数上限")
+    parser.add_argument('--hash-workers', type=int, default=DEFAULT_HASH_WORKERS,
+                        help="同时计算哈希的数量")
+    parser.add_argument('--device-reads', type=int, default=None,
+                        help="每个设备同时读取的文件数（默认按设备类型判断，0为不限制）")
+    parser.add_argument('--no-auto-tune', action='store_true',
+                        help="关闭根据吞吐量自动调整读取并发")
+    hash_cache.add_cache_arguments(parser)
+
+def engine_from_args(args, **kwargs):
+    """根据add_engine_arguments添加的参数创建HashEngine（包括共享哈希缓存）"""
+    kwargs.setdefault('cache', hash_cache.cache_from_args(args))
+    return HashEngine(
+        backend=args.hash_backend,
+        read_workers=args.read_workers,
+        hash_workers=args.hash_workers,
+        device_reads=args.device_reads,
+        auto_tune=not args.no_auto_tune,
+        **kwargs
+    )
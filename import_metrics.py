@@ -0,0 +1,308 @@
+"""
+扫描/导入流水线的运行指标
+
+- 计数器：发现、处理、失败、写入的文件数，读取的字节数等
+- 各阶段耗时直方图：walk(遍历)、stat、read(读文件)、hash(计算哈希)、process(单个文件处理总耗时)、db_write(每批写库)
+- 队列深度等瞬时值
+- 速率(files/s、MB/s)和预计剩余时间
+
+可以在终端上实时刷新一行进度，也可以定期导出为JSON或Prometheus文本格式，
+用来判断慢在磁盘(read)、CPU(hash)还是SQLite(db_write)。
+
+用法:
+    metrics = PipelineMetrics()
+    with metrics.timer('hash'):
+        ...
+    metrics.inc('processed')
+    reporter = ProgressReporter(metrics, live=True, dump_path='metrics.json')
+    reporter.start()
+    ...
+    reporter.stop()
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+STAGES = ('walk', 'stat', 'read', 'hash', 'process', 'db_write')
+
+# 直方图桶上限（秒），覆盖缓存命中的stat到机械硬盘上的大批量写入
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+class Histogram:
+    """固定桶的耗时直方图（与Prometheus histogram语义一致）"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为+Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """按桶估算分位数（返回所在桶的上限，落在+Inf桶时返回最大值）"""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def cumulative_counts(self):
+        """[(上限, 累计次数)]，上限为'+Inf'表示全部"""
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            result.append((bound, cumulative))
+        return result
+
+class PipelineMetrics:
+    """线程安全的流水线指标集合"""
+
+    def __init__(self, stages=STAGES):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counters = {}
+        self.histograms = {stage: Histogram() for stage in stages}
+        self._gauges = {}
+        self.walk_done = False
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed_iter(self, stage, iterable):
+        """逐个产出iterable的元素，并记录每次取下一个元素的等待时间"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - start)
+            yield item
+
+    def set_gauge(self, name, func):
+        """注册一个瞬时值（如队列深度），func在生成快照时调用"""
+        self._gauges[name] = func
+
+    def mark_walk_done(self):
+        """遍历结束后发现的文件总数即为总量，可以计算ETA"""
+        self.walk_done = True
+
+    def snapshot(self):
+        """当前指标的字典形式（可直接序列化为JSON）"""
+        with self._lock:
+            counters = dict(self.counters)
+            stages = {
+                stage: {
+                    'count': h.count,
+                    'sum': round(h.sum, 6),
+                    'max': round(h.max, 6),
+                    'p50': h.quantile(0.5),
+                    'p95': h.quantile(0.95),
+                    'p99': h.quantile(0.99),
+                }
+                for stage, h in self.histograms.items()
+            }
+        gauges = {}
+        for name, func in list(self._gauges.items()):
+            try:
+                gauges[name] = func()
+            except Exception:
+                gauges[name] = None
+
+        elapsed = time.monotonic() - self.started
+        processed = counters.get('processed', 0)
+        files_per_sec = processed / elapsed if elapsed > 0 else 0.0
+        mb_per_sec = counters.get('bytes_read', 0) / elapsed / (1 << 20) if elapsed > 0 else 0.0
+        eta = None
+        if self.walk_done and files_per_sec > 0:
+            eta = max(0, counters.get('discovered', 0) - processed) / files_per_sec
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'walk_done': self.walk_done,
+            'counters': counters,
+            'rates': {
+                'files_per_second': round(files_per_sec, 2),
+                'mb_per_second': round(mb_per_sec, 2),
+            },
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+            'gauges': gauges,
+            'stages': stages,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self, prefix='media_import'):
+        """导出为Prometheus文本格式（可配合node_exporter的textfile收集器）"""
+        snapshot = self.snapshot()
+        lines = [
+            f"# TYPE {prefix}_elapsed_seconds gauge",
+            f"{prefix}_elapsed_seconds {snapshot['elapsed_seconds']}",
+        ]
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name, value in sorted(snapshot['gauges'].items()):
+            if value is not None:
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+        if snapshot['eta_seconds'] is not None:
+            lines.append(f"# TYPE {prefix}_eta_seconds gauge")
+            lines.append(f"{prefix}_eta_seconds {snapshot['eta_seconds']}")
+        lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+        with self._lock:
+            for stage, histogram in self.histograms.items():
+                for bound, cumulative in histogram.cumulative_counts():
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def format_line(self):
+        """一行进度摘要，用于终端实时显示"""
+        snapshot = self.snapshot()
+        counters = snapshot['counters']
+        stages = snapshot['stages']
+
+        def ms(stage):
+            value = stages.get(stage, {}).get('p95')
+            return f"{value * 1000:.1f}" if value is not None else "-"
+
+        eta = snapshot['eta_seconds']
+        eta_text = "遍历中" if not snapshot['walk_done'] else (
+            f"剩余 {int(eta // 60)}分{int(eta % 60):02d}秒" if eta is not None else "剩余 -"
+        )
+        queues = ' '.join(
+            f"{name}={value}" for name, value in sorted(snapshot['gauges'].items()) if value is not None
+        )
+        return (
+            f"已处理 {counters.get('processed', 0)}/{counters.get('discovered', 0)} "
+            f"失败 {counters.get('failed', 0)} 写入 {counters.get('written', 0)} "
+            f"缓存命中 {counters.get('cache_hits', 0)} | "
+            f"{snapshot['rates']['files_per_second']:.1f} 文件/s "
+            f"{snapshot['rates']['mb_per_second']:.1f} MB/s | "
+            f"p95(ms) stat {ms('stat')} read {ms('read')} hash {ms('hash')} db {ms('db_write')} | "
+            f"{queues} | {eta_text}"
+        )
+
+    def write_dump(self, path, fmt='json'):
+        """原子地写出指标文件（先写临时文件再替换，读取方不会看到写了一半的内容）"""
+        content = self.to_prometheus() if fmt == 'prometheus' else self.to_json()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+class ProgressReporter:
+    """
+    后台线程定期输出进度
+    :param metrics: PipelineMetrics
+    :param interval: 刷新间隔（秒）
+    :param live: 是否在终端上输出进度行（终端中原地刷新，重定向到文件时逐行输出）
+    :param dump_path: 可选，定期写出指标文件的路径
+    :param dump_format: 'json' 或 'prometheus'
+    """
+
+    def __init__(self, metrics, interval=1.0, live=True, dump_path=None, dump_format='json',
+                 stream=None):
+        self.metrics = metrics
+        self.interval = interval
+        self.live = live
+        self.dump_path = dump_path
+        self.dump_format = dump_format
+        self.stream = stream or sys.stderr
+        self._stop = threading.Event()
+        self._thread = None
+        self._tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+
+    def _report(self, final=False):
+        if self.live:
+            line = self.metrics.format_line()
+            if self._tty:
+                end = "\n" if final else ""
+                self.stream.write("\r\033[K" + line + end)
+            else:
+                self.stream.write(line + "\n")
+            self.stream.flush()
+        if self.dump_path:
+            try:
+                self.metrics.write_dump(self.dump_path, self.dump_format)
+            except OSError as e:
+                print(f"写入指标文件 {self.dump_path} 失败: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._report()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="progress-reporter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止刷新并输出最终结果"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._report(final=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def add_metrics_arguments(parser):
+    """为命令行脚本添加进度/指标相关参数"""
+    parser.add_argument('--progress', action='store_true',
+                        help="在终端实时显示速率、各阶段耗时、队列深度和预计剩余时间")
+    parser.add_argument('--metrics-file', default=None,
+                        help="定期把指标写入该文件（结束时写入最终结果）")
+    parser.add_argument('--metrics-format', choices=('json', 'prometheus'), default='json',
+                        help="指标文件格式")
+    parser.add_argument('--metrics-interval', type=float, default=1.0,
+                        help="进度刷新/指标写出间隔（秒）")
+
+def reporter_from_args(metrics, args):
+    """根据add_metrics_arguments添加的参数创建ProgressReporter，未开启时返回None"""
+    if not args.progress and not args.metrics_file:
+        return None
+    return ProgressReporter(metrics, interval=args.metrics_interval, live=args.progress,
+                            dump_path=args.metrics_file, dump_format=args.metrics_format)
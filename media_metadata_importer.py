@@ -1,8 +1,47 @@
 import os
 import hashlib
+import argparse
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import queue
+import concurrent.futures
 from datetime import datetime
 import mimetypes
 import re
+import catalog_schema
+import media_walker
+import hash_cache
+import hash_engine
+import media_watcher
+import media_phash
+import media_probe
+import import_metrics
+import catalog_shards
+
+# 导入目标表（默认值）；app.py只读取media_data，以 --table media_data（或--bulk/--watch/分片导入）
+# 写入时，流水线每提交一批，这批记录在导入过程中即可被API查询到
+IMPORT_TABLE = 'media_metadata'
+
+# 哈希窗口：只对文件开头 HASH_BLOCK_SIZE * HASH_MAX_BLOCKS 字节计算md5（约6.5MB）
+HASH_BLOCK_SIZE = 65536
+HASH_MAX_BLOCKS = 100
+# 哈希方式：'head' 只哈希文件开头（默认，与已有hash_value一致）；
+# 'sample' 哈希文件大小 + 头/中/尾均匀分布的 SAMPLE_BLOCKS 个 HASH_BLOCK_SIZE 字节块，
+# 开头相同（同样的封装头、片头）的不同视频不会得到相同的hash_value，读取量也更小
+HASH_MODES = ('head', 'sample')
+HASH_MODE = 'head'
+HASH_ALGORITHM = 'md5'
+SAMPLE_BLOCKS = 3
+# 运行指标：各阶段耗时、速率、队列深度，可用 --progress / --metrics-file 输出
+METRICS = import_metrics.PipelineMetrics()
+# 共享哈希引擎，main中会按命令行参数重新创建
+HASH_ENGINE = hash_engine.HashEngine(algorithm=HASH_ALGORITHM, max_bytes=HASH_BLOCK_SIZE * HASH_MAX_BLOCKS,
+                                     metrics=METRICS, cache=hash_cache.HashCache())
+# 每提交一批打印一次进度；开启 --progress 实时显示时关闭
+PRINT_BATCH_PROGRESS = True
 
 def has_chinese(text):
     """判断字符串是否包含中文"""
@@ -12,21 +51,20 @@ def has_chinese(text):
     pattern = re.compile(r'[\u4e00-\u9fa5]')
     return bool(pattern.search(text))
 
-def get_file_hash(file_path, block_size=65536, max_blocks=100):
-    """优化：仅读取文件前 max_blocks*block_size 字节计算哈希（默认约6.5MB）"""
-    hasher = hashlib.md5()
-    try:
-        with open(file_path, 'rb') as f:
-            blocks_read = 0
-            buf = f.read(block_size)
-            while buf and blocks_read < max_blocks:
-                hasher.update(buf)
-                buf = f.read(block_size)
-                blocks_read += 1
-        return hasher.hexdigest()
-    except Exception as e:
-        print(f"计算文件 {file_path} 的哈希值时出错: {e}")
-        return None
+def get_file_hash(file_path, block_size=HASH_BLOCK_SIZE, max_blocks=HASH_MAX_BLOCKS, stat_info=None):
+    """
+    优化：仅读取文件前 max_blocks*block_size 字节计算哈希（默认约6.5MB），读取和计算由HASH_ENGINE限流
+    HASH_MODE为'sample'时改为计算采样指纹（文件大小 + SAMPLE_BLOCKS个均匀分布的block_size字节块）
+    文件未变化时直接取共享哈希缓存中的结果
+    """
+    if HASH_MODE == 'sample':
+        return HASH_ENGINE.hash_sample(file_path, stat_info, block_size=block_size, blocks=SAMPLE_BLOCKS)
+    return HASH_ENGINE.hash_file(file_path, stat_info=stat_info, max_bytes=block_size * max_blocks)
+
+def stat_entry(entry):
+    """取DirEntry的stat结果并记录耗时（Linux上scandir不带stat信息，首次调用会触发一次stat系统调用）"""
+    with METRICS.timer('stat'):
+        return entry.stat()
 
 def get_file_mime_type(file_path):
     """获取文件的MIME类型"""
@@ -53,8 +91,12 @@ def get_group_code_by_parent_folder(file_path):
         print(f"生成group_code时出错: {e}")
         return 'unknown_folder'
 
-def process_file(file_path):
-    """处理单个文件的元数据提取，包含文件名特殊处理逻辑"""
+def process_file(file_path, stat_info=None, hash_value=None):
+    """
+    处理单个文件的元数据提取，包含文件名特殊处理逻辑
+    :param stat_info: 可选，遍历时已取得的stat结果，避免重复stat
+    :param hash_value: 可选，已知的哈希值（如文件改名时沿用原记录），不再重新读取计算
+    """
     if not is_media_file(file_path):
         return None
     
@@ -84,7 +126,8 @@ def process_file(file_path):
             processed_filename = original_filename
         
         # 获取其他文件属性
-        stat_info = os.stat(file_path)
+        if stat_info is None:
+            stat_info = os.stat(file_path)
         file_size = stat_info.st_size
         
         # 时间处理
@@ -98,90 +141,967 @@ def process_file(file_path):
         
         # 其他元数据
         file_type = get_file_mime_type(file_path)
-        hash_value = get_file_hash(file_path)
+        if hash_value is None:
+            hash_value = get_file_hash(file_path, stat_info=stat_info)
         
         return {
             'file_name': processed_filename,  # 使用处理后的文件名
             'file_path': file_path,
             'file_type': file_type,
+            'media_kind': catalog_schema.media_kind_of(file_type),
             'file_size': file_size,
             'group_code': group_code,
             'hash_value': hash_value,
             'parent_folder': parent_folder,
             'created_time': created_time.isoformat(),
-            'modified_time': modified_time.isoformat() if modified_time else None
+            'modified_time': modified_time.isoformat() if modified_time else None,
+            'file_mtime_ns': stat_info.st_mtime_ns,
+            'file_inode': stat_info.st_ino
         }
         
     except Exception as e:
         print(f"处理文件 {file_path} 时出错: {e}")
         return None
 
-def scan_media_files(root_dir):
-    media_files = []
-    file_paths = []
-    
-    # 收集所有媒体文件路径
-    for dirpath, _, filenames in os.walk(root_dir):
-        for filename in filenames:
-            file_path = os.path.join(dirpath, filename)
-            if is_media_file(file_path):
-                file_paths.append(file_path)
-    
-    # 多线程处理
-    import concurrent.futures
-    max_workers = min(4, os.cpu_count())
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        results = executor.map(process_file, file_paths)
-        for result in results:
-            if result:
-                media_files.append(result)
-                if len(media_files) % 100 == 0:
-                    print(f"已处理 {len(media_files)} 个文件...")
-    
-    return media_files
+# 流水线参数：队列长度限制了内存中同时存在的文件条目和结果行数
+# 处理线程数默认为None，即取HASH_ENGINE.workers（读取并发上限 + 哈希并发数）
+PIPELINE_WORKERS = None
+PIPELINE_QUEUE_SIZE = 1000
+PIPELINE_BATCH_SIZE = 500
+
+# 批量导入（首次建库）时每个事务写入的行数
+BULK_BATCH_SIZE = 20000
+
+# 可写入的目标表：media_metadata为原始导入表，media_data为API读取的表
+TARGET_TABLES = ('media_metadata', 'media_data')
+
+# 写入的列（与process_file返回的字典对应）
+IMPORT_COLUMNS = [
+    'file_name', 'file_path', 'file_type', 'file_size', 'group_code',
+    'hash_value', 'parent_folder', 'created_time', 'modified_time',
+    'file_mtime_ns', 'file_inode',
+]
+
+def table_columns(table):
+    """目标表需要写入的列，media_data额外写入media_kind"""
+    if table == 'media_data':
+        return IMPORT_COLUMNS + ['media_kind']
+    return IMPORT_COLUMNS
+
+def build_insert_sql(table=IMPORT_TABLE, upsert=False):
+    """
+    生成写入语句
+    :param upsert: False时已存在的路径忽略；True时按file_path更新（不会覆盖poster_path等其他列）
+    """
+    columns = table_columns(table)
+    sql = (
+        f"INSERT {'' if upsert else 'OR IGNORE '}INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(':' + column for column in columns)})"
+    )
+    if upsert:
+        sql += " ON CONFLICT(file_path) DO UPDATE SET " + ', '.join(
+            f"{column} = excluded.{column}" for column in columns if column != 'file_path'
+        )
+    return sql
+
+INSERT_SQL = build_insert_sql(IMPORT_TABLE)
+
+def prepare_target_table(db_path, table):
+    """写入media_data前确保表结构、索引和触发器存在"""
+    if table == 'media_data':
+        catalog_schema.ensure_schema_at(db_path)
+
+_STOP = object()
+
+# 断点续传：记录每个导入根目录下已完整写入的目录
+CHECKPOINT_TABLE = 'import_checkpoint'
+CREATE_CHECKPOINT_SQL = f"""
+CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+    root_dir TEXT NOT NULL,   -- 导入的根目录（绝对路径）
+    dir_path TEXT NOT NULL,   -- 已完成的目录（其中的媒体文件均已写入）
+    PRIMARY KEY (root_dir, dir_path)
+) WITHOUT ROWID
+"""
+
+class ImportCheckpoint:
+    """
+    导入进度：目录中的文件全部写入成功后，目录与这批数据在同一个事务中记为已完成。
+    中断后以 --resume 重新执行时跳过已完成的目录，未完成目录中已写入的文件也不再重新计算哈希。
+    并行遍历的顺序不固定，因此以"已完成目录集合"作为遍历进度，而不是单一的路径游标
+    """
+
+    def __init__(self, root_dir, table=IMPORT_TABLE, resume=False):
+        self.root_dir = os.path.abspath(root_dir)
+        self.table = table
+        self.resume = resume
+        self.finished = set()
+        self._remaining = {}   # 目录 -> 尚未写入的文件数
+        self._failed = set()   # 有文件处理失败的目录，本次不记为完成
+        self._ready = []       # 已完成、待随下一批数据提交的目录
+        self._lock = threading.Lock()
+
+    def start(self, db_path):
+        """建表；续传时读取已完成目录，否则清除该根目录的旧进度"""
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute(CREATE_CHECKPOINT_SQL)
+            if self.resume:
+                self.finished = {row[0] for row in conn.execute(
+                    f"SELECT dir_path FROM {CHECKPOINT_TABLE} WHERE root_dir = ?", (self.root_dir,)
+                )}
+                print(f"断点续传：{len(self.finished)} 个目录已完成，将跳过")
+            else:
+                conn.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE root_dir = ?", (self.root_dir,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def add_dir(self, dir_path, file_count):
+        """登记一个待写入的目录（须在它的文件进入流水线之前调用）"""
+        with self._lock:
+            if file_count:
+                self._remaining[dir_path] = file_count
+            else:
+                self._ready.append(dir_path)
+
+    def file_done(self, file_path, ok):
+        """写入线程在一个文件写入（或处理失败）后调用"""
+        dir_path = os.path.dirname(file_path)
+        with self._lock:
+            if not ok:
+                self._failed.add(dir_path)
+            remaining = self._remaining.get(dir_path)
+            if remaining is None:
+                return
+            if remaining > 1:
+                self._remaining[dir_path] = remaining - 1
+                return
+            del self._remaining[dir_path]
+            if dir_path not in self._failed:
+                self._ready.append(dir_path)
+
+    def dir_failed(self, dir_path):
+        """遍历时目录无法读取：其下的文件没有进入流水线，本次导入不算完成"""
+        with self._lock:
+            self._failed.add(dir_path)
 
-def batch_insert_to_db(media_files, db_path):
-    """批量插入数据库"""
-    if not media_files:
-        print("没有要插入的媒体文件数据")
+    def save(self, conn):
+        """把已完成的目录写入进度表（由调用方与数据一起提交）"""
+        with self._lock:
+            ready, self._ready = self._ready, []
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {CHECKPOINT_TABLE} (root_dir, dir_path) VALUES (?, ?)",
+            ((self.root_dir, dir_path) for dir_path in ready)
+        )
+
+    @property
+    def complete(self):
+        """本次所有目录都已完成（没有失败的文件）"""
+        with self._lock:
+            return not self._remaining and not self._failed
+
+    def finish(self, db_path):
+        """导入全部完成后清除进度"""
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE root_dir = ?", (self.root_dir,))
+            conn.commit()
+        finally:
+            conn.close()
+
+def run_import_pipeline(tasks, db_path, write_sql, workers=PIPELINE_WORKERS,
+                        batch_size=PIPELINE_BATCH_SIZE, queue_size=PIPELINE_QUEUE_SIZE,
+                        table=IMPORT_TABLE, bulk=False, checkpoint=None):
+    """
+    流式导入流水线：遍历 -> 有界队列 -> 多个处理线程（哈希、元数据）-> 单个写入线程
+    写入线程每 batch_size 行提交一次事务，扫描过程中已提交的记录即可被API查询到，
+    中途崩溃也只会丢失最后一个未提交的批次
+    :param tasks: 可迭代对象，元素为 (file_path, stat_info, tag)，tag 用于分类统计
+    :param write_sql: 写入语句（命名参数与process_file返回的字典对应）
+    :param workers: 处理线程数，None表示按HASH_ENGINE的读取和哈希并发数确定
+    :param table: 目标表
+    :param bulk: 写入连接是否使用批量导入设置（WAL、加大缓存等）
+    :param checkpoint: 可选，ImportCheckpoint，每批提交时一并保存已完成的目录
+    :return: 统计信息 {'processed', 'written', 'failed', tag: 行数...}
+    """
+    task_queue = queue.Queue(maxsize=queue_size)
+    row_queue = queue.Queue(maxsize=queue_size)
+    # 队列深度：task_queue长期为空说明遍历跟不上，row_queue长期满说明写库跟不上
+    METRICS.set_gauge('task_queue_depth', task_queue.qsize)
+    METRICS.set_gauge('row_queue_depth', row_queue.qsize)
+    METRICS.set_gauge('read_limit', lambda: HASH_ENGINE.read_limit)
+    METRICS.walk_done = False
+    stats = {'processed': 0, 'written': 0, 'failed': 0}
+    errors = []
+    # 中断（Ctrl+C/SIGTERM）后不再处理排队中的文件，只提交已处理完的结果
+    cancelled = threading.Event()
+
+    def process_worker():
+        while True:
+            task = task_queue.get()
+            if task is _STOP:
+                return
+            if cancelled.is_set():
+                continue
+            file_path, stat_info, tag = task
+            with METRICS.timer('process'):
+                row = process_file(file_path, stat_info)
+            row_queue.put((tag, file_path, row))
+
+    def writer():
+        conn = None
+        batch, tags = [], []
+
+        def flush():
+            if errors or not (batch or checkpoint):
+                return
+            with METRICS.timer('db_write'):
+                cursor = conn.executemany(write_sql, batch)
+                if checkpoint:
+                    for row in batch:
+                        checkpoint.file_done(row['file_path'], True)
+                    checkpoint.save(conn)
+                conn.commit()
+            stats['written'] += max(cursor.rowcount, 0)
+            METRICS.inc('written', max(cursor.rowcount, 0))
+            METRICS.inc('batches')
+            for tag in tags:
+                stats[tag] = stats.get(tag, 0) + 1
+            batch.clear()
+            tags.clear()
+
+        try:
+            conn = sqlite3.connect(db_path, timeout=30)
+            if bulk:
+                catalog_schema.apply_bulk_pragmas(conn)
+            catalog_schema.ensure_file_stat_columns(conn, table)
+        except sqlite3.Error as e:
+            errors.append(e)
+        while True:
+            item = row_queue.get()
+            if item is _STOP:
+                break
+            # 数据库出错后仍继续从队列取数据，避免处理线程阻塞
+            if errors:
+                continue
+            tag, file_path, row = item
+            stats['processed'] += 1
+            METRICS.inc('processed')
+            if not row:
+                stats['failed'] += 1
+                METRICS.inc('failed')
+                if checkpoint:
+                    checkpoint.file_done(file_path, False)
+                continue
+            batch.append(row)
+            tags.append(tag)
+            if len(batch) >= batch_size:
+                try:
+                    flush()
+                    if PRINT_BATCH_PROGRESS:
+                        print(f"已处理 {stats['processed']} 个文件，已写入 {stats['written']} 条记录...")
+                except sqlite3.Error as e:
+                    errors.append(e)
+                    conn.rollback()
+        try:
+            flush()
+        except sqlite3.Error as e:
+            errors.append(e)
+            conn.rollback()
+        finally:
+            if conn is not None:
+                conn.close()
+
+    workers = workers or HASH_ENGINE.workers
+    threads = [
+        threading.Thread(target=process_worker, name=f"import-worker-{i}", daemon=True)
+        for i in range(max(1, workers))
+    ]
+    writer_thread = threading.Thread(target=writer, name="import-writer", daemon=True)
+    for thread in threads:
+        thread.start()
+    writer_thread.start()
+
+    def join(thread):
+        while thread.is_alive():
+            try:
+                thread.join()
+            except KeyboardInterrupt:
+                cancelled.set()
+
+    try:
+        # walk耗时为取得下一个任务的等待时间（含目录遍历、stat以及续传/增量时的比对）
+        for task in METRICS.timed_iter('walk', tasks):
+            METRICS.inc('discovered')
+            METRICS.inc('bytes_discovered', task[1].st_size)
+            task_queue.put(task)
+            if errors:
+                break
+        else:
+            METRICS.mark_walk_done()
+    except KeyboardInterrupt:
+        cancelled.set()
+        raise
+    finally:
+        if cancelled.is_set():
+            print("已中断，正在提交已处理完的数据...")
+        for _ in threads:
+            task_queue.put(_STOP)
+        for thread in threads:
+            join(thread)
+        row_queue.put(_STOP)
+        join(writer_thread)
+    if cancelled.is_set():
+        # 中断发生在等待线程结束期间时，同样按中断返回给调用方
+        raise KeyboardInterrupt
+
+    if errors:
+        print(f"数据库操作出错: {errors[0]}")
+        stats['error'] = str(errors[0])
+    return stats
+
+def iter_media_tasks(root_dir, db_path=None, checkpoint=None, stats=None):
+    """
+    遍历root_dir下的媒体文件，产出流水线任务 (file_path, stat_info, 'found')
+    :param checkpoint: 可选，ImportCheckpoint；续传时跳过已完成目录，
+                       未完成目录中已在库里的文件也跳过（不再重新计算哈希）
+    :param stats: 可选，统计信息字典，累加 'resumed_dirs'、'skipped'、'stat_failed'（读取文件信息失败的文件数）、
+                  'walk_failed'（无法读取的目录数）
+    """
+    predicate = lambda e: is_media_file(e.path)
+    stats = stats if stats is not None else {}
+    stats.setdefault('resumed_dirs', 0)
+    stats.setdefault('skipped', 0)
+    stats.setdefault('stat_failed', 0)
+    stats.setdefault('walk_failed', 0)
+
+    def on_walk_error(path, error):
+        # 目录无法读取（硬盘拔出、I/O错误等）：计为失败，断点不记为完成，--resume 时重新遍历
+        print(f"无法读取目录 {path}: {error}")
+        stats['walk_failed'] += 1
+        METRICS.inc('failed')
+        if checkpoint is not None:
+            checkpoint.dir_failed(path)
+
+    def try_stat(entry):
+        # 文件在遍历后被删除/移走或无权限时只跳过该文件，不中断整个导入
+        try:
+            return stat_entry(entry)
+        except OSError as e:
+            print(f"读取文件信息 {entry.path} 时出错: {e}")
+            stats['stat_failed'] += 1
+            METRICS.inc('failed')
+            return None
+
+    if checkpoint is None:
+        # DirEntry上缓存了stat结果，直接传给处理线程
+        for entry in media_walker.walk_files(root_dir, predicate=predicate, on_error=on_walk_error):
+            stat_info = try_stat(entry)
+            if stat_info is not None:
+                yield entry.path, stat_info, 'found'
         return
-    
+
+    conn = sqlite3.connect(db_path, timeout=30) if checkpoint.resume else None
+    try:
+        for dir_path, entries in media_walker.walk_dirs(root_dir, predicate=predicate, on_error=on_walk_error):
+            if dir_path in checkpoint.finished:
+                stats['resumed_dirs'] += 1
+                continue
+            if conn is not None:
+                # 逐个按file_path唯一索引判断，批量导入删除了其他索引时同样高效
+                pending = [
+                    entry for entry in entries
+                    if conn.execute(f"SELECT 1 FROM {checkpoint.table} WHERE file_path = ?",
+                                    (entry.path,)).fetchone() is None
+                ]
+                stats['skipped'] += len(entries) - len(pending)
+                entries = pending
+            checkpoint.add_dir(dir_path, len(entries))
+            for entry in entries:
+                stat_info = try_stat(entry)
+                if stat_info is None:
+                    # 该目录本次不记为完成，--resume 时重新处理
+                    checkpoint.file_done(entry.path, False)
+                    continue
+                yield entry.path, stat_info, 'found'
+    finally:
+        if conn is not None:
+            conn.close()
+
+def run_checkpointed_import(root_dir, db_path, write_sql, table, resume=False, **kwargs):
+    """
+    带断点记录的导入：全部完成后清除进度，中断或有文件失败时保留进度供 --resume 使用
+    :return: 统计信息，见run_import_pipeline（另含 'resumed_dirs'、'skipped'）
+    """
+    checkpoint = ImportCheckpoint(root_dir, table=table, resume=resume)
+    checkpoint.start(db_path)
+    walk_stats = {}
+    stats = run_import_pipeline(iter_media_tasks(root_dir, db_path, checkpoint, walk_stats),
+                                db_path, write_sql, table=table, checkpoint=checkpoint, **kwargs)
+    stats['failed'] += walk_stats.pop('stat_failed') + walk_stats.pop('walk_failed')
+    stats.update(walk_stats)
+    if 'error' not in stats and checkpoint.complete:
+        checkpoint.finish(db_path)
+    else:
+        print("部分文件未成功导入，已保存进度，可使用 --resume 继续")
+    return stats
+
+def scan_media_files(root_dir, db_path, workers=PIPELINE_WORKERS, batch_size=PIPELINE_BATCH_SIZE,
+                     table=IMPORT_TABLE, resume=False):
+    """
+    全量导入：遍历root_dir下的媒体文件，边遍历边处理边分批写入（已存在的路径忽略）
+    :param resume: 是否从上次中断处继续
+    :return: 统计信息，见run_checkpointed_import
+    """
+    prepare_target_table(db_path, table)
+    return run_checkpointed_import(root_dir, db_path, build_insert_sql(table), table,
+                                   resume=resume, workers=workers, batch_size=batch_size)
+
+def bulk_load(root_dir, db_path, workers=PIPELINE_WORKERS, batch_size=BULK_BATCH_SIZE, resume=False):
+    """
+    批量导入（首次建库）：直接写入media_data，导入期间删除二级索引和逐行维护的触发器，
+    使用WAL（synchronous=NORMAL）和大事务；结束后重建索引、计数表和全文检索并执行ANALYZE。
+    导入期间API照常查询（没有二级索引，会变慢），app等其他程序不会触碰索引和触发器；
+    进程被强制结束而未收尾时，以 --resume 再次执行或使用 --finish-bulk 补完收尾步骤
+    :param resume: 是否从上次中断处继续
+    :return: 统计信息，见run_checkpointed_import
+    """
+    table = 'media_data'
+    conn = sqlite3.connect(db_path, timeout=30)
     try:
-        import sqlite3
-        conn = sqlite3.connect(db_path)
+        catalog_schema.ensure_schema(conn)
+        catalog_schema.apply_bulk_pragmas(conn)
+        catalog_schema.begin_bulk_load(conn)
+    finally:
+        conn.close()
+
+    try:
+        return run_checkpointed_import(root_dir, db_path, build_insert_sql(table, upsert=True), table,
+                                       resume=resume, workers=workers, batch_size=batch_size,
+                                       bulk=True)
+    finally:
+        print("正在重建索引、计数表和全文检索...")
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            catalog_schema.apply_bulk_pragmas(conn)
+            catalog_schema.finish_bulk_load(conn)
+        finally:
+            conn.close()
+
+def finish_interrupted_bulk_load(db_path):
+    """为被强制结束、尚未收尾的批量导入重建索引、触发器、计数表和全文检索"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if not catalog_schema.is_bulk_loading(conn):
+            print("没有未收尾的批量导入")
+            return
+        print("正在重建索引、计数表和全文检索...")
+        catalog_schema.apply_bulk_pragmas(conn)
+        catalog_schema.finish_bulk_load(conn)
+        print("批量导入收尾完成")
+    finally:
+        conn.close()
+
+# 增量导入
+UPSERT_SQL = build_insert_sql(IMPORT_TABLE, upsert=True)
+
+def path_prefix_range(root_dir):
+    """
+    返回root_dir下所有路径的字符串范围[low, high)，可直接利用file_path上的唯一索引
+    （'0'是'/'之后的下一个字符）
+    """
+    root = os.path.join(os.path.abspath(root_dir), '')
+    return root, root[:-1] + chr(ord(os.sep) + 1)
+
+def is_under_any(file_path, dirs):
+    """file_path是否位于dirs中的某个目录下"""
+    return any(file_path.startswith(os.path.join(path, '')) or file_path == path for path in dirs)
+
+def load_file_index(conn, root_dir, table=IMPORT_TABLE):
+    """
+    一次性读取数据库中root_dir下已有文件的stat信息
+    :return: {file_path: (file_size, file_mtime_ns, file_inode)}
+    """
+    low, high = path_prefix_range(root_dir)
+    cursor = conn.execute(
+        f"SELECT file_path, file_size, file_mtime_ns, file_inode FROM {table} "
+        "WHERE file_path >= ? AND file_path < ?",
+        (low, high)
+    )
+    return {row[0]: (row[1], row[2], row[3]) for row in cursor}
+
+def incremental_scan(root_dir, db_path, remove_missing=True,
+                     workers=PIPELINE_WORKERS, batch_size=PIPELINE_BATCH_SIZE, table=IMPORT_TABLE):
+    """
+    增量导入：只处理新增或变化（大小、修改时间、inode任一不同）的文件，
+    未变化的文件不再读取内容计算哈希
+    :param remove_missing: 是否删除数据库中已不存在于磁盘的文件记录
+    :param workers: 处理线程数
+    :param batch_size: 每个事务写入的行数
+    :param table: 目标表
+    :return: 统计信息 {'added', 'changed', 'removed', 'skipped', 'failed'}
+    :raises NotADirectoryError: root_dir不存在（如硬盘未挂载），此时不能据此删除记录
+    """
+    # 数据库中保存的是绝对路径，遍历产出的路径需要与之一致
+    root_dir = os.path.abspath(root_dir)
+    if not os.path.isdir(root_dir):
+        raise NotADirectoryError(f"目录不存在或未挂载: {root_dir}")
+    stats = {'added': 0, 'changed': 0, 'removed': 0, 'skipped': 0, 'failed': 0}
+    # 无法读取的目录：其下的记录不能视为已删除
+    failed_dirs = []
+
+    def on_walk_error(path, error):
+        print(f"无法读取目录 {path}: {error}")
+        failed_dirs.append(path)
+
+    prepare_target_table(db_path, table)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        catalog_schema.ensure_file_stat_columns(conn, table)
+        known = load_file_index(conn, root_dir, table)
+        print(f"数据库中已有 {len(known)} 条记录")
+
+        # 遍历目录，与已有记录比对stat信息，只把新增或变化的文件送入流水线
+        def pending_tasks():
+            for entry in media_walker.walk_files(root_dir, predicate=lambda e: is_media_file(e.path),
+                                                 on_error=on_walk_error):
+                file_path = entry.path
+                try:
+                    stat_info = stat_entry(entry)
+                except OSError as e:
+                    print(f"读取文件信息 {file_path} 时出错: {e}")
+                    stats['failed'] += 1
+                    known.pop(file_path, None)
+                    continue
+                previous = known.pop(file_path, None)
+                if previous == (stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ino):
+                    stats['skipped'] += 1
+                    METRICS.inc('skipped')
+                    continue
+                yield file_path, stat_info, 'added' if previous is None else 'changed'
+
+        result = run_import_pipeline(pending_tasks(), db_path, build_insert_sql(table, upsert=True),
+                                     workers=workers, batch_size=batch_size, table=table)
+        stats['added'] = result.get('added', 0)
+        stats['changed'] = result.get('changed', 0)
+        stats['failed'] += result['failed']
+        if 'error' in result:
+            # 写入失败时不能据此判断哪些文件已不存在
+            return stats
+        print(f"跳过 {stats['skipped']} 个未变化的文件")
+
         cursor = conn.cursor()
-        
-        insert_sql = """
-        INSERT OR IGNORE INTO media_metadata 
-        (file_name, file_path, file_type, file_size, group_code, 
-         hash_value, parent_folder, created_time, modified_time)
-        VALUES (:file_name, :file_path, :file_type, :file_size, :group_code,
-                :hash_value, :parent_folder, :created_time, :modified_time)
-        """
-        
-        cursor.executemany(insert_sql, media_files)
+        # 剩余的记录在磁盘上已找不到（位于无法读取的目录下的除外）
+        if failed_dirs:
+            unreadable = [path for path in known if is_under_any(path, failed_dirs)]
+            for path in unreadable:
+                del known[path]
+            print(f"{len(failed_dirs)} 个目录无法读取，保留其下的 {len(unreadable)} 条记录")
+        if remove_missing and known:
+            cursor.executemany(
+                f"DELETE FROM {table} WHERE file_path = ?",
+                ((file_path,) for file_path in known)
+            )
+            stats['removed'] = len(known)
+        elif known:
+            print(f"有 {len(known)} 条记录对应的文件已不存在（未删除）")
         conn.commit()
-        print(f"成功插入 {cursor.rowcount} 条记录到数据库")
-        
     except sqlite3.Error as e:
         print(f"数据库操作出错: {e}")
         conn.rollback()
     finally:
-        if 'conn' in locals() and conn:
+        conn.close()
+    return stats
+
+# 监听模式
+def file_signature(stat_info):
+    """与load_file_index返回值顺序一致的stat签名"""
+    return stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ino
+
+def build_rename_sql(table=IMPORT_TABLE):
+    """文件改名/移动时原地更新记录（保留media_id、poster_path等）"""
+    columns = table_columns(table)
+    return (
+        f"UPDATE {table} SET " + ', '.join(f"{column} = :{column}" for column in columns) +
+        " WHERE file_path = :old_path"
+    )
+
+def collect_watch_changes(conn, changes, table=IMPORT_TABLE):
+    """
+    把监听到的路径与库中记录比对，整理出需要写库的变化
+    :param changes: [(path, is_dir)]，is_dir为True时比对整个目录
+    :return: (present, vanished, new_paths)
+        present: {file_path: stat_info}，磁盘上存在且与库中记录不同的文件
+        vanished: {file_path: (file_size, file_mtime_ns, file_inode)}，库中有但磁盘上已不存在
+        new_paths: present中库里原本没有的路径
+    """
+    present, vanished, new_paths = {}, {}, set()
+    for path, is_dir in changes:
+        if is_dir:
+            known = load_file_index(conn, path, table)
+            if os.path.isdir(path):
+                for entry in media_walker.walk_files(path, predicate=lambda e: is_media_file(e.path)):
+                    try:
+                        stat_info = entry.stat()
+                    except OSError:
+                        continue
+                    previous = known.pop(entry.path, None)
+                    if previous != file_signature(stat_info):
+                        present[entry.path] = stat_info
+                        if previous is None:
+                            new_paths.add(entry.path)
+            vanished.update(known)
+            continue
+
+        row = conn.execute(
+            f"SELECT file_size, file_mtime_ns, file_inode FROM {table} WHERE file_path = ?",
+            (path,)
+        ).fetchone()
+        try:
+            stat_info = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            if row is not None:
+                vanished[path] = row
+            continue
+        except OSError as e:
+            print(f"读取文件信息 {path} 时出错: {e}")
+            continue
+        if not is_media_file(path) or not os.path.isfile(path):
+            continue
+        if row != file_signature(stat_info):
+            present[path] = stat_info
+            if row is None:
+                new_paths.add(path)
+
+    # 同一路径在目录比对中消失、又单独出现时，以磁盘现状为准
+    for path in present:
+        vanished.pop(path, None)
+    return present, vanished, new_paths
+
+def apply_watch_changes(conn, changes, table=IMPORT_TABLE):
+    """
+    处理一批稳定下来的路径：新增/变化的文件走process_file后UPSERT，
+    改名/移动（新路径的inode、大小、修改时间与某条消失的记录相同）原地更新路径并沿用哈希，
+    其余消失的记录删除。签名在消失的记录或新路径中不唯一时（如同一文件的多个硬链接）无法确定对应关系，
+    按删除+新增处理。整批在一个事务中提交，media_data上的触发器会更新目录版本号
+    :return: 统计信息 {'added', 'changed', 'renamed', 'removed', 'failed'}
+    """
+    stats = {'added': 0, 'changed': 0, 'renamed': 0, 'removed': 0, 'failed': 0}
+    present, vanished, new_paths = collect_watch_changes(conn, changes, table)
+
+    renames = []
+    vanished_by_signature, new_by_signature = {}, {}
+    for old_path, signature in vanished.items():
+        vanished_by_signature.setdefault(signature, []).append(old_path)
+    for path in new_paths:
+        new_by_signature.setdefault(file_signature(present[path]), []).append(path)
+    for signature, paths in new_by_signature.items():
+        old_paths = vanished_by_signature.get(signature, [])
+        if len(paths) == 1 and len(old_paths) == 1:
+            renames.append((old_paths[0], paths[0], present.pop(paths[0])))
+            del vanished[old_paths[0]]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=HASH_ENGINE.workers) as executor:
+        results = list(executor.map(lambda item: process_file(*item), present.items()))
+
+    rename_sql = build_rename_sql(table)
+    for old_path, path, stat_info in renames:
+        hash_value = conn.execute(
+            f"SELECT hash_value FROM {table} WHERE file_path = ?", (old_path,)
+        ).fetchone()[0]
+        record = process_file(path, stat_info, hash_value=hash_value)
+        if not record:
+            stats['failed'] += 1
+            continue
+        record['old_path'] = old_path
+        conn.execute(rename_sql, record)
+        stats['renamed'] += 1
+
+    rows = []
+    for path, record in zip(present, results):
+        if not record:
+            stats['failed'] += 1
+            continue
+        rows.append(record)
+        stats['changed' if path not in new_paths else 'added'] += 1
+    conn.executemany(build_insert_sql(table, upsert=True), rows)
+    conn.executemany(
+        f"DELETE FROM {table} WHERE file_path = ?",
+        ((file_path,) for file_path in vanished)
+    )
+    stats['removed'] = len(vanished)
+    conn.commit()
+    return stats
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def watch_catalog(root_dir, db_path, table='media_data', debounce=media_watcher.DEFAULT_DEBOUNCE,
+                  poll_interval=media_watcher.DEFAULT_POLL_INTERVAL, force_polling=False,
+                  probe=False, phash=False):
+    """
+    常驻监听root_dir，近实时地把变化同步到数据库（Ctrl+C退出）
+    先启动监听再做一次增量比对，补上未运行期间的变化；之后只处理被改动的路径
+    :param debounce: 路径在这么多秒内没有新事件才处理
+    :param poll_interval: inotify不可用时的轮询间隔（秒）
+    :param force_polling: 强制使用轮询
+    :param probe: 每批变化同步后是否提取新文件的时长、分辨率等媒体信息
+    :param phash: 每批变化同步后是否计算新文件的感知哈希（在probe之后，视频取帧需要时长）
+    """
+    root_dir = os.path.abspath(root_dir)
+    prepare_target_table(db_path, table)
+    watcher = media_watcher.create_watcher(root_dir, predicate=is_media_file,
+                                           poll_interval=poll_interval, force_polling=force_polling)
+    conn = None
+    # 作为服务运行时收到SIGTERM也按Ctrl+C处理，保证当前批次提交后再退出
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    try:
+        stats = incremental_scan(root_dir, db_path, table=table)
+        print(
+            f"初始比对完成：新增 {stats['added']}，变化 {stats['changed']}，"
+            f"删除 {stats['removed']}，跳过 {stats['skipped']}，失败 {stats['failed']}"
+        )
+        if probe:
+            media_probe.probe_catalog(db_path)
+        if phash:
+            media_phash.hash_catalog(db_path)
+        print(f"开始监听 {root_dir}（{type(watcher).__name__}），按 Ctrl+C 退出")
+
+        conn = sqlite3.connect(db_path, timeout=30)
+        debouncer = media_watcher.Debouncer(delay=debounce)
+        while True:
+            debouncer.add(watcher.read_events(timeout=max(0.1, debounce / 2)))
+            ready = debouncer.pop_ready()
+            if not ready:
+                continue
+            try:
+                stats = apply_watch_changes(conn, ready, table)
+            except sqlite3.Error as e:
+                # 数据库暂时不可写（如被锁），稍后重试这批路径
+                print(f"数据库操作出错: {e}，稍后重试")
+                conn.rollback()
+                debouncer.add(ready)
+                continue
+            if any(stats.values()):
+                print(
+                    f"已同步：新增 {stats['added']}，变化 {stats['changed']}，改名 {stats['renamed']}，"
+                    f"删除 {stats['removed']}，失败 {stats['failed']}"
+                )
+                if probe and (stats['added'] or stats['changed']):
+                    media_probe.probe_catalog(db_path)
+                if phash and (stats['added'] or stats['changed']):
+                    media_phash.hash_catalog(db_path)
+    except KeyboardInterrupt:
+        print("停止监听")
+    finally:
+        watcher.close()
+        if conn is not None:
             conn.close()
 
-def main():
+# 多硬盘分片
+def run_all_shards(args, argv):
+    """
+    为每个硬盘已挂载的分片启动一个导入进程（参数与当前命令相同，另加 --shard <名称>），
+    各分片写入各自的数据库，互不锁定；子进程的输出加上分片名前缀
+    :param argv: 转发给子进程的命令行参数（已去掉 --all-shards）
+    :return: 所有子进程都成功时返回True
+    """
+    shards = catalog_shards.load_shards(args.shards_file)
+    online = [shard for shard in shards if os.path.isdir(shard['root'])]
+    for shard in shards:
+        if shard not in online:
+            print(f"分片 {shard['name']} 的硬盘未挂载（{shard['root']}），跳过")
+    if not online:
+        return True
+
+    def relay(name, stream):
+        for line in stream:
+            print(f"[{name}] {line}", end='', flush=True)
+
+    processes = []
+    for shard in online:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)] + argv + ['--shard', shard['name']],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
+        )
+        thread = threading.Thread(target=relay, args=(shard['name'], process.stdout), daemon=True)
+        thread.start()
+        processes.append((shard, process, thread))
+
+    ok = True
+    for shard, process, thread in processes:
+        # Ctrl+C同时发给了子进程，这里继续等待它们提交并退出
+        while True:
+            try:
+                returncode = process.wait()
+                break
+            except KeyboardInterrupt:
+                continue
+        thread.join()
+        if returncode != 0:
+            ok = False
+            print(f"分片 {shard['name']} 导入失败（退出码 {returncode}）")
+    return ok
+
+def apply_shard_args(parser, args):
+    """--shard：根目录和数据库取自分片配置"""
+    try:
+        shard = catalog_shards.find_shard(catalog_shards.load_shards(args.shards_file), args.shard)
+    except (OSError, ValueError) as e:
+        parser.error(f"读取分片配置失败: {e}")
+    if shard is None:
+        parser.error(f"分片配置中没有 {args.shard}")
+    if not os.path.isdir(shard['root']):
+        parser.error(f"分片 {args.shard} 的硬盘未挂载（{shard['root']}）")
+    os.makedirs(os.path.dirname(shard['db']), exist_ok=True)
+    args.root_directory = shard['root']
+    args.db_path = shard['db']
+
+def parse_args():
+    """解析命令行参数"""
     # 配置参数：根目录 /Volumes/STORE/sex_files/tg    /Volumes/STORE/sex_files/telegram_download
     # 替换为你的实际根目录
-    root_directory = "/Volumes/STORE/sex_files/tg"  
-    db_path = "/Users/lee/sqlite3/media_player.db"
+    parser = argparse.ArgumentParser(description="扫描媒体文件并导入数据库")
+    parser.add_argument('root_directory', nargs='?', default="/Volumes/STORE/sex_files/tg",
+                        help="要扫描的根目录")
+    parser.add_argument('--db', dest='db_path', default="/Users/lee/sqlite3/media_player.db",
+                        help="数据库文件路径")
+    parser.add_argument('--incremental', action='store_true',
+                        help="增量导入：跳过未变化的文件，更新变化的文件，删除已不存在的文件记录")
+    parser.add_argument('--keep-missing', action='store_true',
+                        help="增量导入时保留磁盘上已不存在的文件记录")
+    parser.add_argument('--table', choices=TARGET_TABLES, default=None,
+                        help="写入的表（默认media_metadata，--bulk/--watch时为media_data）")
+    parser.add_argument('--bulk', action='store_true',
+                        help="批量导入模式（首次建库）：写入media_data，导入后统一重建索引并ANALYZE")
+    parser.add_argument('--finish-bulk', action='store_true',
+                        help="只为 --db 补完未收尾的批量导入（重建索引、计数表和全文检索），用于导入进程被强制结束后")
+    parser.add_argument('--watch', action='store_true',
+                        help="常驻监听模式：inotify（不可用时轮询）监听目录变化，近实时同步到数据库")
+    parser.add_argument('--debounce', type=float, default=media_watcher.DEFAULT_DEBOUNCE,
+                        help="监听模式下路径稳定多少秒后才处理")
+    parser.add_argument('--poll-interval', type=float, default=media_watcher.DEFAULT_POLL_INTERVAL,
+                        help="监听模式下轮询的间隔秒数（inotify不可用时）")
+    parser.add_argument('--force-polling', action='store_true',
+                        help="监听模式下强制使用轮询")
+    parser.add_argument('--resume', action='store_true',
+                        help="从上次中断处继续导入（跳过已完成的目录和已写入的文件）")
+    parser.add_argument('--probe', action='store_true',
+                        help="导入后用ffprobe/Pillow提取media_data中新增或变化文件的时长、分辨率等信息")
+    parser.add_argument('--phash', action='store_true',
+                        help="导入后为media_data中新增或变化的图片/视频计算感知哈希（用于查找近似文件，建议与--probe同用）")
+    parser.add_argument('--workers', type=int, default=PIPELINE_WORKERS,
+                        help="处理线程数（默认为读取并发上限与哈希并发数之和）")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help=f"每个事务提交的记录数（默认{PIPELINE_BATCH_SIZE}，--bulk时为{BULK_BATCH_SIZE}）")
+    parser.add_argument('--shards', dest='shards_file', default=None,
+                        help="多硬盘分片配置文件(JSON，格式见catalog_shards.py)")
+    parser.add_argument('--shard', default=None,
+                        help="导入指定分片：根目录和数据库取自分片配置，写入media_data")
+    parser.add_argument('--all-shards', action='store_true',
+                        help="为每个硬盘已挂载的分片各启动一个导入进程，并行导入")
+    parser.add_argument('--hash-mode', choices=HASH_MODES, default=HASH_MODE,
+                        help="head: 哈希文件开头约6.5MB；sample: 哈希文件大小+头/中/尾采样块"
+                             "（改变方式后hash_value与已导入的记录不可比较，需要全量重新导入）")
+    parser.add_argument('--sample-blocks', type=int, default=SAMPLE_BLOCKS,
+                        help=f"sample方式的采样块数（每块{HASH_BLOCK_SIZE}字节，均匀分布，含头尾）")
+    parser.add_argument('--hash-algorithm', default=HASH_ALGORITHM,
+                        help="哈希算法：hashlib算法名、xxh3_128等（需安装xxhash）或fast（非加密快速哈希）")
+    hash_engine.add_engine_arguments(parser)
+    import_metrics.add_metrics_arguments(parser)
+    args = parser.parse_args()
+    if args.sample_blocks < 1:
+        parser.error("--sample-blocks 至少为1")
+    if sum((args.bulk, args.incremental, args.watch)) > 1:
+        parser.error("--bulk、--incremental、--watch 只能选择一个")
+    if args.resume and (args.incremental or args.watch):
+        parser.error("--resume 只用于全量或批量导入，增量导入本身会跳过已写入且未变化的文件")
+    if args.bulk and args.table not in (None, 'media_data'):
+        parser.error("--bulk 只能写入 media_data")
+    if (args.shard or args.all_shards) and not args.shards_file:
+        parser.error("--shard/--all-shards 需要同时指定 --shards 分片配置文件")
+    if args.shard and args.all_shards:
+        parser.error("--shard 和 --all-shards 只能选择一个")
+    if args.shard:
+        apply_shard_args(parser, args)
+    if args.table is None:
+        sharded = args.shard or args.all_shards
+        args.table = 'media_data' if args.bulk or args.watch or sharded else IMPORT_TABLE
+    if args.batch_size is None:
+        args.batch_size = BULK_BATCH_SIZE if args.bulk else PIPELINE_BATCH_SIZE
+    return args
+
+def main():
+    global HASH_ENGINE, HASH_MODE, SAMPLE_BLOCKS, PRINT_BATCH_PROGRESS
+    args = parse_args()
+    # 默认引擎（及其哈希缓存连接）不再使用，下面按命令行参数重新创建
+    HASH_ENGINE.close()
+    if args.all_shards:
+        argv = [arg for arg in sys.argv[1:] if arg != '--all-shards']
+        if not run_all_shards(args, argv):
+            sys.exit(1)
+        return
+    if args.finish_bulk:
+        finish_interrupted_bulk_load(args.db_path)
+        return
+    HASH_MODE = args.hash_mode
+    SAMPLE_BLOCKS = args.sample_blocks
+    HASH_ENGINE = hash_engine.engine_from_args(
+        args, algorithm=args.hash_algorithm, max_bytes=HASH_BLOCK_SIZE * HASH_MAX_BLOCKS, metrics=METRICS
+    )
+    reporter = import_metrics.reporter_from_args(METRICS, args)
+    if reporter:
+        PRINT_BATCH_PROGRESS = not args.progress
+        reporter.start()
+    try:
+        run(args)
+    except KeyboardInterrupt:
+        print("导入已中断，已提交的数据和进度已保存，可使用 --resume 继续")
+    finally:
+        if reporter:
+            reporter.stop()
+        HASH_ENGINE.close()
+
+def run(args):
+    root_directory = args.root_directory
+    db_path = args.db_path
+    if not os.path.isdir(root_directory):
+        # 硬盘未挂载时继续执行会把该硬盘的记录当作已删除
+        print(f"目录不存在或未挂载: {root_directory}")
+        sys.exit(1)
     
+    if args.watch:
+        watch_catalog(root_directory, db_path, table=args.table, debounce=args.debounce,
+                      poll_interval=args.poll_interval, force_polling=args.force_polling,
+                      probe=args.probe, phash=args.phash)
+        return
+
     print(f"开始扫描目录: {root_directory}")
-    media_files = scan_media_files(root_directory)
+    if args.incremental:
+        stats = incremental_scan(root_directory, db_path, remove_missing=not args.keep_missing,
+                                 workers=args.workers, batch_size=args.batch_size, table=args.table)
+        print(
+            f"增量导入完成：新增 {stats['added']}，变化 {stats['changed']}，"
+            f"删除 {stats['removed']}，跳过 {stats['skipped']}，失败 {stats['failed']}"
+        )
+    elif args.bulk:
+        stats = bulk_load(root_directory, db_path, workers=args.workers, batch_size=args.batch_size,
+                          resume=args.resume)
+    else:
+        stats = scan_media_files(root_directory, db_path, workers=args.workers,
+                                 batch_size=args.batch_size, table=args.table, resume=args.resume)
+    if not args.incremental:
+        print(f"扫描完成，共处理 {stats['processed']} 个媒体文件，"
+              f"成功插入 {stats['written']} 条记录，失败 {stats['failed']}")
+        if args.resume:
+            print(f"续传跳过 {stats['resumed_dirs']} 个已完成目录、{stats['skipped']} 个已写入的文件")
     
-    print(f"扫描完成，共发现 {len(media_files)} 个媒体文件")
-    if media_files:
-        batch_insert_to_db(media_files, db_path)
+    if args.probe:
+        stats = media_probe.probe_catalog(db_path)
+        print(f"媒体信息提取完成：成功 {stats['probed']}，失败 {stats['failed']}")
+    if args.phash:
+        stats = media_phash.hash_catalog(db_path)
+        print(f"感知哈希计算完成：成功 {stats['hashed']}，失败 {stats['failed']}")
     
     print("操作完成")
 
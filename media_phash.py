@@ -0,0 +1,517 @@
+"""
+感知哈希：查找重新编码、缩放过的近似重复图片和视频
+
+字节级哈希只能找出完全相同的文件；同一张图片/同一段视频被重新压缩、改了分辨率后，
+感知哈希仍然相近（汉明距离很小）。
+- 图片：Pillow解码后计算64位pHash（DCT低频）和dHash（相邻像素梯度），frame为0
+- 视频：通过ffmpeg在时长的10%/30%/50%/70%/90%处各取一帧，分别计算，frame为1..5
+  （两段视频按相同位置的帧比较，距离取各帧的平均值）
+
+结果写入media_phash表，pHash按16位切成4段分别建索引（multi-index hashing）：
+两个哈希的汉明距离不超过d时，至少有一段的距离不超过 d // 4，
+因此只需在每段上查找距离不超过 d // 4 的取值，不用和全部记录逐一比较。
+查找全部近似重复（--find）时在内存中建立同样的分段索引，段数按记录数选择（记录越多段越长）。
+每条记录同时写入计算时的文件大小和修改时间(phash_size/phash_mtime_ns)，文件未变化时不会重复计算。
+
+用法:
+    python media_phash.py --db /Users/lee/sqlite3/media_player.db                  # 计算新增/变化文件的感知哈希
+    python media_phash.py --db /Users/lee/sqlite3/media_player.db --find           # 列出所有近似重复的文件组
+    python media_phash.py --db /Users/lee/sqlite3/media_player.db --similar /Volumes/STORE/a.jpg
+"""
+import argparse
+import concurrent.futures
+import functools
+import itertools
+import json
+import math
+import sqlite3
+import subprocess
+from collections import defaultdict
+
+import catalog_schema
+import catalog_shards
+
+try:
+    import ffmpeg
+except ImportError:
+    ffmpeg = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DATABASE_PATH = '/Users/lee/sqlite3/media_player.db'
+
+# 解码/取帧都比较耗时（ffmpeg为外部进程），线程池并行
+PHASH_WORKERS = 4
+PHASH_BATCH_SIZE = 100
+FRAME_TIMEOUT = 30
+
+# 取帧/缩放后的灰度图边长，pHash和dHash都从这张小图计算
+FRAME_SIZE = 64
+# 视频采样帧在时长中的位置（避开片头片尾），frame序号从1开始
+VIDEO_FRAME_POSITIONS = (0.1, 0.3, 0.5, 0.7, 0.9)
+IMAGE_FRAME = 0
+
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+BAND_MASK = (1 << catalog_schema.PHASH_BAND_BITS) - 1
+# 默认判定为近似重复的最大汉明距离（64位中不同的位数）：重新压缩、缩放的副本一般在4以内；
+# 距离越大每段的查找半径越大，--find 的耗时增长很快（10万个文件：5约7秒，8约100秒）
+DEFAULT_MAX_DISTANCE = 5
+# 查询允许的最大距离：每段的查找半径为 d // 4，半径3时每段要查697个取值
+MAX_DISTANCE = 15
+
+# pHash：32x32灰度图做DCT，取左上角8x8低频系数
+_DCT_SIZE = 32
+_DCT_KEEP = 8
+_DCT_COS = [
+    [math.cos((2 * x + 1) * u * math.pi / (2 * _DCT_SIZE)) for x in range(_DCT_SIZE)]
+    for u in range(_DCT_KEEP)
+]
+
+def box_resize(pixels, width, height, new_width, new_height):
+    """
+    灰度图区域平均缩小
+    :param pixels: 按行排列的灰度值序列，长度为 width * height
+    :return: 按行排列的灰度值列表
+    """
+    result = []
+    for y in range(new_height):
+        y0 = y * height // new_height
+        y1 = max(y0 + 1, (y + 1) * height // new_height)
+        for x in range(new_width):
+            x0 = x * width // new_width
+            x1 = max(x0 + 1, (x + 1) * width // new_width)
+            total = 0
+            for row in range(y0, y1):
+                offset = row * width
+                total += sum(pixels[offset + x0:offset + x1])
+            result.append(total / ((y1 - y0) * (x1 - x0)))
+    return result
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bit
+    return value
+
+def dhash(pixels, width, height):
+    """dHash：缩小到9x8，每行比较相邻像素的明暗"""
+    small = box_resize(pixels, width, height, 9, 8)
+    return _bits_to_int(
+        int(small[row * 9 + x + 1] > small[row * 9 + x]) for row in range(8) for x in range(8)
+    )
+
+def phash(pixels, width, height):
+    """pHash：缩小到32x32做二维DCT，左上角8x8低频系数与其中位数比较"""
+    small = box_resize(pixels, width, height, _DCT_SIZE, _DCT_SIZE)
+    # 先对每行做DCT（只算前8个系数），再对列做DCT
+    rows = [
+        [sum(c * p for c, p in zip(cos_u, small[y * _DCT_SIZE:(y + 1) * _DCT_SIZE])) for cos_u in _DCT_COS]
+        for y in range(_DCT_SIZE)
+    ]
+    coefficients = [
+        sum(cos_v[y] * rows[y][u] for y in range(_DCT_SIZE))
+        for cos_v in _DCT_COS for u in range(_DCT_KEEP)
+    ]
+    median = sorted(coefficients)[len(coefficients) // 2]
+    return _bits_to_int(int(value > median) for value in coefficients)
+
+def to_signed(value):
+    """64位无符号整数转为SQLite可存储的有符号整数"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+def to_unsigned(value):
+    return value & HASH_MASK
+
+def hash_bands(value):
+    """把64位哈希切成PHASH_BANDS段，第0段为最低16位"""
+    value = to_unsigned(value)
+    return [(value >> (band * catalog_schema.PHASH_BAND_BITS)) & BAND_MASK
+            for band in range(catalog_schema.PHASH_BANDS)]
+
+def hamming(a, b):
+    """两个64位哈希的汉明距离"""
+    return bin((a ^ b) & HASH_MASK).count('1')
+
+@functools.lru_cache(maxsize=None)
+def flip_masks(bits, radius):
+    """bits位的取值中翻转不超过radius位的所有掩码（含0）"""
+    masks = [0]
+    for distance in range(1, radius + 1):
+        for positions in itertools.combinations(range(bits), distance):
+            masks.append(sum(1 << position for position in positions))
+    return tuple(masks)
+
+def band_variants(value, radius, bits=catalog_schema.PHASH_BAND_BITS):
+    """与一段取值的汉明距离不超过radius的所有取值（含自身）"""
+    return [value ^ mask for mask in flip_masks(bits, radius)]
+
+def band_radius(max_distance, bands=catalog_schema.PHASH_BANDS):
+    """距离不超过max_distance时，至少有一段的距离不超过该半径"""
+    return max_distance // bands
+
+def hash_pixels(pixels):
+    """由FRAME_SIZE x FRAME_SIZE的灰度图计算 (pHash, dHash)"""
+    return phash(pixels, FRAME_SIZE, FRAME_SIZE), dhash(pixels, FRAME_SIZE, FRAME_SIZE)
+
+def image_pixels(file_path):
+    """用Pillow解码图片并缩小为FRAME_SIZE x FRAME_SIZE灰度图（JPEG在解码时就缩小，速度快很多）"""
+    with Image.open(file_path) as img:
+        img.draft('L', (FRAME_SIZE * 4, FRAME_SIZE * 4))
+        small = img.convert('L').resize((FRAME_SIZE, FRAME_SIZE), Image.BOX)
+        return list(small.getdata())
+
+def video_frame_pixels(file_path, seconds):
+    """
+    用ffmpeg取指定时间点的一帧，缩小为FRAME_SIZE x FRAME_SIZE灰度图
+    :return: 灰度值bytes，取帧失败（如超出时长）时返回None
+    """
+    process = (
+        ffmpeg.input(file_path, ss=seconds)
+        .filter('scale', FRAME_SIZE, FRAME_SIZE)
+        .output('pipe:', vframes=1, format='rawvideo', pix_fmt='gray')
+        .run_async(pipe_stdout=True, pipe_stderr=True)
+    )
+    try:
+        out, _ = process.communicate(timeout=FRAME_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise
+    return out if len(out) == FRAME_SIZE * FRAME_SIZE else None
+
+def hash_image(file_path):
+    """:return: [(frame, pHash, dHash)]"""
+    return [(IMAGE_FRAME,) + hash_pixels(image_pixels(file_path))]
+
+def hash_video(file_path, duration=None):
+    """
+    :param duration: 时长(秒)，为空时用ffprobe读取
+    :return: [(frame, pHash, dHash)]，取帧失败的位置跳过
+    """
+    if not duration:
+        duration = float(ffmpeg.probe(file_path, timeout=FRAME_TIMEOUT)['format']['duration'])
+    hashes = []
+    for frame, position in enumerate(VIDEO_FRAME_POSITIONS, start=1):
+        pixels = video_frame_pixels(file_path, duration * position)
+        if pixels is not None:
+            hashes.append((frame,) + hash_pixels(pixels))
+    return hashes
+
+def hash_media(file_path, media_kind, duration=None):
+    """按媒体类别计算感知哈希，出错时打印并返回空列表"""
+    try:
+        if media_kind == 'video':
+            return hash_video(file_path, duration)
+        if media_kind == 'image':
+            return hash_image(file_path)
+    except Exception as e:
+        message = e.stderr.decode('utf8', 'replace').strip() if getattr(e, 'stderr', None) else e
+        print(f"计算感知哈希 {file_path} 时出错: {message}")
+    return []
+
+def available_kinds():
+    """当前环境能计算的媒体类别（视频需要ffmpeg-python，图片需要Pillow）"""
+    kinds = []
+    if ffmpeg is not None:
+        kinds.append('video')
+    if Image is not None:
+        kinds.append('image')
+    return kinds
+
+def phash_rows(media_id, hashes):
+    """media_phash表的写入行"""
+    return [
+        (media_id, frame, to_signed(p), to_signed(d), *hash_bands(p))
+        for frame, p, d in hashes
+    ]
+
+INSERT_PHASH_SQL = (
+    "INSERT INTO media_phash (media_id, frame, phash, dhash, band0, band1, band2, band3) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+UPDATE_PHASH_STATE_SQL = """
+UPDATE media_data SET phash_size = :file_size, phash_mtime_ns = :file_mtime_ns
+WHERE media_id = :media_id AND file_size IS :file_size AND file_mtime_ns IS :file_mtime_ns
+"""
+
+def hash_catalog(db_path, workers=PHASH_WORKERS, batch_size=PHASH_BATCH_SIZE):
+    """
+    为media_data中新增或变化（file_size/file_mtime_ns与上次计算时不同）的文件计算感知哈希
+    按media_id分批读取、并行计算、逐批提交
+    :return: 统计信息 {'hashed', 'failed'}
+    """
+    stats = {'hashed': 0, 'failed': 0}
+    kinds = available_kinds()
+    if not kinds:
+        print("未安装ffmpeg-python和Pillow，跳过感知哈希计算")
+        return stats
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        catalog_schema.ensure_schema(conn)
+        query = (
+            "SELECT media_id, file_path, media_kind, duration, file_size, file_mtime_ns FROM media_data "
+            f"WHERE media_id > ? AND media_kind IN ({', '.join('?' * len(kinds))}) "
+            "AND (phash_size IS NOT file_size OR phash_mtime_ns IS NOT file_mtime_ns) "
+            "ORDER BY media_id LIMIT ?"
+        )
+        last_id = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                rows = conn.execute(query, [last_id] + kinds + [batch_size]).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1]['media_id']
+                results = executor.map(
+                    lambda row: hash_media(row['file_path'], row['media_kind'], row['duration']), rows
+                )
+                inserts, states = [], []
+                for row, hashes in zip(rows, results):
+                    # 失败的文件同样记录状态，文件变化后才重试
+                    stats['hashed' if hashes else 'failed'] += 1
+                    inserts.extend(phash_rows(row['media_id'], hashes))
+                    states.append({'media_id': row['media_id'], 'file_size': row['file_size'],
+                                   'file_mtime_ns': row['file_mtime_ns']})
+                conn.executemany("DELETE FROM media_phash WHERE media_id = ?",
+                                 [(row['media_id'],) for row in rows])
+                conn.executemany(INSERT_PHASH_SQL, inserts)
+                conn.executemany(UPDATE_PHASH_STATE_SQL, states)
+                conn.commit()
+                print(f"已计算 {stats['hashed']} 个文件的感知哈希，失败 {stats['failed']}...")
+    except sqlite3.Error as e:
+        print(f"数据库操作出错: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+    return stats
+
+def media_distance(hashes_a, hashes_b):
+    """
+    两个文件的距离：相同序号的帧的pHash距离的平均值
+    :param hashes_a: {frame: pHash}
+    :return: 距离，没有可比较的帧时返回None
+    """
+    frames = hashes_a.keys() & hashes_b.keys()
+    if not frames:
+        return None
+    return sum(hamming(hashes_a[frame], hashes_b[frame]) for frame in frames) / len(frames)
+
+def load_hashes(conn, media_ids):
+    """:return: {media_id: {frame: pHash(无符号)}}"""
+    hashes = defaultdict(dict)
+    for media_id, frame, value in catalog_shards.select_by_media_ids(conn, 'media_phash', "frame, phash",
+                                                                      media_ids):
+        hashes[media_id][frame] = to_unsigned(value)
+    return hashes
+
+def similar_candidates_query(frame, value, max_distance):
+    """
+    按段查找候选的SQL（各段的取值直接写入语句，不受参数个数上限限制）
+    :return: (SQL, 参数)
+    """
+    radius = band_radius(max_distance)
+    conditions = [
+        f"band{band} IN ({', '.join(str(v) for v in band_variants(band_value, radius))})"
+        for band, band_value in enumerate(hash_bands(value))
+    ]
+    return (
+        "SELECT media_id FROM media_phash WHERE frame = ? AND (" + " OR ".join(conditions) + ")",
+        [frame]
+    )
+
+def query_similar(conn, media_id, max_distance=DEFAULT_MAX_DISTANCE, limit=None):
+    """
+    查找与指定文件近似的文件
+    :return: [(media_id, 距离)]，按距离从小到大；该文件还没有感知哈希时返回None
+    """
+    source = load_hashes(conn, [media_id]).get(media_id)
+    if not source:
+        return None
+    candidates = set()
+    for frame, value in source.items():
+        query, params = similar_candidates_query(frame, value, max_distance)
+        candidates.update(row[0] for row in conn.execute(query, params))
+    candidates.discard(media_id)
+    results = []
+    for candidate, hashes in load_hashes(conn, candidates).items():
+        distance = media_distance(source, hashes)
+        if distance is not None and distance <= max_distance:
+            results.append((candidate, distance))
+    results.sort(key=lambda item: (item[1], item[0]))
+    return results[:limit] if limit else results
+
+def choose_bands(max_distance, size):
+    """
+    为内存索引选择段数：段越多每段越短，要查的取值越少，但每个取值命中的记录越多
+    按 每次查找的取值数 * (1 + 每个取值的预期记录数) 估算开销，取最小的段数
+    （数据库中的段固定为16位，内存索引按数据量选择，记录越多段越长）
+    """
+    best_bands, best_cost = catalog_schema.PHASH_BANDS, None
+    for bands in range(1, 17):
+        radius = max_distance // bands
+        if radius > 4:
+            # 半径太大时每段要查的取值数以万计，不考虑
+            continue
+        bits = HASH_BITS // bands
+        lookups = bands * len(flip_masks(bits + 1, radius))
+        cost = lookups * (1 + size / (1 << bits))
+        if best_cost is None or cost < best_cost:
+            best_bands, best_cost = bands, cost
+    return best_bands
+
+class HammingIndex:
+    """
+    内存中的multi-index hashing索引：64位哈希切成bands段，每段一个 {段取值: [键]} 字典
+    两个哈希的距离不超过d时至少有一段的距离不超过 d // bands，
+    因此查找时每段只需查距离不超过该半径的取值
+    :param max_distance: 查找的最大距离
+    :param size: 预计加入的哈希数，用于选择段数
+    """
+
+    def __init__(self, max_distance, size):
+        self.max_distance = max_distance
+        bands = choose_bands(max_distance, size)
+        # 64位不能整除时前几段多1位
+        self.widths = [HASH_BITS // bands + (1 if band < HASH_BITS % bands else 0) for band in range(bands)]
+        self.shifts = [sum(self.widths[:band]) for band in range(bands)]
+        self.radius = max_distance // bands
+        self.tables = [defaultdict(list) for _ in range(bands)]
+
+    def _bands(self, value):
+        return [(value >> shift) & ((1 << width) - 1) for shift, width in zip(self.shifts, self.widths)]
+
+    def add(self, key, value):
+        for table, band_value in zip(self.tables, self._bands(value)):
+            table[band_value].append(key)
+
+    def candidates(self, value):
+        """可能与value距离不超过max_distance的键（需再按实际距离过滤）"""
+        found = set()
+        for table, width, band_value in zip(self.tables, self.widths, self._bands(value)):
+            get = table.get
+            for mask in flip_masks(width, self.radius):
+                keys = get(band_value ^ mask)
+                if keys:
+                    found.update(keys)
+        return found
+
+def find_similar_groups(conn, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    找出所有近似重复的文件组（距离不超过max_distance的文件对连通成组）
+    每个文件只在同序号帧的索引中查找候选，整体开销与文件数近似线性，而不是两两比较
+    :return: [{'media_ids': [...], 'max_distance': 组内相连文件对的最大距离}]，按文件数从多到少
+    """
+    hashes = defaultdict(dict)
+    for media_id, frame, value in conn.execute("SELECT media_id, frame, phash FROM media_phash"):
+        hashes[media_id][frame] = to_unsigned(value)
+    # 每个帧序号一个索引，只与同序号的帧比较
+    frame_sizes = defaultdict(int)
+    for frames in hashes.values():
+        for frame in frames:
+            frame_sizes[frame] += 1
+    indexes = {frame: HammingIndex(max_distance, size) for frame, size in frame_sizes.items()}
+    for media_id, frames in hashes.items():
+        for frame, value in frames.items():
+            indexes[frame].add(media_id, value)
+
+    parent = {}
+
+    def find(item):
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    # 平均距离不超过d时至少有一帧的距离不超过d，因此逐帧查找候选不会遗漏
+    edges = {}
+    for media_id, frames in hashes.items():
+        candidates = set()
+        for frame, value in frames.items():
+            candidates.update(indexes[frame].candidates(value))
+        for candidate in candidates:
+            if candidate <= media_id:
+                continue
+            distance = media_distance(frames, hashes[candidate])
+            if distance is not None and distance <= max_distance:
+                edges[(media_id, candidate)] = distance
+                parent[find(candidate)] = find(media_id)
+
+    groups = defaultdict(lambda: {'media_ids': set(), 'max_distance': 0})
+    for (a, b), distance in edges.items():
+        group = groups[find(a)]
+        group['media_ids'].update((a, b))
+        group['max_distance'] = max(group['max_distance'], distance)
+    result = [
+        {'media_ids': sorted(group['media_ids']), 'max_distance': group['max_distance']}
+        for group in groups.values()
+    ]
+    result.sort(key=lambda group: len(group['media_ids']), reverse=True)
+    return result
+
+def file_paths(conn, media_ids):
+    """:return: {media_id: file_path}"""
+    return dict(catalog_shards.select_by_media_ids(conn, 'media_data', "file_path", media_ids))
+
+def main():
+    parser = argparse.ArgumentParser(description="计算感知哈希，查找重新编码/缩放过的近似重复文件")
+    parser.add_argument('--db', dest='db_path', default=DATABASE_PATH, help="数据库文件路径")
+    parser.add_argument('--workers', type=int, default=PHASH_WORKERS, help="并行计算的数量")
+    parser.add_argument('--batch-size', type=int, default=PHASH_BATCH_SIZE,
+                        help="每个事务提交的记录数")
+    parser.add_argument('--find', action='store_true', help="列出所有近似重复的文件组（不计算新的哈希）")
+    parser.add_argument('--similar', metavar='PATH', default=None, help="列出与该文件近似的文件")
+    parser.add_argument('--max-distance', type=int, default=DEFAULT_MAX_DISTANCE,
+                        help=f"判定为近似的最大汉明距离（0~{MAX_DISTANCE}）")
+    parser.add_argument('--report', default=None, help="--find 时把文件组写入该JSON文件")
+    args = parser.parse_args()
+    if not 0 <= args.max_distance <= MAX_DISTANCE:
+        parser.error(f"--max-distance 应在0~{MAX_DISTANCE}之间")
+
+    if not args.find and not args.similar:
+        stats = hash_catalog(args.db_path, workers=args.workers, batch_size=args.batch_size)
+        print(f"感知哈希计算完成：成功 {stats['hashed']}，失败 {stats['failed']}")
+        return
+
+    conn = sqlite3.connect(args.db_path, timeout=30)
+    try:
+        catalog_schema.ensure_schema(conn)
+        if args.similar:
+            row = conn.execute("SELECT media_id FROM media_data WHERE file_path = ?",
+                               (args.similar,)).fetchone()
+            results = query_similar(conn, row[0], args.max_distance) if row else None
+            if results is None:
+                print(f"{args.similar} 不在数据库中或尚未计算感知哈希")
+                return
+            paths = file_paths(conn, [media_id for media_id, _ in results])
+            for media_id, distance in results:
+                print(f"{distance:5.1f}  {paths[media_id]}")
+            print(f"共 {len(results)} 个近似文件")
+            return
+
+        groups = find_similar_groups(conn, args.max_distance)
+        all_paths = file_paths(conn, {media_id for group in groups for media_id in group['media_ids']})
+        report = []
+        for group in groups:
+            paths = [all_paths[media_id] for media_id in group['media_ids'] if media_id in all_paths]
+            print(f"\n距离 <= {group['max_distance']:.1f}")
+            for path in paths:
+                print(f"- {path}")
+            report.append({'paths': paths, 'max_distance': group['max_distance']})
+        print(f"\n共 {len(groups)} 组近似重复文件")
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump({'kind': 'perceptual', 'max_distance': args.max_distance, 'groups': report},
+                          f, ensure_ascii=False, indent=2)
+            print(f"报告已写入 {args.report}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+提取媒体文件的时长、分辨率、编码、码率和旋转方向，写入media_data
+
+视频通过ffprobe（ffmpeg-python）提取，图片通过Pillow读取尺寸和EXIF方向。
+每条记录同时写入提取时的文件大小和修改时间(probe_size/probe_mtime_ns)，
+文件未变化时不会重复提取；提取失败的文件也会记录，直到文件变化后才重试。
+
+用法:
+    python media_probe.py --db /Users/lee/sqlite3/media_player.db
+"""
+import argparse
+import concurrent.futures
+import sqlite3
+
+import catalog_schema
+
+try:
+    import ffmpeg
+except ImportError:
+    ffmpeg = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DATABASE_PATH = '/Users/lee/sqlite3/media_player.db'
+
+# ffprobe是外部进程，线程池即可并行；数量受磁盘随机读取能力限制，不宜过大
+PROBE_WORKERS = 4
+PROBE_BATCH_SIZE = 200
+PROBE_TIMEOUT = 30
+
+# EXIF Orientation(274) -> 顺时针旋转角度（镜像的情况按对应角度处理）
+EXIF_ORIENTATION_TAG = 274
+EXIF_ROTATION = {1: 0, 2: 0, 3: 180, 4: 180, 5: 90, 6: 90, 7: 270, 8: 270}
+
+def _to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def video_rotation(stream):
+    """从视频流信息中取旋转角度（旧版ffprobe在tags.rotate，新版在side_data的displaymatrix）"""
+    rotate = _to_int(stream.get('tags', {}).get('rotate'))
+    if rotate is not None:
+        return rotate % 360
+    for side_data in stream.get('side_data_list', []):
+        rotation = _to_int(side_data.get('rotation'))
+        if rotation is not None:
+            # displaymatrix的rotation为逆时针角度
+            return (-rotation) % 360
+    return 0
+
+def probe_video(file_path):
+    """
+    用ffprobe提取视频信息
+    :return: 媒体信息字典，无法提取时返回None
+    """
+    if ffmpeg is None:
+        return None
+    info = ffmpeg.probe(file_path, timeout=PROBE_TIMEOUT)
+    stream = next((s for s in info.get('streams', []) if s.get('codec_type') == 'video'), None)
+    if stream is None:
+        return None
+    fmt = info.get('format', {})
+    width, height = _to_int(stream.get('width')), _to_int(stream.get('height'))
+    orientation = video_rotation(stream)
+    if orientation in (90, 270):
+        width, height = height, width
+    return {
+        'duration': _to_float(fmt.get('duration')) or _to_float(stream.get('duration')),
+        'width': width,
+        'height': height,
+        'codec': stream.get('codec_name'),
+        'bitrate': _to_int(fmt.get('bit_rate')) or _to_int(stream.get('bit_rate')),
+        'orientation': orientation,
+    }
+
+def probe_image(file_path):
+    """
+    用Pillow读取图片尺寸、格式和EXIF方向（只读文件头，不解码像素）
+    :return: 媒体信息字典，无法提取时返回None
+    """
+    if Image is None:
+        return None
+    with Image.open(file_path) as img:
+        width, height = img.size
+        orientation = EXIF_ROTATION.get(img.getexif().get(EXIF_ORIENTATION_TAG), 0)
+        codec = img.format.lower() if img.format else None
+    if orientation in (90, 270):
+        width, height = height, width
+    return {
+        'duration': None,
+        'width': width,
+        'height': height,
+        'codec': codec,
+        'bitrate': None,
+        'orientation': orientation,
+    }
+
+def probe_file(file_path, media_kind):
+    """按媒体类别提取信息，出错时打印并返回None"""
+    try:
+        if media_kind == 'video':
+            return probe_video(file_path)
+        if media_kind == 'image':
+            return probe_image(file_path)
+    except Exception as e:
+        message = e.stderr.decode('utf8', 'replace').strip() if getattr(e, 'stderr', None) else e
+        print(f"提取媒体信息 {file_path} 时出错: {message}")
+    return None
+
+def available_kinds():
+    """当前环境能提取的媒体类别（未安装的依赖对应的类别不处理，安装后再提取）"""
+    kinds = []
+    if ffmpeg is not None:
+        kinds.append('video')
+    if Image is not None:
+        kinds.append('image')
+    return kinds
+
+UPDATE_PROBE_SQL = """
+UPDATE media_data
+SET duration = :duration, width = :width, height = :height, codec = :codec,
+    bitrate = :bitrate, orientation = :orientation,
+    probe_size = :file_size, probe_mtime_ns = :file_mtime_ns
+WHERE media_id = :media_id AND file_size IS :file_size AND file_mtime_ns IS :file_mtime_ns
+"""
+
+def probe_catalog(db_path, workers=PROBE_WORKERS, batch_size=PROBE_BATCH_SIZE):
+    """
+    为media_data中新增或变化（file_size/file_mtime_ns与上次提取时不同）的文件提取媒体信息
+    按media_id分批读取、并行提取、逐批提交，内存占用与库的大小无关
+    :return: 统计信息 {'probed', 'failed'}
+    """
+    stats = {'probed': 0, 'failed': 0}
+    kinds = available_kinds()
+    if not kinds:
+        print("未安装ffmpeg-python和Pillow，跳过媒体信息提取")
+        return stats
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        catalog_schema.ensure_schema(conn)
+        query = (
+            "SELECT media_id, file_path, media_kind, file_size, file_mtime_ns FROM media_data "
+            f"WHERE media_id > ? AND media_kind IN ({', '.join('?' * len(kinds))}) "
+            "AND (probe_size IS NOT file_size OR probe_mtime_ns IS NOT file_mtime_ns) "
+            "ORDER BY media_id LIMIT ?"
+        )
+        last_id = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                rows = conn.execute(query, [last_id] + kinds + [batch_size]).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1]['media_id']
+                results = executor.map(
+                    lambda row: probe_file(row['file_path'], row['media_kind']), rows
+                )
+                updates = []
+                for row, info in zip(rows, results):
+                    if info is None:
+                        stats['failed'] += 1
+                        info = dict.fromkeys(('duration', 'width', 'height', 'codec',
+                                              'bitrate', 'orientation'))
+                    else:
+                        stats['probed'] += 1
+                    info.update(media_id=row['media_id'], file_size=row['file_size'],
+                                file_mtime_ns=row['file_mtime_ns'])
+                    updates.append(info)
+                conn.executemany(UPDATE_PROBE_SQL, updates)
+                conn.commit()
+                print(f"已提取 {stats['probed']} 个文件的媒体信息，失败 {stats['failed']}...")
+    except sqlite3.Error as e:
+        print(f"数据库操作出错: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="提取媒体文件的时长、分辨率、编码等信息写入数据库")
+    parser.add_argument('--db', dest='db_path', default=DATABASE_PATH, help="数据库文件路径")
+    parser.add_argument('--workers', type=int, default=PROBE_WORKERS, help="并行提取的数量")
+    parser.add_argument('--batch-size', type=int, default=PROBE_BATCH_SIZE,
+                        help="每个事务提交的记录数")
+    args = parser.parse_args()
+    stats = probe_catalog(args.db_path, workers=args.workers, batch_size=args.batch_size)
+    print(f"提取完成：成功 {stats['probed']}，失败 {stats['failed']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+基于 os.scandir 的并行目录遍历
+
+多个线程从同一个目录队列中取目录执行scandir，发现的子目录放回队列，
+文件条目(os.DirEntry)以流的形式逐个产出。DirEntry自带文件类型信息，
+stat()结果也会缓存在条目上，调用方无需再对每个文件调用os.path.isfile/os.stat。
+
+用法:
+    for entry in walk_files(root_dir, suffixes=('.mp4', '.jpg')):
+        print(entry.path, entry.stat().st_size)
+
+    # 需要按目录处理（如记录哪些目录已完成）时
+    for dir_path, entries in walk_dirs(root_dir):
+        ...
+"""
+import os
+import queue
+import threading
+
+# 默认排除的目录和文件
+DEFAULT_EXCLUDE_DIRS = ('.git', '.svn', '.bundle')
+DEFAULT_EXCLUDE_FILES = ('.DS_Store',)
+# 遍历线程数：外置机械硬盘上目录读取以等待I/O为主，少量并发即可掩盖寻道延迟
+DEFAULT_WALK_WORKERS = 8
+
+_DONE = object()
+
+def _print_error(path, error):
+    print(f"无法读取目录 {path}: {error}")
+
+def walk_dirs(root_dir, workers=DEFAULT_WALK_WORKERS, suffixes=None, predicate=None,
+              skip_hidden=False, exclude_dirs=DEFAULT_EXCLUDE_DIRS,
+              exclude_files=DEFAULT_EXCLUDE_FILES, on_error=_print_error,
+              max_pending=10000, include_empty=True):
+    """
+    并行遍历目录树，按目录产出该目录下（不含子目录）符合条件的文件条目
+    无法读取的目录不会产出，因此产出即代表该目录的文件列表是完整的
+    :param root_dir: 根目录
+    :param workers: 并行执行scandir的线程数，为1时在当前线程中按深度优先顺序遍历
+    :param suffixes: 可选，只产出文件名（不区分大小写）以这些后缀结尾的文件
+    :param predicate: 可选，接收DirEntry返回bool的过滤函数
+    :param skip_hidden: 是否跳过以"."开头的文件和目录（默认不跳过，与os.walk一致）
+    :param exclude_dirs: 跳过的目录名
+    :param exclude_files: 跳过的文件名
+    :param on_error: 目录无法读取、或读取时predicate等抛出异常时的回调(path, error)，该目录不会产出
+    :param max_pending: 已发现但尚未被消费的文件条目上限，消费慢时遍历线程会等待
+    :param include_empty: 是否产出没有符合条件文件的目录
+    :return: (目录路径, [os.DirEntry]) 生成器（多线程时顺序不固定）
+    """
+    if suffixes is not None:
+        suffixes = tuple(suffix.lower() for suffix in suffixes)
+    exclude_dirs = frozenset(exclude_dirs or ())
+    exclude_files = frozenset(exclude_files or ())
+
+    def scan(path):
+        """读取一个目录，返回(子目录路径列表, 符合条件的文件条目列表)，目录无法读取时文件列表为None"""
+        subdirs, files = [], []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    name = entry.name
+                    if skip_hidden and name.startswith('.'):
+                        continue
+                    try:
+                        # 不跟随目录软链接，避免循环
+                        if entry.is_dir(follow_symlinks=False):
+                            if name not in exclude_dirs:
+                                subdirs.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if name in exclude_files:
+                        continue
+                    if suffixes is not None and not name.lower().endswith(suffixes):
+                        continue
+                    if predicate is not None and not predicate(entry):
+                        continue
+                    files.append(entry)
+        except OSError as e:
+            if on_error:
+                on_error(path, e)
+            return subdirs, None
+        return subdirs, files
+
+    def wanted(files):
+        return files is not None and (files or include_empty)
+
+    if workers <= 1:
+        stack = [root_dir]
+        while stack:
+            path = stack.pop()
+            subdirs, files = scan(path)
+            if wanted(files):
+                yield path, files
+            stack.extend(reversed(subdirs))
+        return
+
+    dir_queue = queue.Queue()
+    out_queue = queue.Queue(maxsize=max(1, max_pending // 64))
+    stop = threading.Event()
+    lock = threading.Lock()
+    pending_dirs = [1]  # 已入队但尚未扫描完的目录数
+
+    def put_output(item):
+        # 输出队列满时等待，期间响应提前结束
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def worker():
+        while not stop.is_set():
+            path = dir_queue.get()
+            if path is _DONE:
+                return
+            subdirs = []
+            try:
+                subdirs, files = scan(path)
+                for subdir in subdirs:
+                    dir_queue.put(subdir)
+                if wanted(files):
+                    put_output((path, files))
+            except Exception as e:
+                # predicate等调用方代码出错：该目录按无法读取处理，继续遍历其他目录
+                if on_error:
+                    on_error(path, e)
+            finally:
+                # 无论是否出错都要更新计数，否则消费者会一直等待
+                with lock:
+                    pending_dirs[0] += len(subdirs) - 1
+                    finished = pending_dirs[0] == 0
+                if finished:
+                    # 所有目录扫描完毕：通知消费者并让其他线程退出
+                    put_output(_DONE)
+                    for _ in range(workers):
+                        dir_queue.put(_DONE)
+            if finished:
+                return
+
+    dir_queue.put(root_dir)
+    threads = [
+        threading.Thread(target=worker, name=f"walker-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = out_queue.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        # 消费者提前结束（break/异常）时也要让遍历线程退出
+        stop.set()
+        for _ in range(workers):
+            dir_queue.put(_DONE)
+        for thread in threads:
+            thread.join()
+
+def walk_files(root_dir, **kwargs):
+    """
+    并行遍历目录树，逐个产出文件条目
+    参数见walk_dirs（include_empty除外）
+    :return: os.DirEntry生成器（多线程时顺序不固定）
+    """
+    for _, files in walk_dirs(root_dir, include_empty=False, **kwargs):
+        yield from files
+
+def walk_file_paths(root_dir, **kwargs):
+    """与walk_files相同，但只产出文件路径"""
+    for entry in walk_files(root_dir, **kwargs):
+        yield entry.path
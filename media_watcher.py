@@ -0,0 +1,271 @@
+"""
+文件系统变化监听
+
+Linux上通过inotify（ctypes调用libc，无需第三方库）监听整个目录树，
+其他平台或inotify不可用时退化为定期轮询（比较文件的大小、修改时间和inode）。
+监听器只负责产出"哪些路径可能变了"，是否需要写库由调用方判断。
+
+用法:
+    watcher = create_watcher(root_dir)
+    debouncer = Debouncer(delay=2.0)
+    while True:
+        debouncer.add(watcher.read_events(timeout=1.0))
+        for path, is_dir in debouncer.pop_ready():
+            ...
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+import media_walker
+
+# inotify事件掩码（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+# 文件写完(CLOSE_WRITE)、移入移出、创建删除都需要关注；不监听MODIFY，避免下载过程中的大量事件
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+DEFAULT_POLL_INTERVAL = 30.0
+DEFAULT_DEBOUNCE = 2.0
+
+class InotifyWatcher:
+    """
+    基于inotify的递归目录监听（inotify本身不递归，需要为每个子目录添加watch）
+    跳过的文件和目录与media_walker遍历时一致，监听到的路径与导入时写入的路径相同
+    :param root_dir: 根目录
+    :param predicate: 可选，接收文件路径返回bool，只上报需要关注的文件
+    :param skip_hidden: 是否跳过以"."开头的文件和目录，见media_walker.walk_dirs
+    :param exclude_dirs: 跳过的目录名
+    :param exclude_files: 跳过的文件名
+    """
+
+    def __init__(self, root_dir, predicate=None, skip_hidden=False,
+                 exclude_dirs=media_walker.DEFAULT_EXCLUDE_DIRS,
+                 exclude_files=media_walker.DEFAULT_EXCLUDE_FILES):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify仅在Linux上可用")
+        self.root_dir = os.path.abspath(root_dir)
+        self.predicate = predicate
+        self.skip_hidden = skip_hidden
+        self.exclude_dirs = frozenset(exclude_dirs or ())
+        self.exclude_files = frozenset(exclude_files or ())
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1失败: {os.strerror(errno)}")
+        self._paths = {}  # wd -> 目录路径
+        self._add_tree(self.root_dir, strict=True)
+
+    def _skipped(self, name, is_dir):
+        if self.skip_hidden and name.startswith('.'):
+            return True
+        return name in (self.exclude_dirs if is_dir else self.exclude_files)
+
+    def _add_watch(self, dir_path, strict=False):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            message = f"无法监听目录 {dir_path}: {os.strerror(errno)}"
+            if strict:
+                # 根目录都监听不了（或watch数量已达fs.inotify.max_user_watches上限）时交给调用方降级
+                raise OSError(errno, message)
+            print(message)
+            return
+        # 目录改名后重新添加会返回同一个wd，这里顺便更新路径
+        self._paths[wd] = dir_path
+
+    def _add_tree(self, dir_path, strict=False):
+        """为目录及其所有子目录添加watch"""
+        self._add_watch(dir_path, strict=strict)
+        stack = [dir_path]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False) and not self._skipped(entry.name, True):
+                            self._add_watch(entry.path, strict=strict)
+                            stack.append(entry.path)
+            except OSError as e:
+                if strict:
+                    raise
+                print(f"无法读取目录 {current}: {e}")
+
+    def fileno(self):
+        return self._fd
+
+    def read_events(self, timeout=None):
+        """
+        等待并读取一批事件
+        :param timeout: 最长等待秒数，None表示一直等待
+        :return: [(path, is_dir)]，is_dir为True表示整个目录需要重新比对
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self._fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，丢失了部分事件，只能整棵树重新比对
+                events.append((self.root_dir, True))
+                continue
+            if mask & IN_IGNORED:
+                self._paths.pop(wd, None)
+                continue
+            dir_path = self._paths.get(wd)
+            if dir_path is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # 目录本身被删除/移走，由父目录上的事件负责上报
+                continue
+            name = os.fsdecode(name)
+            if self._skipped(name, bool(mask & IN_ISDIR)):
+                continue
+            path = os.path.join(dir_path, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and os.path.isdir(path):
+                    self._add_tree(path)
+                events.append((path, True))
+            elif self.predicate is None or self.predicate(path):
+                events.append((path, False))
+        return events
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+class PollingWatcher:
+    """
+    轮询方式：每隔interval秒遍历一次目录树，比较文件(大小, 修改时间, inode)的快照
+    只有stat开销，不读取文件内容
+    :param root_dir: 根目录
+    :param predicate: 可选，接收文件路径返回bool，只比较需要关注的文件
+    :param interval: 轮询间隔（秒）
+    :param walk_options: 传给media_walker.walk_files的过滤参数（skip_hidden、exclude_dirs、exclude_files）
+    """
+
+    def __init__(self, root_dir, predicate=None, interval=DEFAULT_POLL_INTERVAL, **walk_options):
+        self.root_dir = os.path.abspath(root_dir)
+        self.predicate = predicate
+        self.interval = interval
+        self.walk_options = walk_options
+        self._snapshot = self._scan()
+        self._next_poll = time.monotonic() + interval
+
+    def _scan(self):
+        predicate = None
+        if self.predicate is not None:
+            predicate = lambda entry: self.predicate(entry.path)
+        snapshot = {}
+        for entry in media_walker.walk_files(self.root_dir, predicate=predicate, **self.walk_options):
+            try:
+                stat_info = entry.stat()
+            except OSError:
+                continue
+            snapshot[entry.path] = (stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ino)
+        return snapshot
+
+    def read_events(self, timeout=None):
+        """
+        等到下一次轮询时间（最多timeout秒），返回与上次快照相比变化的文件
+        :return: [(path, False)]
+        """
+        wait = self._next_poll - time.monotonic()
+        if timeout is not None and wait > timeout:
+            time.sleep(max(0, timeout))
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self._next_poll = time.monotonic() + self.interval
+
+        snapshot = self._scan()
+        previous = self._snapshot
+        self._snapshot = snapshot
+        events = [(path, False) for path, sig in snapshot.items() if previous.get(path) != sig]
+        events.extend((path, False) for path in previous.keys() - snapshot.keys())
+        return events
+
+    def close(self):
+        self._snapshot = {}
+
+def create_watcher(root_dir, predicate=None, poll_interval=DEFAULT_POLL_INTERVAL, force_polling=False,
+                   **walk_options):
+    """
+    优先使用inotify，不可用时退化为轮询
+    :param walk_options: 跳过哪些文件和目录（skip_hidden、exclude_dirs、exclude_files），两种方式规则相同
+    """
+    if not force_polling:
+        try:
+            return InotifyWatcher(root_dir, predicate=predicate, **walk_options)
+        except (OSError, AttributeError) as e:
+            print(f"inotify不可用（{e}），改用每 {poll_interval} 秒轮询一次")
+    return PollingWatcher(root_dir, predicate=predicate, interval=poll_interval, **walk_options)
+
+class Debouncer:
+    """
+    合并短时间内的连续事件：同一路径在delay秒内没有新事件才视为稳定
+    （下载中的文件、批量复制、改名产生的成对事件都会被合并到同一批处理）
+    :param delay: 稳定时间（秒）
+    :param max_delay: 持续有事件时，最多等待这么久就先处理已稳定的路径
+    """
+
+    def __init__(self, delay=DEFAULT_DEBOUNCE, max_delay=None):
+        self.delay = delay
+        self.max_delay = max_delay if max_delay is not None else delay * 10
+        self._pending = {}  # path -> (is_dir, 最后一次事件时间)
+        self._batch_started = None
+
+    def add(self, events):
+        now = time.monotonic()
+        for path, is_dir in events:
+            previous = self._pending.get(path)
+            self._pending[path] = ((previous[0] if previous else False) or is_dir, now)
+            if self._batch_started is None:
+                self._batch_started = now
+
+    def __len__(self):
+        return len(self._pending)
+
+    def pop_ready(self):
+        """
+        取出已稳定的路径
+        通常等所有路径都稳定后整体取出，保证改名产生的"移出+移入"落在同一批；
+        持续有事件超过max_delay时先取出其中已稳定的部分
+        :return: [(path, is_dir)]
+        """
+        if not self._pending:
+            return []
+        now = time.monotonic()
+        quiet = [path for path, (_, last) in self._pending.items() if now - last >= self.delay]
+        if len(quiet) < len(self._pending) and now - self._batch_started < self.max_delay:
+            return []
+        ready = [(path, self._pending.pop(path)[0]) for path in quiet]
+        self._batch_started = now if self._pending else None
+        return ready
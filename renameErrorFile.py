@@ -1,4 +1,5 @@
 import os
+import media_walker
 
 def fix_double_mp4_extension(root_dir):
     """
@@ -7,34 +8,31 @@ def fix_double_mp4_extension(root_dir):
     # 统计修复的文件数量
     fixed_count = 0
     
-    # 递归遍历目录
-    for dirpath, _, filenames in os.walk(root_dir):
-        for filename in filenames:
-            # 检查文件名是否以.mp4.mp4结尾且是文件（不是目录）
-            if filename.endswith('.mp4.mp4'):
-                # 构建完整路径
-                old_path = os.path.join(dirpath, filename)
-                
-                # 确保是文件（不是目录）
-                if not os.path.isfile(old_path):
-                    continue
-                
-                # 生成新文件名（去掉最后一个.mp4）
-                new_filename = filename[:-4]  # 从末尾移除4个字符（即".mp4"）
-                new_path = os.path.join(dirpath, new_filename)
-                
-                # 检查新路径是否已存在
-                if os.path.exists(new_path):
-                    print(f"跳过：新路径已存在 - {new_path}")
-                    continue
-                
-                # 执行重命名
-                try:
-                    os.rename(old_path, new_path)
-                    print(f"已修复：{old_path} → {new_path}")
-                    fixed_count += 1
-                except Exception as e:
-                    print(f"重命名失败 {old_path}：{str(e)}")
+    # 递归遍历目录（walk_files只产出文件，不需要再判断是否为目录）
+    # 先收集完再重命名，避免遍历过程中目录内容变化
+    entries = list(media_walker.walk_files(
+        root_dir, predicate=lambda entry: entry.name.endswith('.mp4.mp4')
+    ))
+    for entry in entries:
+        # 构建完整路径
+        old_path = entry.path
+        
+        # 生成新文件名（去掉最后一个.mp4）
+        new_filename = entry.name[:-4]  # 从末尾移除4个字符（即".mp4"）
+        new_path = os.path.join(os.path.dirname(old_path), new_filename)
+        
+        # 检查新路径是否已存在
+        if os.path.exists(new_path):
+            print(f"跳过：新路径已存在 - {new_path}")
+            continue
+        
+        # 执行重命名
+        try:
+            os.rename(old_path, new_path)
+            print(f"已修复：{old_path} → {new_path}")
+            fixed_count += 1
+        except Exception as e:
+            print(f"重命名失败 {old_path}：{str(e)}")
     
     print(f"\n处理完成，共修复 {fixed_count} 个文件")
 
@@ -0,0 +1,120 @@
+"""
+文件流接口的回归测试：Range解析（后缀范围、合并、不可满足、无效格式）、If-Range强比较、多段响应的Content-Length
+
+运行: python -m pytest -q test_app_stream.py
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from werkzeug.http import http_date
+
+import app as media_app
+
+class StreamFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.content = bytes(range(256)) * 4   # 1024字节
+        self.path = os.path.join(self.tmp, 'clip.mp4')
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        self.target_folder = media_app.app.config['TARGET_FOLDER']
+        media_app.app.config['TARGET_FOLDER'] = self.tmp
+        self.client = media_app.app.test_client()
+
+    def tearDown(self):
+        media_app.app.config['TARGET_FOLDER'] = self.target_folder
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def get(self, path=None, **headers):
+        return self.client.get('/api/stream', query_string={'path': path or self.path}, headers=headers)
+
+    def assert_partial(self, response, start, end):
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], f"bytes {start}-{end}/{len(self.content)}")
+        self.assertEqual(response.headers['Content-Length'], str(end - start + 1))
+        self.assertEqual(response.data, self.content[start:end + 1])
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(response.headers['Content-Length'], str(len(self.content)))
+        self.assertEqual(response.data, self.content)
+
+    def test_single_ranges(self):
+        self.assert_partial(self.get(Range='bytes=0-99'), 0, 99)
+        self.assert_partial(self.get(Range='bytes=1000-'), 1000, 1023)
+        # 结束位置超出文件大小时截断到文件末尾
+        self.assert_partial(self.get(Range='bytes=1000-5000'), 1000, 1023)
+
+    def test_suffix_ranges(self):
+        self.assert_partial(self.get(Range='bytes=-100'), 924, 1023)
+        # 后缀长度超过文件大小时返回整个文件
+        self.assert_partial(self.get(Range='bytes=-5000'), 0, 1023)
+
+    def test_unsatisfiable_range(self):
+        for range_header in ('bytes=1024-', 'bytes=2000-3000', 'bytes=-0'):
+            response = self.get(Range=range_header)
+            self.assertEqual(response.status_code, 416, range_header)
+            self.assertEqual(response.headers['Content-Range'], f"bytes */{len(self.content)}")
+
+    def test_overlapping_ranges_are_merged(self):
+        self.assert_partial(self.get(Range='bytes=50-149,0-99,150-199'), 0, 199)
+        # 可满足的段与不可满足的段同时出现时只返回可满足的部分
+        self.assert_partial(self.get(Range='bytes=0-9,5000-6000'), 0, 9)
+
+    def test_invalid_ranges_return_whole_file(self):
+        for range_header in ('bytes=abc', 'items=0-10', 'bytes=10-5', 'bytes=', 'bytes=1-2-3',
+                             'bytes=' + ','.join(f'{i * 10}-{i * 10 + 1}' for i in range(100))):
+            response = self.get(Range=range_header)
+            self.assertEqual(response.status_code, 200, range_header)
+            self.assertEqual(response.data, self.content)
+
+    def test_multipart_ranges(self):
+        response = self.get(Range='bytes=0-9,100-109,-5')
+        self.assertEqual(response.status_code, 206)
+        content_type = response.headers['Content-Type']
+        self.assertTrue(content_type.startswith('multipart/byteranges; boundary='))
+        boundary = content_type.split('boundary=', 1)[1]
+        body = response.data
+        self.assertEqual(response.headers['Content-Length'], str(len(body)))
+
+        parts = body.split(f"--{boundary}".encode())
+        self.assertEqual(parts[-1].strip(), b'--')
+        expected = [(0, 9), (100, 109), (1019, 1023)]
+        self.assertEqual(len(parts[1:-1]), len(expected))
+        for part, (start, end) in zip(parts[1:-1], expected):
+            head, _, data = part.partition(b'\r\n\r\n')
+            self.assertIn(f"Content-Range: bytes {start}-{end}/1024".encode(), head)
+            self.assertEqual(data[:end - start + 1], self.content[start:end + 1])
+
+    def test_if_range_uses_strong_comparison(self):
+        etag = self.get().headers['ETag']
+        self.assert_partial(self.get(Range='bytes=0-9', **{'If-Range': etag}), 0, 9)
+        for if_range in (f'W/{etag}', '"stale"'):
+            response = self.get(Range='bytes=0-9', **{'If-Range': if_range})
+            self.assertEqual(response.status_code, 200, if_range)
+            self.assertEqual(response.data, self.content)
+
+    def test_if_range_date(self):
+        mtime = os.stat(self.path).st_mtime
+        self.assert_partial(self.get(Range='bytes=0-9', **{'If-Range': http_date(mtime)}), 0, 9)
+        response = self.get(Range='bytes=0-9', **{'If-Range': http_date(mtime - 60)})
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_requests(self):
+        first = self.get()
+        self.assertEqual(self.get(**{'If-None-Match': first.headers['ETag']}).status_code, 304)
+        self.assertEqual(self.get(**{'If-None-Match': '"stale"'}).status_code, 200)
+        self.assertEqual(self.get(**{'If-Modified-Since': first.headers['Last-Modified']}).status_code, 304)
+
+    def test_rejected_paths(self):
+        self.assertEqual(self.client.get('/api/stream').status_code, 400)
+        self.assertEqual(self.get(os.path.join(self.tmp, 'missing.mp4')).status_code, 404)
+        self.assertEqual(self.get(os.path.join(self.tmp, '..', 'outside.mp4')).status_code, 403)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+处理重复文件的回归测试：预演不修改文件，删除/硬链接后文件和目录数据库一致，近似文件只删除与保留文件相近的
+
+运行: python -m pytest -q test_duplicate_resolver.py
+"""
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import catalog_schema
+import duplicate_resolver as resolver
+import media_phash
+
+class ResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp, 'catalog.db')
+        self.content = os.urandom(4096)
+        self.original = self.write('keep/original.mp4', self.content, mtime=1_000_000_000)
+        self.copies = [self.write(f'copies/copy{i}.mp4', self.content) for i in range(2)]
+        self.other = self.write('copies/other.mp4', os.urandom(4096))
+        conn = sqlite3.connect(self.db_path)
+        try:
+            catalog_schema.ensure_schema(conn)
+            for path in [self.original, self.other] + self.copies:
+                self.insert_row(conn, path)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, name, data, mtime=None):
+        path = os.path.join(self.tmp, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def insert_row(self, conn, path):
+        stat_info = os.stat(path)
+        conn.execute(
+            "INSERT INTO media_data (file_name, file_path, file_type, file_size, file_mtime_ns, file_inode, "
+            "phash_size, phash_mtime_ns) VALUES (?, ?, 'video/mp4', ?, ?, ?, ?, ?)",
+            (os.path.basename(path), path, stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ino,
+             stat_info.st_size, stat_info.st_mtime_ns)
+        )
+
+    def catalog_rows(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return {row[0]: row[1:] for row in conn.execute(
+                "SELECT file_path, file_inode, file_mtime_ns FROM media_data"
+            )}
+        finally:
+            conn.close()
+
+    def exact_report(self):
+        report_path = os.path.join(self.tmp, 'duplicates.json')
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({'algorithm': 'md5', 'groups': [{
+                'digest': hashlib.md5(self.content).hexdigest(),
+                'size': len(self.content),
+                'paths': self.copies + [self.original],
+            }]}, f)
+        return report_path
+
+    def run_main(self, *argv):
+        output = io.StringIO()
+        with mock.patch('sys.argv', ['duplicate_resolver.py', *argv, '--db', self.db_path, '--no-hash-cache']), \
+                contextlib.redirect_stdout(output):
+            resolver.main()
+        return output.getvalue()
+
+    def test_dry_run_reports_bytes_without_touching_files(self):
+        rows = self.catalog_rows()
+        output = self.run_main(self.exact_report(), '--keep', 'oldest', '--dry-run')
+        self.assertIn(f"可释放 {resolver.format_bytes(2 * len(self.content))}", output)
+        for path in self.copies:
+            self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.catalog_rows(), rows)
+
+    def test_delete_removes_files_and_rows(self):
+        self.run_main(self.exact_report(), '--keep', 'oldest', '--action', 'delete')
+        self.assertTrue(os.path.exists(self.original))
+        for path in self.copies:
+            self.assertFalse(os.path.exists(path))
+        self.assertEqual(set(self.catalog_rows()), {self.original, self.other})
+
+    def test_hardlink_replaces_files_and_updates_rows(self):
+        self.run_main(self.exact_report(), '--keep', 'oldest', '--action', 'hardlink')
+        original = os.stat(self.original)
+        rows = self.catalog_rows()
+        for path in self.copies:
+            self.assertTrue(os.path.samefile(path, self.original))
+            self.assertEqual(rows[path], (original.st_ino, original.st_mtime_ns))
+        self.assertEqual(original.st_nlink, 3)
+
+    def test_changed_copy_is_skipped(self):
+        report_path = self.exact_report()
+        with open(self.copies[0], 'ab') as f:
+            f.write(b'changed')
+        self.run_main(report_path, '--keep', 'oldest', '--action', 'delete')
+        self.assertTrue(os.path.exists(self.copies[0]))
+        self.assertIn(self.copies[0], self.catalog_rows())
+        self.assertFalse(os.path.exists(self.copies[1]))
+
+    def test_perceptual_group_only_deletes_files_close_to_kept_one(self):
+        # 链式分组：original~copy0（距离3）、copy0~other（距离3），original与other距离6
+        hashes = {self.original: 0, self.copies[0]: 0b111, self.other: 0b111111}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for path, value in hashes.items():
+                media_id = conn.execute("SELECT media_id FROM media_data WHERE file_path = ?",
+                                        (path,)).fetchone()[0]
+                conn.executemany(media_phash.INSERT_PHASH_SQL,
+                                 media_phash.phash_rows(media_id, [(0, value, 0)]))
+            conn.commit()
+        finally:
+            conn.close()
+        report_path = os.path.join(self.tmp, 'similar.json')
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({'kind': 'perceptual', 'max_distance': 5, 'groups': [
+                {'paths': list(hashes), 'max_distance': 3}
+            ]}, f)
+
+        self.run_main(report_path, '--keep', 'oldest', '--action', 'delete')
+        self.assertTrue(os.path.exists(self.original))
+        self.assertFalse(os.path.exists(self.copies[0]))
+        self.assertTrue(os.path.exists(self.other))
+        self.assertIn(self.other, self.catalog_rows())
+
+if __name__ == '__main__':
+    unittest.main()
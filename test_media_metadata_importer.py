@@ -0,0 +1,163 @@
+"""
+增量导入的回归测试：根目录不存在、相对路径、目录无法读取时都不能删除已有记录
+
+运行: python -m pytest -q test_media_metadata_importer.py
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import hash_engine
+import media_metadata_importer as importer
+
+class IncrementalScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, 'volume')
+        self.db_path = os.path.join(self.tmp, 'catalog.db')
+        os.makedirs(os.path.join(self.root, 'a'))
+        os.makedirs(os.path.join(self.root, 'b'))
+        for name in ('a/one.mp4', 'b/two.jpg'):
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(os.urandom(2048))
+        # 不使用共享哈希缓存，避免写入用户目录
+        self.engine = importer.HASH_ENGINE
+        importer.HASH_ENGINE = hash_engine.HashEngine(
+            algorithm=importer.HASH_ALGORITHM,
+            max_bytes=importer.HASH_BLOCK_SIZE * importer.HASH_MAX_BLOCKS
+        )
+        stats = self.scan(self.root)
+        self.assertEqual(stats['added'], 2)
+
+    def tearDown(self):
+        importer.HASH_ENGINE.close()
+        importer.HASH_ENGINE = self.engine
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def scan(self, root_dir):
+        return importer.incremental_scan(root_dir, self.db_path, workers=2, table='media_data')
+
+    def rows(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return dict(conn.execute("SELECT file_path, media_id FROM media_data"))
+        finally:
+            conn.close()
+
+    def test_missing_root_keeps_rows(self):
+        before = self.rows()
+        shutil.move(self.root, self.root + '.unplugged')
+        with self.assertRaises(NotADirectoryError):
+            self.scan(self.root)
+        self.assertEqual(self.rows(), before)
+
+    def test_relative_root_matches_absolute_rows(self):
+        before = self.rows()
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            stats = self.scan('volume')
+        finally:
+            os.chdir(cwd)
+        self.assertEqual((stats['added'], stats['removed'], stats['skipped']), (0, 0, 2))
+        # media_id不变，poster_path等关联不会丢失
+        self.assertEqual(self.rows(), before)
+
+    def test_unreadable_directory_keeps_rows(self):
+        before = self.rows()
+        unreadable = os.path.join(self.root, 'b')
+        scandir = os.scandir
+
+        def failing_scandir(path):
+            if path == unreadable:
+                raise PermissionError(13, 'Permission denied', path)
+            return scandir(path)
+
+        with mock.patch('media_walker.os.scandir', side_effect=failing_scandir):
+            stats = self.scan(self.root)
+        self.assertEqual(stats['removed'], 0)
+        self.assertEqual(self.rows(), before)
+
+        # 文件确实被删除时仍然删除记录
+        os.remove(os.path.join(self.root, 'a', 'one.mp4'))
+        stats = self.scan(self.root)
+        self.assertEqual(stats['removed'], 1)
+        self.assertEqual(set(self.rows()), {os.path.join(self.root, 'b', 'two.jpg')})
+
+class FullImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, 'volume')
+        self.db_path = os.path.join(self.tmp, 'catalog.db')
+        for name in ('a/one.mp4', 'b/two.jpg'):
+            os.makedirs(os.path.dirname(os.path.join(self.root, name)), exist_ok=True)
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(os.urandom(2048))
+        self.engine = importer.HASH_ENGINE
+        importer.HASH_ENGINE = hash_engine.HashEngine(
+            algorithm=importer.HASH_ALGORITHM,
+            max_bytes=importer.HASH_BLOCK_SIZE * importer.HASH_MAX_BLOCKS
+        )
+
+    def tearDown(self):
+        importer.HASH_ENGINE.close()
+        importer.HASH_ENGINE = self.engine
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_vanished_file_is_counted_as_failed(self):
+        vanished = os.path.join(self.root, 'b', 'two.jpg')
+        stat_entry = importer.stat_entry
+
+        def failing_stat(entry):
+            if entry.path == vanished:
+                raise FileNotFoundError(2, 'No such file or directory', entry.path)
+            return stat_entry(entry)
+
+        with mock.patch.object(importer, 'stat_entry', side_effect=failing_stat):
+            stats = importer.scan_media_files(self.root, self.db_path, workers=2, table='media_data')
+        self.assertEqual((stats['written'], stats['failed']), (1, 1))
+
+        # 出错的目录不记为完成，--resume 时会重新处理
+        conn = sqlite3.connect(self.db_path)
+        try:
+            finished = {row[0] for row in conn.execute(
+                f"SELECT dir_path FROM {importer.CHECKPOINT_TABLE}"
+            )}
+        finally:
+            conn.close()
+        self.assertIn(os.path.join(self.root, 'a'), finished)
+        self.assertNotIn(os.path.join(self.root, 'b'), finished)
+
+    def test_unreadable_directory_keeps_checkpoint(self):
+        unreadable = os.path.join(self.root, 'b')
+        scandir = os.scandir
+
+        def failing_scandir(path):
+            if path == unreadable:
+                raise OSError(5, 'Input/output error', path)
+            return scandir(path)
+
+        with mock.patch('media_walker.os.scandir', side_effect=failing_scandir):
+            stats = importer.scan_media_files(self.root, self.db_path, workers=2, table='media_data')
+        self.assertEqual((stats['written'], stats['failed']), (1, 1))
+        self.assertEqual(self.checkpointed_dirs(), {self.root, os.path.join(self.root, 'a')})
+
+        # 目录恢复后续传，只导入之前未读取的目录，完成后清除进度
+        stats = importer.scan_media_files(self.root, self.db_path, workers=2, table='media_data', resume=True)
+        self.assertEqual((stats['written'], stats['failed'], stats['resumed_dirs']), (1, 0, 2))
+        self.assertEqual(self.checkpointed_dirs(), set())
+
+    def checkpointed_dirs(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return {row[0] for row in conn.execute(f"SELECT dir_path FROM {importer.CHECKPOINT_TABLE}")}
+        finally:
+            conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+感知哈希查找的回归测试：有符号/无符号转换、分段索引（SQL候选查询和内存HammingIndex）不漏掉距离不超过阈值的文件对、
+连通分组
+
+运行: python -m pytest -q test_media_phash.py
+"""
+import random
+import sqlite3
+import unittest
+
+import catalog_schema
+import media_phash
+
+MAX_DISTANCE = media_phash.DEFAULT_MAX_DISTANCE
+
+def flip(value, positions):
+    for position in positions:
+        value ^= 1 << position
+    return value
+
+def spread_positions(count, offset=0):
+    """依次落在不同段上的位，距离相同时这种分布下各段的距离最平均，最容易漏掉"""
+    bits = catalog_schema.PHASH_BAND_BITS
+    return [(i % catalog_schema.PHASH_BANDS) * bits + (i // catalog_schema.PHASH_BANDS + offset) % bits
+            for i in range(count)]
+
+class PhashIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(7)
+        bases = [rng.getrandbits(64) for _ in range(6)] + [0, media_phash.HASH_MASK, 1 << 63]
+        self.hashes = []
+        for base in bases:
+            self.hashes.append(base)
+            for distance in range(1, MAX_DISTANCE + 3):
+                self.hashes.append(flip(base, spread_positions(distance, rng.randrange(16))))
+                self.hashes.append(flip(base, rng.sample(range(64), distance)))
+        self.hashes = list(dict.fromkeys(self.hashes))
+        self.conn = sqlite3.connect(':memory:')
+        catalog_schema.ensure_schema(self.conn)
+        self.ids = {}
+        for value in self.hashes:
+            media_id = self.conn.execute(
+                "INSERT INTO media_data (file_name, file_path, file_type) VALUES (?, ?, 'image/jpeg')",
+                (f'{value:x}.jpg', f'/x/{value:x}.jpg')
+            ).lastrowid
+            self.ids[media_id] = value
+            self.conn.executemany(media_phash.INSERT_PHASH_SQL,
+                                  media_phash.phash_rows(media_id, [(media_phash.IMAGE_FRAME, value, 0)]))
+
+    def tearDown(self):
+        self.conn.close()
+
+    def close_pairs(self, max_distance=MAX_DISTANCE):
+        return {(a, b) for a in self.ids for b in self.ids
+                if a != b and media_phash.hamming(self.ids[a], self.ids[b]) <= max_distance}
+
+    def test_signed_round_trip(self):
+        for value in (0, 1, (1 << 63) - 1, 1 << 63, media_phash.HASH_MASK):
+            signed = media_phash.to_signed(value)
+            self.assertTrue(-(1 << 63) <= signed < 1 << 63)
+            self.assertEqual(media_phash.to_unsigned(signed), value)
+            # 分段取值与有符号/无符号形式无关
+            self.assertEqual(media_phash.hash_bands(signed), media_phash.hash_bands(value))
+        stored = {media_id: media_phash.to_unsigned(value)
+                  for media_id, value in self.conn.execute("SELECT media_id, phash FROM media_phash")}
+        self.assertEqual(stored, self.ids)
+
+    def test_band_radius_pigeonhole(self):
+        self.assertEqual(media_phash.band_radius(MAX_DISTANCE), MAX_DISTANCE // catalog_schema.PHASH_BANDS)
+        for a, b in self.close_pairs():
+            band_distances = [bin(x ^ y).count('1') for x, y in
+                              zip(media_phash.hash_bands(self.ids[a]), media_phash.hash_bands(self.ids[b]))]
+            self.assertLessEqual(min(band_distances), media_phash.band_radius(MAX_DISTANCE))
+
+    def test_sql_candidates_cover_close_pairs(self):
+        pairs = self.close_pairs()
+        self.assertTrue(pairs)
+        for a, b in pairs:
+            query, params = media_phash.similar_candidates_query(media_phash.IMAGE_FRAME, self.ids[a],
+                                                                 MAX_DISTANCE)
+            self.assertIn(b, {row[0] for row in self.conn.execute(query, params)})
+
+    def test_hamming_index_covers_close_pairs(self):
+        pairs = self.close_pairs()
+        # 预计记录数不同时段数不同（包括64位不能整除的段数）
+        for size in (len(self.ids), 10 ** 5, 10 ** 9):
+            index = media_phash.HammingIndex(MAX_DISTANCE, size)
+            for media_id, value in self.ids.items():
+                index.add(media_id, value)
+            for a, b in pairs:
+                self.assertIn(b, index.candidates(self.ids[a]), f"size={size}")
+
+    def test_query_similar_is_exact(self):
+        pairs = self.close_pairs()
+        for media_id, value in self.ids.items():
+            expected = sorted((other, float(media_phash.hamming(value, self.ids[other])))
+                              for a, other in pairs if a == media_id)
+            results = media_phash.query_similar(self.conn, media_id, MAX_DISTANCE)
+            self.assertEqual(sorted(results), expected)
+
+    def test_groups_are_connected_components(self):
+        pairs = self.close_pairs()
+        parent = {media_id: media_id for media_id in self.ids}
+
+        def find(item):
+            while parent[item] != item:
+                item = parent[item]
+            return item
+
+        for a, b in pairs:
+            parent[find(a)] = find(b)
+        components = {}
+        for a, _ in pairs:
+            components.setdefault(find(a), set()).add(a)
+        expected = sorted(sorted(members) for members in components.values())
+
+        groups = media_phash.find_similar_groups(self.conn, MAX_DISTANCE)
+        self.assertEqual(sorted(group['media_ids'] for group in groups), expected)
+        for group in groups:
+            members = group['media_ids']
+            self.assertEqual(group['max_distance'], max(
+                media_phash.hamming(self.ids[a], self.ids[b]) for a in members for b in members
+                if (a, b) in pairs
+            ))
+
+    def test_media_distance_without_common_frames(self):
+        self.assertIsNone(media_phash.media_distance({1: 0}, {2: 0}))
+        self.assertEqual(media_phash.media_distance({1: 0, 2: 0b11}, {1: 0b1, 2: 0, 3: 0}), 1.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,10 @@
 import os
-import hashlib
-from collections import defaultdict
+import duplicate_finder
 
 def find_duplicate_files(folder_path):
     """
     遍历指定文件夹及其子文件夹，比较MD5查找重复文件
+    按 大小 -> 头尾采样哈希 -> 完整哈希 分阶段比较，只有大小相同的文件才会读取内容
 
     Args：
         folder_path(str): 需要便利的文件夹路径
@@ -16,28 +16,11 @@ def find_duplicate_files(folder_path):
         print(f"错误: '{folder_path}'不是一个有效的文件夹路径。")
         return {}
     
-    md5_map = defaultdict(list)
     print("正在扫描文件...")
-
-    for root, _, files in os.walk(folder_path):
-        for filename in files:
-            # 过滤掉 .DS_Store 和其他隐藏的系统文件
-            if filename == ".DS_Store":
-                continue
-
-            print(f"扫描到文件: {filename}")
-
-            file_path = os.path.join(root, filename)
-            #跳过软链接，防止无限循环
-            if not os.path.islink(file_path):
-                try:
-                    #计算MD5指
-                    with open(file_path, 'rb') as f:
-                        md5 = hashlib.md5(f.read()).hexdigest()
-                    md5_map[md5].append(file_path)
-                except Exception as e:
-                    print(f"无法处理文件{file_path}: {e}")
-    duplicate_files = {md5: paths for md5, paths in md5_map.items() if len(paths) > 1}
+    # 过滤掉 .DS_Store（media_walker默认排除），隐藏文件照常比较；软链接会被跳过，防止无限循环
+    duplicates, stats = duplicate_finder.find_duplicate_groups([folder_path], skip_hidden=False)
+    duplicate_finder.print_stats(stats)
+    duplicate_files = {group['digest']: group['paths'] for group in duplicates}
     return duplicate_files
 
 def print_duplicate_files(duplicates):